@@ -43,7 +43,7 @@ import codetests
 import report
 import statespace
 import utils
-import controlseq
+import controlseqview
 import simrun
 import extensions
 
@@ -125,7 +125,6 @@ class App:
 
     def run(self):
         try:
-            gtk.gdk.threads_init()
             self.window.show()
             gtk.main()
         finally:
@@ -196,7 +195,7 @@ class App:
             return
         if sequence.name is None:
             sequence.name = "Sequence"
-        if controlseq.sequence_dialog(sequence, self.window):
+        if controlseqview.sequence_dialog(sequence, self.window):
             self.project.add_sequence(sequence)
         self.edit_control_sequences()
 
@@ -360,7 +359,7 @@ class App:
     def edit_control_sequences(self):
         if self.window.switch_to_tab_by_key("sequences"):
             return
-        widget = controlseq.SequenceListWidget(self.project)
+        widget = controlseqview.SequenceListWidget(self.project)
         self.window.add_tab(Tab(
             "Sequences", widget, "sequences",
             mainmenu_groups=("project",), call_close=True))
@@ -457,8 +456,9 @@ class App:
         editor.jump_to_position(position)
 
     def run_simulated_program(self, name, directory, simconfig, valgrind):
-        def output(line, stream):
-            self.console_write_output(line)
+        def output(lines, stream):
+            for line in lines:
+                self.console_write_output(line)
             return True
 
         if valgrind:
@@ -617,11 +617,12 @@ class App:
                 if fail_callback:
                     fail_callback()
 
-        def on_line(line, stream):
-            self._process_error_line(line, None)
+        def on_lines(lines, stream):
+            for line in lines:
+                self._process_error_line(line, None)
             return True
 
-        p = process.Process(name, on_line, on_exit)
+        p = process.Process(name, on_lines, on_exit)
         p.cwd = directory
         p.start(args)
 
@@ -668,17 +669,17 @@ class App:
                 if fail_callback:
                     fail_callback()
 
-        def on_line(line, stream):
+        def on_lines(lines, stream):
             if debug:
-                self.console_write(line)
-            stdout.append(line)
+                self.console_write("".join(lines))
+            stdout.extend(lines)
             return True
         if not self.export_project(proj, build_config):
             return
 
 
         debug = self.settings.getboolean("main", "ptp-debug")
-        p = process.Process(paths.PTP_BIN, on_line, on_exit)
+        p = process.Process(paths.PTP_BIN, on_lines, on_exit)
         p.cwd = proj.get_directory()
 
         args = []
@@ -24,10 +24,13 @@ sys.path.append(paths.PTP_DIR)
 import loader
 import os
 import tracelog
+import tablewriter
 
-def export(filename, directory, trace, lib):
+def export(filename, directory, trace, lib, simrun=False):
     p = loader.load_project(filename)
-    if trace and lib:
+    if simrun:
+        target = "simrun"
+    elif trace and lib:
         target = "libtraced"
     elif trace:
         target = "traced"
@@ -46,6 +49,51 @@ def check_tracelog(filename):
     t = tracelog.TraceLog(filename)
     print t.get_runinstances_count()
 
+def export_tracelog(filename, output, format):
+    """ Streams all traced data into the output file ("-" = stdout) """
+    t = tracelog.TraceLog(filename)
+    if output == "-":
+        stream = sys.stdout
+    else:
+        stream = open(output, "wb")
+    try:
+        if format == "binary":
+            writer = tablewriter.BinaryWriter(stream)
+        else:
+            writer = tablewriter.CsvWriter(stream)
+        t.execute_all_events(t.create_export_runinstance(writer))
+        writer.flush()
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+def run_campaign(program, process_counts, parameters, output, processes):
+    """ Runs the campaign of simulated runs and writes the summary as CSV;
+        'parameters' are strings "name=value1,value2,..." """
+    import simcampaign # Only this command needs the process pool
+    parameters = [ (p.split("=", 1)[0], p.split("=", 1)[1].split(","))
+                   for p in parameters ]
+    configurations = simcampaign.create_configurations(
+        [ int(count) for count in process_counts.split(",") ], parameters)
+    table = simcampaign.run_campaign(
+        program,
+        configurations,
+        [ name for name, values in parameters ],
+        processes=processes)
+    if output == "-":
+        stream = sys.stdout
+    else:
+        stream = open(output, "wb")
+    try:
+        writer = tablewriter.CsvWriter(stream)
+        writer.start(table.columns)
+        for row in table:
+            writer.add_row(row)
+        writer.flush()
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
 def main():
     parser = argparse.ArgumentParser(description='Kaira gui command line controller')
     parser.add_argument('--export', metavar='filename', type=str)
@@ -53,9 +101,31 @@ def main():
     parser.add_argument("--trace", action='store_true')
     parser.add_argument('--tracelog', metavar='filename', type=str)
     parser.add_argument("--lib", action='store_true')
+    parser.add_argument("--simrun", action='store_true')
+    parser.add_argument('--export-tracelog', metavar='filename', type=str)
+    parser.add_argument('--tracelog-output', metavar='filename', type=str, default="-",
+                        help="Output file of --export-tracelog, '-' = stdout")
+    parser.add_argument('--format', choices=["csv", "binary"], default="csv")
+    parser.add_argument('--simrun-campaign', metavar='program', type=str)
+    parser.add_argument('--processes', metavar='counts', type=str, default="1",
+                        help="Comma separated numbers of processes")
+    parser.add_argument('--param', metavar='name=values', action='append', default=[],
+                        help="Comma separated values of a parameter")
+    parser.add_argument('--jobs', metavar='count', type=int,
+                        help="Number of runs in parallel")
+    parser.add_argument('--campaign-output', metavar='filename', type=str, default="-",
+                        help="Output file of --simrun-campaign, '-' = stdout")
     args = parser.parse_args()
     if args.export:
-        export(os.path.abspath(args.export), args.output, args.trace, args.lib)
+        export(os.path.abspath(args.export), args.output, args.trace, args.lib,
+               args.simrun)
+        return
+    if args.export_tracelog:
+        export_tracelog(args.export_tracelog, args.tracelog_output, args.format)
+        return
+    if args.simrun_campaign:
+        run_campaign(args.simrun_campaign, args.processes, args.param,
+                     args.campaign_output, args.jobs)
         return
     if args.tracelog:
         check_tracelog(args.tracelog)
@@ -76,12 +76,13 @@ class CodeTest(utils.EqMixin):
         def on_exit(code):
             app.console_write("Test '{0}' returned '{1}'.\n".format(self.name, code),
                               "success" if code == 0 else "error")
-        def on_line(line, stream):
-            app.console_write_output(line)
+        def on_lines(lines, stream):
+            for line in lines:
+                app.console_write_output(line)
             return True
 
         app.console_write("Test '{0}' started.\n".format(self.name), "success")
-        p = process.Process(self.get_executable_filename(), on_line, on_exit)
+        p = process.Process(self.get_executable_filename(), on_lines, on_exit)
         p.cwd = self.get_directory()
         p.start()
 
@@ -249,11 +249,15 @@ def load_csv(filename, app, settings):
         cols_description = zip(header, types)
 
         table = Table(cols_description, 100)
-        row = [None if value == '' else value for value in row]
-        table.add_row(row) # add the first loaded row with data
+        rows = [ row ] # the first loaded row with data
         for row in csvreader:
-            row = [None if value == '' else value for value in row]
-            table.add_row(row);
+            rows.append(row)
+            if len(rows) == Table.max_chunk_size:
+                table.add_rows([ [None if value == '' else value for value in row]
+                                 for row in rows ])
+                rows = []
+        table.add_rows([ [None if value == '' else value for value in row]
+                         for row in rows ])
         table.trim()
         return (table, settings)
 
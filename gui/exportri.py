@@ -18,16 +18,16 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import settingswindow
 from runinstance import RunInstance
 from table import  Table
-from gtk import RESPONSE_APPLY
 
 class ExportRunInstance(RunInstance):
 
     basic_header = ["Event", "Time", "Duration", "Process", "ID"]
 
-    def __init__(self, tracelog, transitions, place_functions, columns):
+    def __init__(self, tracelog, transitions, place_functions, columns, writer=None):
+        """ Rows are collected into a table, or they are written by
+            the writer (tablewriter.TableWriter) when it is given """
         RunInstance.__init__(self,
                              tracelog.project,
                              tracelog.process_count)
@@ -51,6 +51,7 @@ class ExportRunInstance(RunInstance):
         self.column_value = bool(place_functions)
         self.column_tokens = bool(self.traced_places)
 
+        self.writer = writer
         self.table = self._create_table()
 
         self.idles = [None] * self.process_count
@@ -93,6 +94,9 @@ class ExportRunInstance(RunInstance):
                 header.append(col_name)
                 types.append('<i4')
 
+        if self.writer is not None:
+            self.writer.start(zip(header, types))
+            return self.writer
         return Table(zip(header, types), 100)
 
     def add_row(self, event, time, duration, process, id, (col_name, value)):
@@ -191,6 +195,10 @@ def place_counter_name(place):
     return "C: {0}".format(place.get_name_or_id())
 
 def run_assistant(app, tracelog):
+    # GTK is imported only here, export itself can run without GUI
+    import settingswindow
+    from gtk import RESPONSE_APPLY
+
     assistant = settingswindow.BasicSettingAssistant(2,
                                                      "Export settings",
                                                      app.window)
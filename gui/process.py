@@ -17,129 +17,245 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import gtk
+import os
+import errno
+import struct
 import socket
+import collections
+import gobject
 from subprocess import Popen, PIPE, STDOUT
-from threading import Thread, Lock
 
 
-class ReadLineThread(Thread):
-    def __init__(self, stream):
-        Thread.__init__(self)
-        self.stream = stream
-        self.lock = Lock()
+class LineReader:
+    """ Reads lines from a file descriptor in the GLib main loop.
+
+        Data are read in large chunks when the descriptor is readable and
+        all complete lines of a chunk are dispatched by one call of 'on_lines',
+        so there are no reader threads and no locking of GTK. 'on_lines' gets
+        the deque of lines and the reader as a stream; its 'readline' pops
+        further lines from the same deque and blocks only when a line
+        is not read yet. Lines left in the deque are dropped after the call.
+
+        After 'read_frames' is called, the input is read as frames (the length
+        as 4 bytes in big endian and the data) and the data of each frame
+        is dispatched as one line. """
+
+    chunk_size = 65536
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.lines = collections.deque()
+        self.rest = ""
+        self.eof = False
         self.exit_flag = False
-        self.daemon = True
+        self.watch = None
+        self.framed = False
+        self.buffer = []
+        self.buffer_size = 0
+        self.frame_size = None
 
     def start(self):
-        Thread.start(self)
+        self.watch = gobject.io_add_watch(
+            self.fd, gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR, self._on_ready)
+        if self.lines or self.eof:
+            # Lines read ahead by 'readline' do not make the descriptor
+            # readable again, so they are dispatched from the main loop
+            gobject.idle_add(self._on_read_ahead)
+
+    def stop(self):
+        self.exit_flag = True
+        if self.watch is not None:
+            gobject.source_remove(self.watch)
+            self.watch = None
 
-    def run(self):
-        while True:
-            line = self.stream.readline()
-            if line == "":
-                self.on_exit()
-                return
-            with self.lock:
-                if self.exit_flag:
-                    return
-            if not self.on_line(line, self.stream):
-                return
+    def set_exit_flag(self):
+        self.stop()
+
+    def read_frames(self):
+        """ Switches to frames; it has to be called when there are no
+            lines read ahead (e.g. after the reply that confirms framing) """
+        self.framed = True
+        self.buffer = [ self.rest ]
+        self.buffer_size = len(self.rest)
+        self.rest = ""
+        self._split_frames()
 
     def readline(self):
-        return self.stream.readline()
+        while not self.lines and not self.eof:
+            self._read()
+        if self.lines:
+            return self.lines.popleft()
+        return ""
 
-    def safe_call(self, callback, *params):
-        if callback is None:
-            return
-        gtk.gdk.threads_enter()
+    def _read(self):
         try:
-            return callback(*params)
-        finally:
-            gtk.gdk.threads_leave()
+            data = os.read(self.fd, self.chunk_size)
+        except OSError, e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            data = ""
+        if not data:
+            self.eof = True
+            if self.rest:
+                self.lines.append(self.rest)
+                self.rest = ""
+            return
+        if self.framed:
+            self.buffer.append(data)
+            self.buffer_size += len(data)
+            self._split_frames()
+            return
+        lines = (self.rest + data).split("\n")
+        self.rest = lines.pop()
+        self.lines.extend(line + "\n" for line in lines)
 
-    def set_exit_flag(self):
-        with self.lock:
-            self.exit_flag = True
+    def _split_frames(self):
+        # Chunks are joined only when the whole frame is read
+        while True:
+            if self.frame_size is None:
+                if self.buffer_size < 4:
+                    return
+                data = "".join(self.buffer)
+                self.frame_size = struct.unpack(">I", data[:4])[0]
+                self.buffer = [ data[4:] ]
+                self.buffer_size -= 4
+            if self.buffer_size < self.frame_size:
+                return
+            data = "".join(self.buffer)
+            self.lines.append(data[:self.frame_size] + "\n")
+            self.buffer = [ data[self.frame_size:] ]
+            self.buffer_size -= self.frame_size
+            self.frame_size = None
+
+    def _on_ready(self, fd, condition):
+        self._read()
+        if self._dispatch():
+            return True
+        self.watch = None
+        return False
+
+    def _on_read_ahead(self):
+        if self.watch is not None and not self._dispatch():
+            self.stop()
+        return False
+
+    def _dispatch(self):
+        """ Dispatches read lines, returns False when reading is finished """
+        if self.lines and not self.exit_flag:
+            if not self.on_lines(self.lines, self):
+                self.stop()
+            self.lines.clear()
+        if self.exit_flag:
+            return False
+        if self.eof:
+            self.on_exit()
+            return False
+        return True
 
-class ProcessThread(ReadLineThread):
 
-    def __init__(self, process, line_callback, exit_callback):
-        ReadLineThread.__init__(self, process.stdout)
+class ProcessReader(LineReader):
+
+    def __init__(self, process, lines_callback, exit_callback):
+        LineReader.__init__(self, process.stdout.fileno())
         self.process = process
-        self.line_callback = line_callback
+        self.lines_callback = lines_callback
         self.exit_callback = exit_callback
 
     def on_exit(self):
-        self.process.wait()
-        return self.safe_call(self.exit_callback, self.process.returncode)
+        # The output is closed, but the process may still run for a while
+        if self.process.poll() is None:
+            gobject.timeout_add(50, self.on_exit)
+            return False
+        if self.exit_callback:
+            self.exit_callback(self.process.returncode)
+        return False
 
-    def on_line(self, line, stream):
-        return self.safe_call(self.line_callback, line, stream)
+    def on_lines(self, lines, stream):
+        if self.lines_callback:
+            return self.lines_callback(lines, stream)
 
 
-class ConnectionThread(ReadLineThread):
+class ConnectionReader(LineReader):
 
-    def __init__(self, host, port, line_callback, exit_callback, connect_callback):
-        ReadLineThread.__init__(self, None)
+    def __init__(self, host, port, lines_callback, exit_callback, connect_callback):
+        LineReader.__init__(self, None)
         self.host = host
         self.port = port
-        self.line_callback = line_callback
+        self.lines_callback = lines_callback
         self.exit_callback = exit_callback
         self.connect_callback = connect_callback
         self.sock = None
 
-    def run(self):
+    def start(self):
+        # Connecting does not block the main loop; the socket is switched
+        # to the blocking mode when it is connected
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.host, self.port))
-            self.stream = self.sock.makefile("r")
-            self.safe_call(self.connect_callback, self.stream)
-            ReadLineThread.run(self)
+            self.sock.setblocking(0)
+            code = self.sock.connect_ex((self.host, self.port))
+            if code not in (0, errno.EINPROGRESS):
+                raise socket.error(code, os.strerror(code))
         except socket.error, e:
             self.on_exit(str(e))
+            return
+        self.watch = gobject.io_add_watch(
+            self.sock.fileno(), gobject.IO_OUT | gobject.IO_HUP | gobject.IO_ERR,
+            self._on_connected)
+
+    def _on_connected(self, fd, condition):
+        self.watch = None
+        code = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code != 0:
+            self.on_exit(str(socket.error(code, os.strerror(code))))
+            return False
+        self.sock.setblocking(1)
+        self.fd = self.sock.fileno()
+        if self.connect_callback:
+            self.connect_callback(self)
+        if not self.exit_flag:
+            LineReader.start(self)
+        return False
 
     def on_exit(self, message = None):
-        if self.stream:
-            self.stream.close()
-        return self.safe_call(self.exit_callback, message)
+        if self.sock:
+            self.sock.close()
+        if self.exit_callback:
+            self.exit_callback(message)
 
-    def on_line(self, line, stream):
-        return self.safe_call(self.line_callback, line, stream)
+    def on_lines(self, lines, stream):
+        if self.lines_callback:
+            return self.lines_callback(lines, stream)
 
 
 class Process:
 
-    def __init__(self, filename, line_callback = None, exit_callback = None):
+    def __init__(self, filename, lines_callback = None, exit_callback = None):
         self.filename = filename
-        self.line_callback = line_callback
+        self.lines_callback = lines_callback
         self.exit_callback = exit_callback
         self.cwd = None
 
     def start(self, params = []):
         self._start_process(params)
         self.pipe_in = self.process.stdin
-        self._start_thread()
+        self.reader.start()
 
     def start_and_get_first_line(self, params = []):
         self._start_process(params)
         self.pipe_in = self.process.stdin
-        line = self.process.stdout.readline()
-        self._start_thread()
+        line = self.reader.readline()
+        self.reader.start()
         return line
 
     def _start_process(self, params):
         self.process = Popen([ self.filename ] + params, bufsize = 0, stdin = PIPE, stdout = PIPE, stderr = STDOUT, cwd = self.cwd)
-
-    def _start_thread(self):
-        self.thread = ProcessThread(self.process, self.line_callback, self.exit_callback)
-        self.thread.start()
+        self.reader = ProcessReader(self.process, self.lines_callback, self.exit_callback)
 
     def write(self, string):
         self.pipe_in.write(string)
 
     def shutdown(self, silent = True):
-        self.thread.set_exit_flag()
+        self.reader.set_exit_flag()
         if silent:
             try:
                 self.process.terminate()
@@ -150,36 +266,34 @@ class Process:
 
 class Connection:
 
-    def __init__(self, hostname, port, line_callback = None, exit_callback = None, connect_callback = None):
+    def __init__(self, hostname, port, lines_callback = None, exit_callback = None, connect_callback = None):
         self.hostname = hostname
         self.port = port
-        self.line_callback = line_callback
+        self.lines_callback = lines_callback
         self.exit_callback = exit_callback
         self.connect_callback = connect_callback
 
     def start(self):
-        self.thread = ConnectionThread(self.hostname, self.port, self.line_callback, self.exit_callback, self.connect_callback)
-        self.thread.start()
+        self.reader = ConnectionReader(self.hostname, self.port, self.lines_callback, self.exit_callback, self.connect_callback)
+        self.reader.start()
 
     def write(self, text):
-        self.thread.sock.send(text)
+        self.reader.sock.sendall(text)
 
 class CommandWrapper:
 
     def __init__(self, backend):
         self.backend = backend
-        self.callbacks = []
-        self.lock = Lock()
+        self.callbacks = collections.deque()
 
     def start(self, *params):
-        self.backend.line_callback = self._line_callback
+        self.backend.lines_callback = self._lines_callback
         self.backend.start(*params)
 
     def run_command(self, command, callback, lines=None):
 
         if callback:
-            with self.lock:
-                self.callbacks.append((callback, lines))
+            self.callbacks.append((callback, lines))
 
         if command is not None:
             self.backend.write(command + "\n")
@@ -209,18 +323,18 @@ class CommandWrapper:
         """ Read line from backned. !! You can use this only if you are in "callback" !! """
         return self.backend.readline()
 
-    def _line_callback(self, line, stream):
-        if line.startswith("ERROR:"):
-            print line
-            return False
+    def _lines_callback(self, lines, stream):
+        while lines:
+            line = lines.popleft()
+            if line.startswith("ERROR:"):
+                print line
+                return False
 
-        with self.lock:
             assert self.callbacks, line
-            cb, lines = self.callbacks[0]
-            del self.callbacks[0]
-        if lines is None:
-            cb(line)
-        else:
-            buffer = [ line ] + [ stream.readline() for i in xrange(lines - 1) ]
-            cb(buffer)
+            cb, count = self.callbacks.popleft()
+            if count is None:
+                cb(line)
+            else:
+                buffer = [ line ] + [ stream.readline() for i in xrange(count - 1) ]
+                cb(buffer)
         return True
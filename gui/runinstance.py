@@ -18,6 +18,7 @@
 #
 
 import utils
+import collections
 from copy import copy
 
 
@@ -40,10 +41,61 @@ class RunInstance:
         self.last_event = None # "fire" / "finished" / "receive" / None
         self.last_event_activity = None
         self.last_event_instance = None
+        self.last_event_process = None
         self.last_event_time = None
         self.packets = [ [] for i in xrange(self.process_count * self.process_count)]
         self.debt_receives = [[] for i in xrange(self.process_count * self.process_count)]
         self.missed_receives = 0
+        self.journal = None
+
+    def enable_undo(self, limit):
+        """ Starts recording of changes, so the last 'limit' steps
+            can be undone by undo_step """
+        self.journal = Journal(limit)
+        for net_instance in self.net_instances.values():
+            net_instance.journal = self.journal
+
+    def begin_step(self):
+        """ Marks the beginning of changes that are undone together """
+        self.journal.begin()
+        self.journal.record(self._restore_fields,
+                            (self.net,
+                             self.last_event,
+                             self.last_event_activity,
+                             self.last_event_instance,
+                             self.last_event_process,
+                             self.last_event_time,
+                             self.missed_receives))
+
+    def can_undo(self):
+        return self.journal is not None and len(self.journal) > 0
+
+    def undo_step(self):
+        self.journal.undo()
+
+    def _restore_fields(self, fields):
+        (self.net,
+         self.last_event,
+         self.last_event_activity,
+         self.last_event_instance,
+         self.last_event_process,
+         self.last_event_time,
+         self.missed_receives) = fields
+
+    def _set_activity(self, process_id, activity):
+        if self.journal is not None:
+            self.journal.record(self.activites.__setitem__,
+                                process_id,
+                                self.activites[process_id])
+        self.activites[process_id] = activity
+
+    def _set_activity_flag(self, activity, name):
+        if self.journal is not None:
+            if name in activity.__dict__:
+                self.journal.record(setattr, activity, name, getattr(activity, name))
+            else:
+                self.journal.record(delattr, activity, name)
+        setattr(activity, name, True)
 
     def add_token(self, place_id, token_pointer, token_value, send_time=None):
         self.last_event_instance.add_token(place_id, token_pointer, token_value, send_time)
@@ -59,7 +111,7 @@ class RunInstance:
         self.last_event_instance.add_enabled_transition(transition_id)
 
     def set_activity(self, process_id, activity):
-        self.activites[process_id] = activity
+        self._set_activity(process_id, activity)
         self.last_event_activity = activity
 
     def pre_event(self):
@@ -78,11 +130,24 @@ class RunInstance:
         self.last_event = "spawn"
         self.set_activity(process_id, None)
         instance = NetInstance(process_id)
+        instance.journal = self.journal
+        if self.journal is not None:
+            old = self.net_instances.get(process_id)
+            if old is None:
+                self.journal.record(self.net_instances.pop, process_id)
+            else:
+                self.journal.record(self.net_instances.__setitem__, process_id, old)
         self.net_instances[process_id] = instance
         self.last_event_instance = instance
         self.last_event_process = process_id
         self.last_event_time = time
 
+    def add_net_instance(self, net_id, net_instance):
+        """ Adds an instance without an event; the instance may be shared
+            with other run instances, so it is not modified later """
+        self.net = self.project.find_net(net_id)
+        self.net_instances[net_instance.process_id] = net_instance
+
     def event_quit(self, process_id, time):
         self.last_event = "quit"
         self.last_event_process = process_id
@@ -91,7 +156,7 @@ class RunInstance:
         if self.last_event_activity is not None:
             # None can occur when we are logging
             # "quit" but not transition fire
-            self.last_event_activity.quit = True
+            self._set_activity_flag(self.last_event_activity, "quit")
         self.last_event_instance = self.net_instances[process_id]
 
     def event_idle(self, process_id, time):
@@ -104,11 +169,16 @@ class RunInstance:
     def event_send(self, process_id, time, target_id, size, edge_id):
         debts = self.debt_receives[target_id * self.process_count + process_id]
         if debts:
+            if self.journal is not None:
+                self.journal.record(debts.insert, 0, debts[0])
             del debts[0]
             self.missed_receives += 1
         else:
             packet = Packet(time, size, edge_id)
-            self.packets[target_id * self.process_count + process_id].append(packet)
+            packets = self.packets[target_id * self.process_count + process_id]
+            if self.journal is not None:
+                self.journal.record(packets.pop)
+            packets.append(packet)
 
     def event_end(self, process_id, time):
         pass
@@ -120,6 +190,8 @@ class RunInstance:
         packets = self.packets[process_id * self.process_count + origin_id]
         if packets:
             packet = packets[0]
+            if self.journal is not None:
+                self.journal.record(packets.insert, 0, packet)
             del packets[0]
             self.last_event_instance = self.net_instances[process_id]
             self.set_activity(process_id,
@@ -128,6 +200,8 @@ class RunInstance:
         else:
             # receive on debt
             idx = process_id * self.process_count + origin_id
+            if self.journal is not None:
+                self.journal.record(self.debt_receives[idx].pop)
             self.debt_receives[idx].append(Receive(time, process_id, origin_id))
 
     def transition_fired(self, process_id, time, transition_id, values):
@@ -139,10 +213,10 @@ class RunInstance:
         self.last_event_activity = \
             TransitionFire(time, process_id, transition, values)
         if transition.has_code() or transition.collective:
-            self.activites[process_id] = self.last_event_activity
+            self._set_activity(process_id, self.last_event_activity)
 
     def transition_blocked(self, process_id):
-        self.activites[process_id].blocked = True
+        self._set_activity_flag(self.activites[process_id], "blocked")
 
     def transition_finished(self, process_id, time):
         self.last_event = "finish"
@@ -150,18 +224,68 @@ class RunInstance:
         self.last_event_time = time
         self.last_event_activity = self.activites[process_id]
         self.last_event_instance = self.net_instances[process_id]
-        self.activites[process_id] = None
+        self._set_activity(process_id, None)
 
     def copy(self):
         runinstance = RunInstance(self.project,
                                   self.process_count)
+        runinstance.net = self.net
         for i in self.net_instances:
             n = self.net_instances[i].copy()
             runinstance.net_instances[i] = n
 
-        runinstance.activites = self.activites[:]
+        # Activities are copied because they are modified by events (quit),
+        # the same activity has to be shared by the same slots in the copy
+        activities = {}
+        def copy_activity(activity):
+            if activity is None:
+                return None
+            a = activities.get(id(activity))
+            if a is None:
+                a = copy(activity)
+                activities[id(activity)] = a
+            return a
+
+        runinstance.activites = [ copy_activity(a) for a in self.activites ]
+        runinstance.last_event = self.last_event
+        runinstance.last_event_activity = copy_activity(self.last_event_activity)
+        if self.last_event_instance is not None:
+            runinstance.last_event_instance = \
+                runinstance.net_instances[self.last_event_instance.process_id]
+        runinstance.last_event_process = self.last_event_process
+        runinstance.last_event_time = self.last_event_time
+        runinstance.packets = [ packets[:] for packets in self.packets ]
+        runinstance.debt_receives = [ debts[:] for debts in self.debt_receives ]
+        runinstance.missed_receives = self.missed_receives
         return runinstance
 
+    def share_unchanged(self, previous):
+        """ Replaces parts equal to parts of the previous instance by
+            the parts of the previous instance. Both instances must not be
+            modified later, it is used for instances in the history of
+            a simulation, so the history grows only with changes. """
+        for process_id, net_instance in self.net_instances.items():
+            old = previous.net_instances.get(process_id)
+            if old is not None and old is not net_instance \
+                    and net_instance.share_unchanged(old):
+                self.net_instances[process_id] = old
+        if self.last_event_instance is not None:
+            self.last_event_instance = \
+                self.net_instances[self.last_event_instance.process_id]
+        self.packets = share_lists(
+            self.packets, previous.packets,
+            lambda p: (p.time, p.size, p.edge_id))
+        self.debt_receives = share_lists(
+            self.debt_receives, previous.debt_receives,
+            lambda r: (r.time, r.process_id, r.origin_id))
+
+    def get_size(self):
+        """ Returns the number of tokens and packets in the instance """
+        size = sum(len(packets) for packets in self.packets)
+        for net_instance in self.net_instances.values():
+            size += net_instance.get_size()
+        return size
+
     def get_perspectives(self):
         perspectives = [ Perspective("All", self, self.net_instances) ]
         v = self.net_instances.keys()
@@ -232,6 +356,7 @@ class NetInstance:
         self.enabled_transitions = None
         self.new_tokens = {}
         self.removed_tokens = {}
+        self.journal = None
         if tokens is None:
             self.tokens = {}
         else:
@@ -242,6 +367,10 @@ class NetInstance:
         if lst is None:
             lst = []
             self.new_tokens[place_id] = lst
+            if self.journal is not None:
+                self.journal.record(self.new_tokens.pop, place_id)
+        elif self.journal is not None:
+            self.journal.record(lst.pop)
 
         if isinstance(token_value, list):
             if not token_value: # the list of tokens is empty
@@ -255,6 +384,16 @@ class NetInstance:
             'new_tokens' are moved into regular list of tokens and
             'removed_tokens' tokens are emptied
         """
+        if self.journal is not None and (self.new_tokens or self.removed_tokens):
+            self.journal.record(self._restore_tokens,
+                                self.new_tokens,
+                                self.removed_tokens,
+                                [ (place_id,
+                                   place_id in self.tokens,
+                                   self.tokens.get(place_id),
+                                   len(self.tokens.get(place_id) or ()))
+                                  for place_id in self.new_tokens ])
+
         if self.new_tokens:
             for place_id in self.new_tokens:
                 lst = self.tokens.get(place_id)
@@ -267,6 +406,18 @@ class NetInstance:
         if self.removed_tokens:
             self.removed_tokens = {}
 
+    def _restore_tokens(self, new_tokens, removed_tokens, places):
+        for place_id, present, lst, size in places:
+            if lst is not None:
+                del lst[size:]
+                self.tokens[place_id] = lst
+            elif present:
+                self.tokens[place_id] = None
+            else:
+                del self.tokens[place_id]
+        self.new_tokens = new_tokens
+        self.removed_tokens = removed_tokens
+
     def remove_token(self, place_id, token_pointer):
         lst = self.tokens.get(place_id)
         if lst is None:
@@ -276,27 +427,116 @@ class NetInstance:
         if removed_lst is None:
             removed_lst = []
             self.removed_tokens[place_id] = removed_lst
+            if self.journal is not None:
+                self.journal.record(self.removed_tokens.pop, place_id)
 
         for i in xrange(len(lst)):
             if lst[i][0] == token_pointer:
+                if self.journal is not None:
+                    self.journal.record(lst.insert, i, lst[i])
+                    self.journal.record(removed_lst.pop)
                 removed_lst.append(lst[i])
                 del lst[i]
                 return
 
     def remove_all_tokens(self, place_id):
+        if self.journal is not None:
+            self.journal.record(self._restore_place,
+                                place_id,
+                                place_id in self.tokens,
+                                self.tokens.get(place_id),
+                                place_id in self.removed_tokens,
+                                self.removed_tokens.get(place_id))
         self.removed_tokens[place_id] = self.tokens.get(place_id)
         self.tokens[place_id] = None
 
+    def _restore_place(self, place_id,
+                       has_tokens, tokens, has_removed, removed_tokens):
+        for d, present, value in ((self.tokens, has_tokens, tokens),
+                                  (self.removed_tokens, has_removed, removed_tokens)):
+            if present:
+                d[place_id] = value
+            else:
+                d.pop(place_id, None)
+
     def add_enabled_transition(self, transition_id):
         if self.enabled_transitions is None:
+            if self.journal is not None:
+                self.journal.record(setattr, self, "enabled_transitions", None)
             self.enabled_transitions = []
+        elif self.journal is not None:
+            self.journal.record(self.enabled_transitions.pop)
         self.enabled_transitions.append(transition_id)
 
     def copy(self):
-        netinstance = NetInstance(self.process_id, copy(self.tokens))
+        netinstance = NetInstance(self.process_id, copy_tokens(self.tokens))
+        netinstance.new_tokens = copy_tokens(self.new_tokens)
+        netinstance.removed_tokens = copy_tokens(self.removed_tokens)
         netinstance.enabled_transitions = copy(self.enabled_transitions)
         return netinstance
 
+    def share_unchanged(self, previous):
+        """ Replaces token lists equal to lists of the previous instance
+            by them, returns True if the whole instance is equal """
+        equal = not (self.new_tokens or self.removed_tokens or
+                     previous.new_tokens or previous.removed_tokens) and \
+                len(self.tokens) == len(previous.tokens)
+        for place_id, lst in self.tokens.items():
+            if place_id in previous.tokens and previous.tokens[place_id] == lst:
+                self.tokens[place_id] = previous.tokens[place_id]
+            else:
+                equal = False
+        if self.enabled_transitions == previous.enabled_transitions:
+            self.enabled_transitions = previous.enabled_transitions
+        else:
+            equal = False
+        return equal
+
+    def get_size(self):
+        return sum(len(lst) for lst in self.tokens.values() if lst) + \
+               sum(len(lst) for lst in self.new_tokens.values() if lst)
+
+
+class Journal:
+    """ Records functions that undo changes of a run instance;
+        changes are grouped into steps and only last 'limit' steps are kept """
+
+    def __init__(self, limit):
+        self.steps = collections.deque(maxlen=limit)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def begin(self):
+        self.steps.append([])
+
+    def record(self, fn, *args):
+        if self.steps:
+            self.steps[-1].append((fn, args))
+
+    def undo(self):
+        for fn, args in reversed(self.steps.pop()):
+            fn(*args)
+
+
+def copy_tokens(tokens):
+    return dict((place_id, copy(lst)) for place_id, lst in tokens.items())
+
+def share_lists(lists, previous, key):
+    """ Returns 'lists' where lists equal (by 'key' of items) to lists
+        in 'previous' are replaced by them; returns 'previous' when
+        all lists are equal """
+    if len(lists) != len(previous):
+        return lists
+    result = []
+    for lst, old in zip(lists, previous):
+        if lst is not old and map(key, lst) == map(key, old):
+            lst = old
+        result.append(lst)
+    if all(lst is old for lst, old in zip(result, previous)):
+        return previous
+    return result
+
 
 class Perspective(utils.EqMixin):
 
@@ -24,12 +24,14 @@ import charts
 import utils
 import netview
 from exportri import place_counter_name
+from tracelog import Replay
 
 class RunView(gtk.VBox):
 
     def __init__(self, app, tracelog):
         gtk.VBox.__init__(self)
         self.tracelog = tracelog
+        self.replay = Replay(tracelog)
 
         button = gtk.Button("Export sequence")
         button.connect("clicked", lambda w:
@@ -102,7 +104,7 @@ class RunView(gtk.VBox):
 
     def show_runinstance(self):
         index = self.get_event_index()
-        runinstance = self.tracelog.get_event_runinstance(index)
+        runinstance = self.replay.set_index(index)
         self.netinstance_view.set_runinstance(runinstance)
         self.update_labels()
 
@@ -150,21 +152,18 @@ def process_utilization(table, processes):
     if not all(item in header for item in required):
         return
 
-    f_eq = lambda x, y: x == y
+    groups = table.group_by(["Event", "Process"], ["Time", "Duration"])
 
-    columns = ["Time", "Duration"]
     # collect idles
-    filters = [("Event", f_eq, 'I')]
     idles = []
     for p in processes:
-        idles.append(table.select(columns, filters + [("Process", f_eq, p)]))
+        idles.append(groups["I", p])
 
     # collect TETs
-    filters = [("Event", f_eq, 'T')]
     names, values = [], []
     for p in processes:
         names.append(str(p))
-        values.append(table.select(columns, filters + [("Process", f_eq, p)]))
+        values.append(groups["T", p])
 
     names.reverse()
     values.reverse()
@@ -186,14 +185,13 @@ def transition_utilization(table, processes, transitions):
     columns = ["Time", "Duration"]
     filters = [("Event", f_eq, 'T')]
     if "Process" in header:
+        groups = table.group_by(["ID", "Process"], columns, filters)
         names, values = [], []
         for p in processes:
             pnames, pvalues = [], []
             for t in transitions:
                 pnames.append("{0} {1}".format(t.get_name_or_id(), p))
-                pvalues.append(table.select(
-                    columns,
-                    filters + [("ID", f_eq, t.id), ("Process", f_eq, p)]))
+                pvalues.append(groups[t.id, p])
             names.append(pnames)
             values.append(pvalues)
 
@@ -205,11 +203,11 @@ def transition_utilization(table, processes, transitions):
         values = reduce(f_concate, values, [])
         names = reduce(f_concate, names, [])
     else:
+        groups = table.group_by("ID", columns, filters)
         names, values = [], []
         for t in transitions:
             names.append(t.get_name_or_id())
-            values.append(table.select(
-                columns, filters + [("ID", f_eq, t.id)]))
+            values.append(groups[t.id])
 
     return ("Utilization of transitions",
             charts.utilization_chart(
@@ -224,14 +222,12 @@ def tet_per_processes_and_transitions_histogram(table, processes, transitions):
        return
 
     f_eq = lambda x, y: x == y
-    columns = ["Duration"]
-    filters = [("Event", f_eq, 'T')]
+    groups = table.group_by(["ID", "Process"], "Duration", [("Event", f_eq, 'T')])
     names, values = [], []
     for tran in transitions:
-        f = filters + [("ID", f_eq, tran.id)]
         for p in processes:
             names.append("{0}`{1}".format(tran.get_name_or_id(), p))
-            tets = table.select(columns, f + [("Process", f_eq, p)])
+            tets = groups[tran.id, p]
 
             if len(tets) == 0: # tets is a numpy array
                 tets = [0] # data for a histogram chart must not be empty
@@ -250,12 +246,11 @@ def tet_per_processes_histogram(table, processes):
        return
 
     f_eq = lambda x, y: x == y
-    columns = ["Duration"]
-    filters = [("Event", f_eq, 'T')]
+    groups = table.group_by("Process", "Duration", [("Event", f_eq, 'T')])
     names, values = [], []
     for p in processes:
         names.append("Process {0}".format(p))
-        tets = table.select(columns, filters + [("Process", f_eq, p)])
+        tets = groups[p]
 
         if len(tets) == 0:
             tets = [0]
@@ -274,12 +269,11 @@ def tet_per_transitions_histogram(table, transitions):
        return
 
     f_eq = lambda x, y: x == y
-    columns = ["Duration"]
-    filters = [("Event", f_eq, 'T')]
+    groups = table.group_by("ID", "Duration", [("Event", f_eq, 'T')])
     names, values = [], []
     for t in transitions:
         names.append(t.get_name_or_id())
-        tets = table.select(columns, filters + [("ID", f_eq, t.id)])
+        tets = groups[t.id]
 
         if len(tets) == 0:
             tets = [0]
@@ -299,14 +293,14 @@ def tokens_count(table, processes, places, collapse=True):
         return
 
     f_eq = lambda x, y: x == y
-    filters = [("Event", f_eq, 'C')]
+    groups = table.group_by("Process", None, [("Event", f_eq, 'C')])
     names, values = [], []
     for place in places:
-        columns = ["Time", place_counter_name(place)]
+        column = place_counter_name(place)
         for p in processes:
             names.append("{0}@{1}".format(place.get_name_or_id(), p))
-            counts = table.select(columns, filters + [("Process", f_eq, p)])
-            values.append((counts[columns[0]], counts[columns[1]]))
+            counts = groups[p]
+            values.append((counts["Time"], counts[column]))
 
     return ("Number of tokens",
             charts.place_chart(
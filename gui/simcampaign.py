@@ -0,0 +1,185 @@
+#
+#    Copyright (C) 2014 Stanislav Bohm
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Campaigns of simulated runs; a program built as "simrun" is run for each
+# configuration (a number of processes and values of parameters) and
+# tracelogs of runs are summarized into one table.
+
+import os
+import shutil
+import itertools
+import tempfile
+import traceback
+import subprocess
+import multiprocessing
+import numpy as np
+
+import tracelog
+from table import Table
+from runinstance import RunInstance
+
+summary_columns = [ ("Makespan", "<u8"), # the time of the last event
+                    ("Utilization", "<f8"), # busy time / (processes * makespan)
+                    ("Messages", "<u8"),
+                    ("Message volume", "<u8") ] # the sum of sizes of messages
+
+def create_configurations(process_counts, parameters):
+    """ Returns all combinations of process counts and values of parameters
+        as couples (process count, dictionary of values of parameters)
+
+        Arguments:
+        process_counts -- a list of numbers of processes
+        parameters -- a list of couples (name of parameter, list of values)
+    """
+    names = [ name for name, values in parameters ]
+    return [ (process_count, dict(zip(names, values)))
+             for process_count in process_counts
+             for values in itertools.product(*[ values for name, values
+                                                in parameters ]) ]
+
+
+class SummaryRunInstance(RunInstance):
+    """ Collects the busy time of processes and sent messages """
+
+    def __init__(self, project, process_count):
+        RunInstance.__init__(self, project, process_count)
+        self.busy_time = 0
+        self.end_time = 0
+        self.messages = 0
+        self.message_volume = 0
+
+    def transition_finished(self, process_id, time):
+        activity = self.activites[process_id]
+        if activity is not None:
+            self.busy_time += time - activity.time
+        RunInstance.transition_finished(self, process_id, time)
+
+    def event_send(self, process_id, time, target_id, size, edge_id):
+        self.messages += 1
+        self.message_volume += size
+        RunInstance.event_send(self, process_id, time, target_id, size, edge_id)
+
+    def event_end(self, process_id, time):
+        self.end_time = max(self.end_time, time)
+        RunInstance.event_end(self, process_id, time)
+
+    def get_summary(self):
+        """ Returns values of summary_columns """
+        makespan = max(self.end_time, self.last_event_time)
+        if makespan:
+            utilization = float(self.busy_time) / (makespan * self.process_count)
+        else:
+            utilization = 0.0
+        return (makespan, utilization, self.messages, self.message_volume)
+
+
+def run_configuration((program, directory, process_count, parameters, tracelog_size)):
+    """ Runs the program in the directory and summarizes its tracelog,
+        returns None when the program fails or its tracelog cannot be read.
+        The output of the program (and the error of reading the tracelog)
+        is stored in the file 'output' in the directory. """
+    os.makedirs(directory)
+    output_filename = os.path.join(directory, "output")
+    args = [ program, "-r", str(process_count), "-T", tracelog_size ]
+    args += [ "-p{0}={1}".format(name, value)
+              for name, value in parameters.items() ]
+    with open(output_filename, "w") as output:
+        if subprocess.call(args, cwd=directory,
+                           stdout=output, stderr=subprocess.STDOUT) != 0:
+            return None
+
+    try:
+        # Runs are already in parallel, so traces are decoded in this process
+        t = tracelog.TraceLog(os.path.join(directory, "trace.kth"),
+                              use_cache=False,
+                              decode_processes=1)
+        runinstance = SummaryRunInstance(t.project, t.process_count)
+        t.execute_all_events(runinstance)
+    except Exception:
+        # A missing or truncated tracelog fails only this run,
+        # results of other runs are kept
+        with open(output_filename, "a") as output:
+            traceback.print_exc(file=output)
+        return None
+    return runinstance.get_summary()
+
+def run_campaign(program,
+                 configurations,
+                 parameter_names=None,
+                 directory=None,
+                 processes=None,
+                 tracelog_size="10M"):
+    """ Runs the simulated program for each configuration in a pool of
+        processes. Returns a table with a row for each configuration;
+        results of failed runs are invalid (None) values.
+
+        Arguments:
+        program -- a program built as "simrun"
+        configurations -- couples (process count, dictionary of parameters),
+                          see create_configurations
+        parameter_names -- columns of parameters, None = all parameters
+        directory -- runs are stored into subdirectories "run-<index>",
+                     None = runs are stored into a temporary directory
+                     that is removed at the end
+        processes -- the number of runs in parallel, None = number of CPUs
+        tracelog_size -- the size of the trace buffer (option -T)
+    """
+    program = os.path.abspath(program)
+    if parameter_names is None:
+        parameter_names = sorted(set(name for process_count, parameters
+                                          in configurations
+                                          for name in parameters))
+
+    columns = [ ("Processes", "<i4") ]
+    for name in parameter_names:
+        values = [ parameters[name] for process_count, parameters
+                   in configurations if name in parameters ]
+        columns.append((name, np.array(values).dtype.str))
+    columns += summary_columns
+
+    if directory is None:
+        run_directory = tempfile.mkdtemp(prefix="kaira-campaign-")
+    else:
+        run_directory = directory
+    tasks = [ (program,
+               os.path.join(run_directory, "run-{0}".format(i)),
+               process_count,
+               parameters,
+               tracelog_size)
+              for i, (process_count, parameters) in enumerate(configurations) ]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # Runs may take very different times, so they are taken one by one
+        results = list(pool.imap(run_configuration, tasks, 1))
+    finally:
+        pool.close()
+        pool.join()
+        if directory is None:
+            shutil.rmtree(run_directory, ignore_errors=True)
+
+    table = Table(columns, len(configurations))
+    for (process_count, parameters), result in zip(configurations, results):
+        if result is None:
+            result = (None,) * len(summary_columns)
+        table.add_row([ process_count ] +
+                      [ parameters.get(name) for name in parameter_names ] +
+                      list(result))
+    table.trim()
+    return table
@@ -0,0 +1,443 @@
+#
+#    Copyright (C) 2014 Stanislav Bohm
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Headless client of simulated programs; this module does not import GTK,
+# so it can be used from scripts and tests:
+#
+#   client = SimulationClient()
+#   client.start("./workers", 4, { "LIMIT" : 100, "SIZE" : 20 })
+#   client.run_sequence([ "0 T divide", "1 R 0" ])
+#   while client.execute(random.choice(client.get_enabled_commands())):
+#       runinstance = client.get_runinstance()
+#   client.quit()
+
+import sys
+import json
+import socket
+import struct
+import threading
+import subprocess
+import xml.etree.ElementTree as xml
+
+import utils
+import controlseq
+from runinstance import RunInstance
+
+
+class SimulationException(Exception):
+    pass
+
+
+def parse_report(data, compact):
+    """ Parses a report; XML reports are converted into the structure
+        of compact reports """
+    if compact:
+        return json.loads(data)
+    return parse_xml_report(data)
+
+def parse_xml_report(data):
+    """ Parses a report in XML into the structure of compact reports """
+    root = xml.fromstring(data)
+    processes = []
+    for i, e in enumerate(root.findall("process")):
+        places = []
+        for pe in e.findall("place"):
+            tokens = []
+            for te in pe.findall("token"):
+                source = te.get("source")
+                if source is None:
+                    tokens.append(te.get("value"))
+                else:
+                    tokens.append([ te.get("value"), source ])
+            places.append((utils.xml_int(pe, "id"), tokens))
+        enabled = [ utils.xml_int(tre, "id") for tre in e.findall("enabled") ]
+        processes.append((utils.xml_int(e, "id", i), places, enabled))
+
+    return {
+        "net-id" : utils.xml_int(root, "net-id"),
+        "id" : root.get("id"),
+        "delta" : utils.xml_bool(root, "delta", False),
+        "quit" : utils.xml_bool(root, "quit"),
+        "process-reports" : processes,
+        "activations" : [ (utils.xml_int(e, "process-id"),
+                           utils.xml_int(e, "transition-id"),
+                           utils.xml_bool(e, "blocked", False))
+                          for e in root.findall("activation") ],
+        "packets" : [ (utils.xml_int(e, "origin-id"),
+                       utils.xml_int(e, "target-id"),
+                       utils.xml_int(e, "size"),
+                       utils.xml_int(e, "edge-id"))
+                      for e in root.findall("packet") ],
+    }
+
+def create_runinstance(project, process_count, report, previous=None):
+    """ Creates RunInstance from a parsed report. 'previous' is the run
+        instance of the previous report; processes missing in a delta report
+        and all unchanged parts are shared with it. """
+    net_id = report["net-id"]
+    runinstance = RunInstance(project, process_count)
+
+    # A delta report contains only processes changed since the last
+    # report; instances of other processes are shared with it
+    processes = {}
+    for process_report in report["process-reports"]:
+        processes[process_report[0]] = process_report
+
+    for process_id in xrange(process_count):
+        process_report = processes.get(process_id)
+        if process_report is None:
+            assert report["delta"]
+            runinstance.add_net_instance(
+                net_id, previous.net_instances[process_id])
+            continue
+        process_id, places, enabled = process_report
+        runinstance.event_spawn(process_id, 0, net_id)
+        for place_id, tokens in places:
+            for token in tokens:
+                if isinstance(token, list): # [value, source]
+                    token = u"{{{1}}} {0}".format(*token)
+                runinstance.add_token(place_id, 0, token)
+            runinstance.clear_removed_and_new_tokens()
+
+        for transition_id in enabled:
+            runinstance.add_enabled_transition(transition_id)
+
+    for process_id, transition_id, blocked in report["activations"]:
+        runinstance.transition_fired(process_id,
+                                     0,
+                                     transition_id, [])
+        if blocked:
+            runinstance.transition_blocked(process_id)
+
+    for origin_id, target_id, size, edge_id in report["packets"]:
+        runinstance.event_send(origin_id, 0, target_id, size, edge_id)
+
+    runinstance.reset_last_event_info()
+    if previous is not None:
+        runinstance.share_unchanged(previous)
+    return runinstance
+
+def translate_sequence(sequence, net, target):
+    """ Translates commands of a control sequence into commands for
+        the program. Returns a list of couples (command for the program,
+        function that records the command into the sequence 'target')
+        and None, or commands before the first invalid command and
+        the couple (index of the invalid command, error message). """
+    transitions = {}
+    for t in net.transitions():
+        transitions["#{0}".format(t.id)] = t
+    for t in net.transitions():
+        transitions[utils.sanitize_name(t.get_name())] = t
+
+    commands = []
+
+    def get_transition(transition):
+        t = transitions.get(transition)
+        if t is None:
+             raise SimulationException("Transition '{0}' not found".format(transition))
+        return t
+
+    def fire(process_id, transition):
+        t = get_transition(transition)
+        name = utils.sanitize_name(t.get_name_or_id())
+        commands.append(("FIRE {0} {1} 2".format(t.id, process_id),
+                         lambda: target.add_fire(process_id, name)))
+
+    def start(process_id, transition):
+        t = get_transition(transition)
+        name = utils.sanitize_name(t.get_name_or_id())
+        def record():
+            target.add_transition_start(process_id, name)
+            if not t.has_code():
+                target.add_transition_finish(process_id)
+        commands.append(("FIRE {0} {1} 1".format(t.id, process_id), record))
+
+    def finish(process_id):
+        commands.append(("FINISH {0}".format(process_id),
+                         lambda: target.add_transition_finish(process_id)))
+
+    def receive(process_id, from_process):
+        commands.append(("RECEIVE {0} {1}".format(process_id, from_process),
+                         lambda: target.add_receive(process_id, from_process)))
+
+    for i in xrange(sequence.get_commands_size()):
+        try:
+            sequence.execute_command(i, fire, start, finish, receive)
+        except (SimulationException, controlseq.ControlSequenceException), e:
+            return commands, (i, str(e))
+    return commands, None
+
+
+class Transition:
+    """ Transition from the project description in the header of a program;
+        it has the part of the interface of net.Transition used by
+        RunInstance and control sequences """
+
+    def __init__(self, element):
+        self.id = utils.xml_int(element, "id")
+        self.name = element.get("name", "")
+        self.collective = utils.xml_bool(element, "collective", False)
+        code = element.find("code")
+        if code is not None and code.text:
+            self.code = code.text
+        else:
+            self.code = ""
+
+    def get_name(self):
+        return self.name
+
+    def get_name_or_id(self):
+        if not self.name:
+            return "#{0}".format(self.id)
+        return self.name
+
+    def has_code(self):
+        return self.code.strip() != ""
+
+
+class Net:
+
+    def __init__(self, element):
+        self.id = utils.xml_int(element, "id")
+        self.name = element.get("name", "")
+        self.items = [ Transition(e) for e in element.findall("transition") ]
+
+    def transitions(self):
+        return self.items
+
+    def item_by_id(self, id):
+        for item in self.items:
+            if item.id == id:
+                return item
+        return None
+
+
+class Project:
+    """ Nets of the project description; the full project (loader) needs GTK """
+
+    def __init__(self, element):
+        self.nets = [ Net(e) for e in element.findall("net") ]
+
+    def find_net(self, id):
+        for net in self.nets:
+            if net.id == id:
+                return net
+
+
+class SimulationClient:
+    """ Synchronous client of a simulated program (started with "-s"). Reports
+        are queried only when the state is needed (get_runinstance), so
+        commands between them cost one round trip each. """
+
+    use_framing = True # Use framed replies when the program supports them
+    batch_size = 1000 # Number of commands of a control sequence sent at once
+    keep_history = False # Keep all queried run instances in 'history'
+
+    def __init__(self):
+        self.process = None
+        self.sock = None
+        self.stream = None
+        self.project = None
+        self.process_count = None
+        self.framed = False
+        self.reports_id = None
+        self.runinstance = None
+        self.changed = True
+        self.quit_flag = False
+        self.sequence = controlseq.ControlSequence()
+        self.history = []
+
+    def start(self, filename, process_count, parameters=None, cwd=None, output=None):
+        """ Starts the program and connects to it. The output of the program
+            is copied into 'output' (a file) or thrown away if it is None """
+        args = [ filename, "-s", "auto", "-b", "-r", str(process_count) ]
+        if parameters:
+            args += [ "-p{0}={1}".format(k, v) for k, v in parameters.items() ]
+        self.process = subprocess.Popen(args,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        cwd=cwd)
+        line = self.process.stdout.readline()
+        try:
+            port = int(line)
+        except ValueError:
+            self.process.kill()
+            self.process.wait()
+            raise SimulationException(
+                "Simulated program returns invalid first line: " + line)
+
+        # The output has to be read, otherwise the program blocks
+        thread = threading.Thread(target=self._copy_output, args=(output,))
+        thread.daemon = True
+        thread.start()
+        self.connect("localhost", port)
+
+    def _copy_output(self, output):
+        for line in iter(self.process.stdout.readline, ""):
+            if output is not None:
+                output.write(line)
+
+    def connect(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.stream = self.sock.makefile("rb")
+        header = xml.fromstring(self.stream.readline())
+        self.process_count = utils.xml_int(header, "process-count")
+        lines_count = utils.xml_int(header, "description-lines")
+        project_string = "\n".join(self.stream.readline() for i in xrange(lines_count))
+        self.project = Project(xml.fromstring(project_string))
+        if self.use_framing and header.get("framing") == "binary":
+            if self.command("FRAMING binary") == "Ok":
+                self.framed = True
+
+    def command(self, command):
+        """ Sends a command and returns the reply (without the end of line) """
+        self.sock.sendall(command + "\n")
+        if self.framed:
+            size = struct.unpack(">I", self._read(4))[0]
+            return self._read(size)
+        line = self.stream.readline()
+        if not line:
+            raise SimulationException("Connection closed")
+        return line.rstrip("\n")
+
+    def _read(self, size):
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise SimulationException("Connection closed")
+        return data
+
+    def query_reports(self):
+        if self.reports_id is None:
+            command = "REPORTS"
+        else:
+            command = "REPORTS {0}".format(self.reports_id)
+        report = parse_report(self.command(command), self.framed)
+        self.runinstance = create_runinstance(
+            self.project, self.process_count, report, self.runinstance)
+        self.reports_id = report["id"]
+        self.quit_flag = report["quit"]
+        self.changed = False
+        if self.keep_history:
+            self.history.append(self.runinstance)
+        return self.runinstance
+
+    def get_runinstance(self):
+        """ Returns RunInstance of the current state. Run instances are
+            not modified, so they can be kept as snapshots. """
+        if self.changed or self.runinstance is None:
+            self.query_reports()
+        return self.runinstance
+
+    def is_finished(self):
+        self.get_runinstance()
+        return self.quit_flag
+
+    def get_net(self):
+        return self.get_runinstance().net
+
+    def fire_transition(self, transition, process_id, phases=2):
+        """ Fires the transition (an id or a name as in control sequences),
+            returns True if the transition was fired """
+        if isinstance(transition, int):
+            transition = "#{0}".format(transition)
+        if phases == 2:
+            command = "{0} T {1}".format(process_id, transition)
+        else:
+            command = "{0} S {1}".format(process_id, transition)
+        return self.execute(command)
+
+    def finish_transition(self, process_id):
+        return self.execute("{0} F".format(process_id))
+
+    def receive(self, process_id, origin_id):
+        return self.execute("{0} R {1}".format(process_id, origin_id))
+
+    def execute(self, command):
+        """ Executes a command of control sequences, returns True on success """
+        return self.run_sequence([ command ]) is None
+
+    def run_sequence(self, sequence):
+        """ Runs a control sequence (or a list of its commands). Returns None
+            when all commands are executed or the index of the failed command.
+            Executed commands are recorded into self.sequence. """
+        if not isinstance(sequence, controlseq.ControlSequence):
+            sequence = controlseq.ControlSequence("", list(sequence))
+        commands, error = translate_sequence(sequence, self.get_net(), self.sequence)
+        if error is not None:
+            raise SimulationException("Command {0}: {1}".format(*error))
+
+        for position in xrange(0, len(commands), self.batch_size):
+            batch = commands[position:position + self.batch_size]
+            reply = self.command("BATCH {0}\n".format(len(batch)) +
+                                 "\n".join(command for command, record in batch))
+            self.changed = True
+            if reply == "Ok":
+                executed = len(batch)
+            else:
+                # "Failed <index> <message>"
+                executed = int(reply.split()[1])
+            for command, record in batch[:executed]:
+                record()
+            if executed < len(batch):
+                return position + executed
+        return None
+
+    def get_enabled_commands(self):
+        """ Returns commands of control sequences that can be executed
+            in the current state (in the order of processes) """
+        runinstance = self.get_runinstance()
+        net = runinstance.net
+        commands = []
+        for process_id in xrange(self.process_count):
+            activity = runinstance.activites[process_id]
+            if activity is not None and activity.name == "fire":
+                commands.append("{0} F".format(process_id))
+            else:
+                for transition_id in runinstance.net_instances[process_id] \
+                                                .enabled_transitions or ():
+                    commands.append("{0} T #{1}".format(process_id, transition_id))
+            for origin_id in xrange(self.process_count):
+                if runinstance.get_packets_count(origin_id, process_id):
+                    commands.append("{0} R {1}".format(process_id, origin_id))
+        return commands
+
+    def quit(self):
+        """ Terminates the program """
+        if self.sock is not None:
+            try:
+                self.sock.sendall("QUIT\n")
+            except socket.error:
+                pass
+            self.close()
+        if self.process is not None:
+            self.process.wait()
+            self.process = None
+
+    def detach(self):
+        """ Disconnects, the program continues without the simulation """
+        if self.sock is not None:
+            self.sock.sendall("DETACH\n")
+            self.close()
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+        self.sock = None
+        self.stream = None
@@ -22,14 +22,12 @@ import process
 import random
 from loader import load_project_from_xml
 from events import EventSource
-from runinstance import RunInstance
+from simclient import SimulationException
+import simclient
 import controlseq
 
 import utils
 
-class SimulationException(Exception):
-    pass
-
 class Simulation(EventSource):
     """
         Events: changed, inited, error, shutdown, command-failed
@@ -40,12 +38,17 @@ class Simulation(EventSource):
     process_count = None
     quit_on_shutdown = False
     init_control_sequence = None
+    batch_size = 1000 # Number of commands of a control sequence sent at once
+    use_framing = True # Use framed replies when the program supports them
 
     def __init__(self):
         EventSource.__init__(self)
         self.random = random.Random()
         self.state = "ready" # states: ready / running / finished / error
         self.runinstance = None
+        self.reports_id = None # Id of the last report, None = full report is needed
+        self.framing = None # Framing supported by the program
+        self.framed = False # Replies are framed and reports are compact
         self.sequence = controlseq.ControlSequence()
         self.history_instances = []
 
@@ -58,6 +61,8 @@ class Simulation(EventSource):
         def connected(stream):
             self.controller = controller
             self.read_header(stream)
+            if self.use_framing and self.framing == "binary":
+                self.start_framing(stream)
             self.query_reports(inited)
         connection = process.Connection(
             host,
@@ -86,62 +91,48 @@ class Simulation(EventSource):
     def read_header(self, stream):
         header = xml.fromstring(stream.readline())
         self.process_count = utils.xml_int(header, "process-count")
+        self.framing = header.get("framing")
         lines_count = utils.xml_int(header, "description-lines")
         project_string = "\n".join((stream.readline() for i in xrange(lines_count)))
         self.project = load_project_from_xml(xml.fromstring(project_string), "")
 
+    def start_framing(self, stream):
+        """ Switches replies of the program to frames and reports to
+            the compact encoding; no command may wait for its reply """
+        self.controller.run_command("FRAMING binary", None)
+        if stream.readline() == "Ok\n":
+            stream.read_frames()
+            self.framed = True
+
     def get_instances(self):
         return self.instances
 
     def query_reports(self, callback=None):
         def reports_callback(line):
-            root = xml.fromstring(line)
-            net_id = utils.xml_int(root, "net-id")
-            runinstance = RunInstance(self.project, self.process_count)
-            for process_id, e in enumerate(root.findall("process")):
-                runinstance.event_spawn(process_id, 0, net_id)
-                for pe in e.findall("place"):
-                    place_id = utils.xml_int(pe, "id")
-                    for te in pe.findall("token"):
-                        name = te.get("value")
-                        source = te.get("source")
-                        if source is not None:
-                            name = "{{{0}}} {1}".format(source, name)
-                        runinstance.add_token(place_id, 0, name)
-                    runinstance.clear_removed_and_new_tokens()
-
-                for tre in e.findall("enabled"):
-                    runinstance.add_enabled_transition(utils.xml_int(tre, "id"))
-
-            for e in root.findall("activation"):
-                process_id = utils.xml_int(e, "process-id")
-                transition_id = utils.xml_int(e, "transition-id")
-                runinstance.transition_fired(process_id,
-                                             0,
-                                             transition_id, [])
-                if utils.xml_bool(e, "blocked", False):
-                    runinstance.transition_blocked(process_id)
-
-            for e in root.findall("packet"):
-                origin_id = utils.xml_int(e, "origin-id")
-                target_id = utils.xml_int(e, "target-id")
-                size = utils.xml_int(e, "size")
-                edge_id = utils.xml_int(e, "edge-id")
-                runinstance.event_send(origin_id, 0, target_id, size, edge_id)
-
-            runinstance.reset_last_event_info()
+            report = simclient.parse_report(line, self.framed)
+            if self.history_instances:
+                previous = self.history_instances[-1]
+            else:
+                previous = None
+            runinstance = simclient.create_runinstance(
+                self.project, self.process_count, report, previous)
 
+            self.reports_id = report["id"]
             self.runinstance = runinstance
             self.history_instances.append(runinstance)
 
-            if self.state != "finished" and utils.xml_bool(root, "quit"):
+            if self.state != "finished" and report["quit"]:
                 self.state = "finished"
                 self.emit_event("error", "Program finished\n")
             if callback:
                 callback()
             self.emit_event("changed", True)
 
-        self.controller.run_command("REPORTS", reports_callback)
+        if self.reports_id is None:
+            command = "REPORTS"
+        else:
+            command = "REPORTS {0}".format(self.reports_id)
+        self.controller.run_command(command, reports_callback)
 
     def check_ready(self):
         if self.state == "finished":
@@ -151,53 +142,50 @@ class Simulation(EventSource):
         return self.state == "ready"
 
     def run_sequence(self, sequence):
-        transitions = {}
-        command = [0]
-        for t in self.runinstance.net.transitions():
-            transitions["#{0}".format(t.id)] = t
-        for t in self.runinstance.net.transitions():
-            transitions[utils.sanitize_name(t.get_name())] = t
-
-        def next_command():
-            if command[0] >= sequence.get_commands_size():
-                self.query_reports()
+        """ Sends commands of the sequence to the controller in batches, so
+            there is one round trip per batch and one report at the end """
+        commands, error = simclient.translate_sequence(
+            sequence, self.runinstance.net, self.sequence)
+        invalid = None # Commands before the invalid one are executed
+        if error is not None:
+            invalid, message = error
+            self.emit_event("error", message + "\n")
+
+        def failed(index):
+            self.emit_event("command-failed", sequence, index)
+            self.query_reports()
+
+        def send_batch(position):
+            if position >= len(commands):
+                if invalid is not None:
+                    failed(invalid)
+                else:
+                    self.query_reports()
                 return
-            sequence.execute_command(command[0], fire, start, finish, receive)
-            command[0] += 1
-
-        def fail_callback():
-            self.emit_event("command-failed", sequence, command[0] - 1)
-
-        def fire(process_id, transition):
-            t = transitions.get(transition)
-            if t is None:
-                 raise SimulationException("Transition '{0}' not found".format(transition))
-            self.fire_transition(t.id,
-                                 process_id,
-                                 2,
-                                 ok_callback=next_command)
-
-        def start(process_id, transition):
-            t = transitions.get(transition)
-            if t is None:
-                 raise SimulationException("Transition '{0}' not found".format(transition))
-            self.fire_transition(t.id,
-                                 process_id,
-                                 1,
-                                 ok_callback=next_command)
-
-        def finish(process_id):
-            self.finish_transition(process_id,
-                                   ok_callback=next_command,
-                                   fail_callback=fail_callback)
-
-        def receive(process_id, from_process):
-            self.receive(process_id,
-                         from_process,
-                         ok_callback=next_command,
-                         fail_callback=fail_callback)
-
-        next_command()
+            batch = commands[position:position + self.batch_size]
+
+            def callback(line):
+                self.set_state_ready()
+                if line == "Ok\n":
+                    executed = len(batch)
+                else:
+                    # "Failed <index> <message>"
+                    executed = int(line.split()[1])
+                for command, record in batch[:executed]:
+                    record()
+                if executed < len(batch):
+                    failed(position + executed)
+                else:
+                    send_batch(position + executed)
+
+            self.state = "running"
+            self.controller.run_command(
+                "BATCH {0}\n".format(len(batch)) +
+                "\n".join(command for command, record in batch),
+                callback)
+
+        if self.controller and self.check_ready():
+            send_batch(0)
 
     def receive(self,
                 process_id,
@@ -292,3 +280,4 @@ class Simulation(EventSource):
 
     def is_last_instance_active(self):
         return self.history_instances and self.history_instances[-1] == self.runinstance
+
@@ -83,9 +83,12 @@ class StatespaceConfig(gtk.VBox):
         def build_ok():
             self.info_label.set_text("Running computation ...")
             prefix = "==KAIRA=="
-            def on_line(line, stream):
-                if line.startswith(prefix):
-                    self.info_label.set_text("Running computation ... " + line[len(prefix):])
+            def on_lines(lines, stream):
+                # Only the last progress line of the read chunk is shown
+                for line in reversed(lines):
+                    if line.startswith(prefix):
+                        self.info_label.set_text("Running computation ... " + line[len(prefix):])
+                        break
                 return True
 
             def on_exit(code):
@@ -101,7 +104,7 @@ class StatespaceConfig(gtk.VBox):
                     self.info_label.set_text("Computation failed")
 
             p = process.Process(build_config.get_executable_filename(),
-                                on_line,
+                                on_lines,
                                 on_exit)
             p.cwd = self.app.project.get_directory()
 
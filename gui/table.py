@@ -17,16 +17,24 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import collections
 import numpy as np
 
 class Table(object):
 
+    max_chunk_size = 65536
+
     def __init__(self, columns, rows_number=10, init_data=True):
         """ An initialization of a table.
         Note: there should not be used general PyObject type ('O' description),
         because of an error in NumPy indexing. (The `select` method would not
         work).
 
+        Rows are stored in chunks; a chunk is a list of couples (values, mask)
+        of arrays, one couple for each column. Chunks are merged only when
+        columns are read, and the masked array 'data' with all rows is
+        created only when it is accessed.
+
         Arguments:
         columns -- a list of couples (name, data type)
         rows_number -- an initializing number of rows
@@ -37,9 +45,14 @@ class Table(object):
             columns = None
         else:
             self.header, self.types = map(list, zip(*columns))
+        self.columns = columns
         self.rows_number = rows_number
-        if init_data:
-            self.data = np.ma.zeros((self.rows_number,), dtype=columns)
+
+        self.chunks = [] # filled chunks
+        self.chunk = None # the chunk filled by add_row
+        self.chunk_rows = 0
+        self.chunk_size = max(rows_number, 16)
+        self._data = None # all rows as a masked array, created on demand
 
         self.last_row_index = 0
 
@@ -50,15 +63,54 @@ class Table(object):
 
         columns = data.dtype.descr
         rows_number = len(data)
-        t = Table(columns, rows_number)
-        if isinstance(data, np.ma.core.MaskedArray):
-            t.data = data
-        else:
-            t.data = np.ma.zeros((rows_number,), dtype=columns)
-            t.data.data = data
-        t.last_row_index = rows_number
+        t = Table(columns, rows_number, False)
+        t.data = data
         return t
 
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._select_columns(None, None)
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # Columns are views of the data
+        mask = np.ma.getmaskarray(data)
+        self.chunks = [ [ (data.data[name], mask[name]) for name in self.header ] ]
+        self.chunk = None
+        self.chunk_rows = 0
+        self.last_row_index = len(data)
+        self._data = data
+
+    def _merge_chunks(self):
+        self._close_chunk()
+        if len(self.chunks) > 1:
+            self.chunks = [ [ (np.concatenate([ chunk[i][0] for chunk in self.chunks ]),
+                               np.concatenate([ chunk[i][1] for chunk in self.chunks ]))
+                              for i in xrange(self.columns_number) ] ]
+
+    def _close_chunk(self):
+        if self.chunk_rows:
+            self.chunks.append([ (values[:self.chunk_rows], mask[:self.chunk_rows])
+                                 for values, mask in self.chunk ])
+        self.chunk = None
+        self.chunk_rows = 0
+
+    def _add_chunk(self, chunk, size):
+        self._close_chunk()
+        self.chunks.append(chunk)
+        self.last_row_index += size
+        self._data = None
+
+    def _get_column(self, column):
+        """ Returns arrays (values, mask) of the column with all rows """
+        self._merge_chunks()
+        index = self.header.index(self._get_colum_name(column))
+        if not self.chunks:
+            return (np.zeros(0, dtype=self.types[index]), np.zeros(0, dtype=bool))
+        return self.chunks[0][index]
+
     def __getitem__(self, key):
         return self.data[key]
 
@@ -67,6 +119,7 @@ class Table(object):
 
     def __iter__(self):
         self._index = 0
+        self._iter_columns = map(self._get_column, self.header)
         return self
 
     def next(self):
@@ -74,41 +127,70 @@ class Table(object):
             raise StopIteration
 
         # returns modified data; masked values are replaced by None
-        data, mask = self.data.data[self._index], self.data.mask[self._index]
-        try:
-            ndata, nmask = iter(data), iter(mask)
-            raw_data = zip(data, mask)
-        except TypeError:
-            # data and mask are both one element
-            raw_data = [(data, mask)]
-
-        row = [None if masked else item for item, masked in raw_data]
+        index = self._index
+        row = [ None if mask[index] else values[index]
+                for values, mask in self._iter_columns ]
 
         self._index += 1
         return row
 
     def add_row(self, row):
-        row = tuple(row)
         assert len(row) == self.columns_number, \
                "The row has to have the same length as the table has columns."
 
-        if self.last_row_index >= self.rows_number: # resize
-            self.rows_number *= 2
-            self.data = np.ma.resize(self.data, self.rows_number)
+        if self.chunk is None or self.chunk_rows == len(self.chunk[0][0]):
+            self._close_chunk()
+            self.chunk = [ (np.zeros(self.chunk_size, dtype=t),
+                            np.zeros(self.chunk_size, dtype=bool))
+                           for t in self.types ]
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
 
-        for i, item in enumerate(row): # append row
-            if item is None: # invalid values
-                self.data.mask[self.last_row_index][i] = True
+        # invalid values are None
+        index = self.chunk_rows
+        for (values, mask), item in zip(self.chunk, row):
+            if item is None:
+                mask[index] = True
             else:
-                self.data.mask[self.last_row_index][i] = False
-                self.data.data[self.last_row_index][i] = item
+                values[index] = item
+        self.chunk_rows += 1
         self.last_row_index += 1
+        self._data = None
+
+    def add_rows(self, rows):
+        """ Adds a list of rows; invalid values are None """
+        if not rows:
+            return
+        assert all(len(row) == self.columns_number for row in rows), \
+               "The row has to have the same length as the table has columns."
+        chunk = []
+        for items, t in zip(zip(*rows), self.types):
+            mask = np.fromiter((item is None for item in items), dtype=bool,
+                               count=len(items))
+            if mask.any():
+                items = [ 0 if item is None else item for item in items ]
+            chunk.append((np.array(items, dtype=t), mask))
+        self._add_chunk(chunk, len(rows))
+
+    def extend(self, columns):
+        """ Adds rows from arrays, 'columns' is a dictionary that maps names
+            of columns to arrays (masked values are invalid) or an array
+            with named columns """
+        if isinstance(columns, dict):
+            size = len(columns.values()[0]) if columns else 0
+        else:
+            size = len(columns)
+        if size == 0:
+            return
+        chunk = [ (np.array(np.ma.getdata(columns[name]), dtype=t),
+                   np.array(np.ma.getmaskarray(columns[name])))
+                  for name, t in zip(self.header, self.types) ]
+        self._add_chunk(chunk, size)
 
     def trim(self):
-        self.data = np.ma.resize(self.data, self.last_row_index)
+        self._merge_chunks()
 
     def get_column(self, column):
-        return self.data.data[self._get_colum_name(column)]
+        return self._get_column(column)[0]
 
     def select(self, columns=None, filters=[]):
         """ Select columns and filter data.
@@ -119,23 +201,86 @@ class Table(object):
         index of column, the second one is a compare function, and the last
         is compared value.
         """
-        if columns is not None:
-            if not isinstance(columns, list):
-                columns = [columns]
-            columns = [self._get_colum_name(column) for column in columns]
+        return self._select_columns(self._filter_rows(filters), columns)
+
+    def group_by(self, keys, columns=None, filters=[]):
+        """ Splits rows into groups by values of key columns in one pass.
+
+        Returns a dictionary that maps values of keys (a tuple of values when
+        keys is a list) to the same data as 'select' returns when it gets
+        also filters for equality of keys. Groups without rows are empty,
+        rows with an invalid value of a key are not in any group.
+
+        Arguments:
+        keys -- a name or index of a column or a list of them
+        columns -- columns of groups (see 'select')
+        filters -- filters of rows (see 'select')
+        """
+        single_key = not isinstance(keys, list)
+        if single_key:
+            keys = [keys]
+        keys = map(self._get_column, keys)
+
+        rows = np.flatnonzero(self._filter_rows(filters))
+        for values, mask in keys:
+            rows = rows[~mask[rows]]
 
+        key_values = [values[rows] for values, mask in keys]
+        order = np.lexsort(key_values[::-1]) # stable, rows keep their order
+        key_values = [values[order] for values in key_values]
+        starts = np.zeros(len(order), dtype=bool)
+        starts[:1] = True
+        for values in key_values:
+            starts[1:] |= values[1:] != values[:-1]
+        starts = np.flatnonzero(starts)
+        ends = list(starts[1:]) + [len(order)]
+
+        selected = self._select_columns(rows[order], columns)
+        empty = selected[:0]
+        groups = collections.defaultdict(lambda: empty)
+        for start, end in zip(starts, ends):
+            key = tuple(values[start].tolist() for values in key_values)
+            if single_key:
+                key = key[0]
+            groups[key] = selected[start:end]
+        return groups
+
+    def _filter_rows(self, filters):
+        """ Returns a boolean array of rows that pass filters """
         if not isinstance(filters, list):
             filters = [filters]
 
-        mask = np.ma.ones(self.last_row_index, dtype='bool')
+        rows = np.ma.ones(self.last_row_index, dtype='bool')
         for col, f_cmp, value in filters:
-            mask &= f_cmp(self.data[self._get_colum_name(col)], value)
+            values, mask = self._get_column(col)
+            rows &= f_cmp(np.ma.array(values, mask=mask), value)
+        return np.ma.getdata(rows)
 
+    def _select_columns(self, rows, columns):
+        """ Returns a masked array with selected rows (None = all rows)
+            of columns; one column is returned as a one-dimensional array """
         if columns is None:
-            return self.data[mask]
-        elif len(columns) == 1:
-            columns = columns[0]
-        return self.data[mask][columns]
+            columns = self.header
+        elif not isinstance(columns, list):
+            columns = [columns]
+        single = len(columns) == 1 and columns is not self.header
+        columns = [self._get_colum_name(column) for column in columns]
+        arrays = map(self._get_column, columns)
+        if rows is not None:
+            arrays = [ (values[rows], mask[rows]) for values, mask in arrays ]
+
+        if single:
+            values, mask = arrays[0]
+            return np.ma.array(values, mask=mask)
+
+        if not columns:
+            return np.ma.zeros((0,), dtype=self.columns)
+        types = [ self.types[self.header.index(column)] for column in columns ]
+        data = np.ma.zeros((len(arrays[0][0]),), dtype=zip(columns, types))
+        for column, (values, mask) in zip(columns, arrays):
+            data.data[column] = values
+            data.mask[column] = mask
+        return data
 
     def _get_colum_name(self, column):
         if isinstance(column, int) and 0 <= column < self.columns_number:
@@ -144,4 +289,3 @@ class Table(object):
             return column
         else:
             raise Exception("Invalid '{0}' column.".format(column))
-
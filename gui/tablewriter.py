@@ -0,0 +1,137 @@
+#
+#    Copyright (C) 2014 Stanislav Bohm
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import csv
+import ast
+import numpy as np
+
+binary_magic = "KTABLE 1\n"
+
+class TableWriter:
+    """ Has the same interface for adding rows as Table, but rows are
+        collected into chunks of a fixed size and each full chunk is written
+        into a stream. Hence the memory usage does not depend on the
+        number of rows.
+
+        Subclasses write the format: 'write_header' (optional) and
+        'write_chunk' that gets a masked array with rows of the chunk. """
+
+    def __init__(self, stream, chunk_size=65536):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.header = None
+        self.types = None
+        self.chunk = None
+        self.chunk_rows = 0
+        self.rows_count = 0
+
+    def start(self, columns):
+        """ Sets columns (a list of couples (name, data type))
+            and writes the beginning of the output """
+        self.header, self.types = map(list, zip(*columns))
+        self.chunk = np.ma.zeros((self.chunk_size,), dtype=columns)
+        self.write_header()
+
+    def add_row(self, row):
+        assert len(row) == len(self.header), \
+               "The row has to have the same length as the table has columns."
+        self.chunk.mask[self.chunk_rows] = tuple(item is None for item in row)
+        self.chunk.data[self.chunk_rows] = tuple(0 if item is None else item
+                                                 for item in row)
+        self.chunk_rows += 1
+        self.rows_count += 1
+        if self.chunk_rows == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunk_rows:
+            self.write_chunk(self.chunk[:self.chunk_rows])
+            self.chunk_rows = 0
+        self.stream.flush()
+
+    def trim(self):
+        # Table compatible name for finishing of the output
+        self.flush()
+
+    def __len__(self):
+        return self.rows_count
+
+    def write_header(self):
+        pass
+
+
+class CsvWriter(TableWriter):
+
+    def __init__(self, stream, delimiter=",", quotechar="\"",
+                 has_header=True, has_types=False, chunk_size=65536):
+        TableWriter.__init__(self, stream, chunk_size)
+        self.csvwriter = csv.writer(stream, delimiter=delimiter, quotechar=quotechar)
+        self.has_header = has_header
+        self.has_types = has_types
+
+    def write_header(self):
+        if self.has_types:
+            self.csvwriter.writerow(self.types)
+        if self.has_header:
+            self.csvwriter.writerow(self.header)
+
+    def write_chunk(self, chunk):
+        # masked values are written as empty fields
+        self.csvwriter.writerows(
+            [ None if masked else item for item, masked in zip(data, mask) ]
+            for data, mask in zip(chunk.data.tolist(),
+                                  np.ma.getmaskarray(chunk).tolist()))
+
+
+class BinaryWriter(TableWriter):
+    """ Writes a columnar binary format. The output starts with the line
+        binary_magic and the line with the list of columns (Python literal).
+        Each chunk follows as the number of rows (<u8), the data of each column
+        and the masks of each column (one byte per value). """
+
+    def write_header(self):
+        self.stream.write(binary_magic)
+        self.stream.write(repr(zip(self.header, self.types)) + "\n")
+
+    def write_chunk(self, chunk):
+        mask = np.ma.getmaskarray(chunk)
+        self.stream.write(np.array(len(chunk), dtype="<u8").tostring())
+        for name in self.header:
+            self.stream.write(np.ascontiguousarray(chunk.data[name]).tostring())
+        for name in self.header:
+            self.stream.write(np.ascontiguousarray(mask[name]).tostring())
+
+
+def read_binary(stream):
+    """ Reads the output of BinaryWriter, yields chunks as masked arrays """
+    if stream.readline() != binary_magic:
+        raise Exception("Invalid format of binary table")
+    columns = [ (str(name), str(t)) for name, t in ast.literal_eval(stream.readline()) ]
+    while True:
+        count = stream.read(8)
+        if not count:
+            return
+        count = int(np.fromstring(count, dtype="<u8")[0])
+        chunk = np.ma.zeros((count,), dtype=columns)
+        for name, t in columns:
+            size = np.dtype(t).itemsize * count
+            chunk.data[name] = np.fromstring(stream.read(size), dtype=t)
+        for name, t in columns:
+            chunk.mask[name] = np.fromstring(stream.read(count), dtype=bool)
+        yield chunk
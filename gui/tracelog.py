@@ -19,10 +19,20 @@
 #
 
 import xml.etree.ElementTree as xml
+import os
+import mmap
+import heapq
+import bisect
+import collections
+import zipfile
+import shutil
+import tempfile
+import multiprocessing
 import utils
 import loader
 import struct
 import controlseq
+import numpy as np
 
 from table import Table
 from runinstance import RunInstance
@@ -30,11 +40,56 @@ from exportri import ExportRunInstance, place_counter_name
 
 zero_char = chr(0)
 
+# Has to be increased when the content of the cache file is changed
+cache_version = 2
+
+def map_file(filename):
+    """ Returns a read-only memory map of the file; its pages are loaded
+        by the system only when they are accessed """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return "" # An empty file cannot be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+timeline_columns = [("process", "<i4"), ("pointer", "<i8")] # pointers are byte offsets
+
+def create_timeline(processes, pointers):
+    data = np.ma.zeros((len(processes),), dtype=timeline_columns)
+    data["process"] = processes
+    data["pointer"] = pointers
+    return Table.create_from_data(data)
+
 class TraceLog:
 
-    def __init__(self, filename, export_data=False):
+    # Starting a pool of processes takes longer than decoding
+    # of smaller traces, so they are decoded in this process
+    parallel_decode_size = 4 * 1024 * 1024 # bytes of all traces
+
+    def __init__(self,
+                 filename,
+                 export_data=False,
+                 checkpoint_interval=1000,
+                 checkpoint_budget=10000000,
+                 recent_size=32,
+                 use_cache=True,
+                 decode_processes=None):
+        """
+        Arguments:
+        filename -- a name of .kth file
+        export_data -- export the table with data of the tracelog
+        checkpoint_interval -- the initial number of visible events between
+                               two stored run instances
+        checkpoint_budget -- the maximal number of tokens and packets kept
+                             in stored run instances
+        recent_size -- the number of recently shown run instances that are kept
+        use_cache -- load results of preprocessing from the cache file next
+                     to the tracelog (and create it when it is not valid)
+        decode_processes -- the number of processes that decode traces,
+                            None = the number of CPUs
+        """
         self.filename = filename
         self.export_data = export_data
+        self.decode_processes = decode_processes
         self._read_header()
 
         self.traces = [None] * self.process_count
@@ -42,8 +97,16 @@ class TraceLog:
             self._read_trace(process_id)
 
         self.first_runinstance = RunInstance(self.project, self.process_count)
+        self.checkpoints = Checkpoints(self.first_runinstance,
+                                       checkpoint_interval,
+                                       checkpoint_budget)
+        self.recent_runinstances = collections.OrderedDict()
+        self.recent_size = recent_size
 
-        self._preprocess()
+        if not use_cache or not self._load_cache():
+            self._preprocess()
+            if use_cache:
+                self._store_cache()
 
     def execute_visible_events(self, ri, from_event=0, to_event=None):
         if to_event is None:
@@ -66,8 +129,23 @@ class TraceLog:
         return ri
 
     def get_event_runinstance(self, index):
-        return self.execute_visible_events(
-            self.first_runinstance.copy(), 0, index)
+        """ Returns the state after 'index' visible events. The returned
+            instance is shared by the cache and it must not be modified. """
+        runinstance = self.recent_runinstances.pop(index, None)
+        if runinstance is None:
+            # Start from the nearest known state before the index
+            start, runinstance = self.checkpoints.find(index)
+            for i in self.recent_runinstances:
+                if start < i < index:
+                    start, runinstance = i, self.recent_runinstances[i]
+            runinstance = runinstance.copy()
+            for i in xrange(start, index):
+                self.execute_visible_events(runinstance, i, i + 1)
+                self.checkpoints.add(i + 1, runinstance)
+        self.recent_runinstances[index] = runinstance
+        if len(self.recent_runinstances) > self.recent_size:
+            self.recent_runinstances.popitem(last=False)
+        return runinstance
 
     def get_event_process(self, index):
         if index == 0:
@@ -100,24 +178,53 @@ class TraceLog:
     def get_max_time(self):
         return self.get_event_time(len(self.timeline))
 
+    def create_export_runinstance(self, writer=None):
+        """ Returns ExportRunInstance that exports all traced data """
+        place_counters = [place_counter_name(p)
+                          for p in self.project.nets[0].places()
+                          if p.trace_tokens]
+
+        return ExportRunInstance(
+            self,
+            [ t for t in self.project.nets[0].transitions() if t.trace_fire ],
+            [ (p, i) for p in self.project.nets[0].places()
+                     for i, tracing in enumerate(p.trace_tokens_functions)
+                     if tracing.return_numpy_type != 'O' ],
+            ExportRunInstance.basic_header + place_counters,
+            writer)
+
     def export_sequence(self, index):
         time = utils.time_to_string(self.get_event_time(index))
         name = "Tracelog upto {0}".format(time)
         sequence = controlseq.ControlSequence(name)
-        ri = self.first_runinstance.copy()
-        for i in xrange(index):
-            event_pointer = self.timeline[i]
-            trace = self.traces[event_pointer["process"]]
-            trace.pointer = event_pointer["pointer"]
-            trace.process_event(ri)
-            if ri.last_event == "fire":
-                sequence.add_transition_start(ri.last_event_process,
-                                              ri.last_event_activity.transition.get_name())
-            elif ri.last_event == "finish":
-                sequence.add_transition_finish(ri.last_event_process)
-            elif ri.last_event == "receive":
-                sequence.add_receive(ri.last_event_process,
-                                     ri.last_event_activity.origin_id)
+
+        # The sequence depends only on decoded events, no replay is needed
+        processes = self.timeline.get_column("process")[:index]
+        pointers = self.timeline.get_column("pointer")[:index]
+        types = np.zeros(index, dtype="|S1")
+        ids = np.zeros(index, dtype="<i4")
+        quits = np.zeros(index, dtype=bool)
+        for trace in self.traces:
+            events = trace.decode_events()
+            selected = processes == trace.process_id
+            positions = np.searchsorted(events.pointers, pointers[selected])
+            types[selected] = events.types[positions]
+            ids[selected] = events.ids[positions]
+            quits[selected] = events.quits[positions]
+
+        net = self.first_runinstance.net
+        for t, process_id, id, quit in zip(types, processes.tolist(), ids.tolist(), quits):
+            if t == "S":
+                net = self.project.find_net(id)
+            elif quit:
+                continue
+            elif t == "T":
+                sequence.add_transition_start(process_id,
+                                              net.item_by_id(id).get_name())
+            elif t == "F":
+                sequence.add_transition_finish(process_id)
+            elif t == "R":
+                sequence.add_receive(process_id, id)
         return sequence
 
     def _read_header(self):
@@ -128,69 +235,322 @@ class TraceLog:
             x = xml.fromstring(f.read())
             self.project = loader.load_project_from_xml(x, "")
 
-    def _read_trace(self, process_id):
-        filename = "{0}-{1}-0.ktt".format(
+    def _get_trace_filename(self, process_id):
+        return "{0}-{1}-0.ktt".format(
             utils.trim_filename_suffix(self.filename),
             process_id)
-        with open(filename, "rb") as f:
-            trace = Trace(f.read(), process_id, self.pointer_size)
-            self.traces[process_id] = trace
+
+    def _read_trace(self, process_id):
+        filename = self._get_trace_filename(process_id)
+        trace = Trace(map_file(filename), process_id, self.pointer_size)
+        self.traces[process_id] = trace
+
+    def _get_cache_filename(self):
+        return utils.trim_filename_suffix(self.filename) + "-cache.npz"
+
+    def _get_cache_key(self):
+        """ The cache is valid only for trace files with the same
+            sizes and modification times """
+        filenames = [ self.filename ] + [ self._get_trace_filename(i)
+                                         for i in xrange(self.process_count) ]
+        key = [ cache_version ]
+        for filename in filenames:
+            stat = os.stat(filename)
+            key.append((stat.st_size, stat.st_mtime))
+        return repr(key)
+
+    def _load_cache(self):
+        """ Loads results of _preprocess from the cache file, returns False
+            when there is no valid cache """
+        try:
+            with np.load(self._get_cache_filename(), allow_pickle=False) as cache:
+                if str(cache["key"]) != self._get_cache_key() or \
+                        (self.export_data and "data" not in cache.files):
+                    return False
+                for trace, offset in zip(self.traces, cache["time_offsets"]):
+                    trace.time_offset = int(offset)
+                full_timeline = cache["full_timeline"]
+                timeline = cache["timeline"]
+                self.full_timeline = create_timeline(full_timeline["process"],
+                                                     full_timeline["pointer"])
+                self.timeline = create_timeline(timeline["process"],
+                                                timeline["pointer"])
+                self.missed_receives = int(cache["missed_receives"])
+                self.data = Table([], 0)
+                if self.export_data:
+                    self.data = Table.create_from_data(
+                        np.ma.array(cache["data"], mask=cache["data_mask"]))
+                return True
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+            return False
+
+    def _store_cache(self):
+        filename = self._get_cache_filename()
+        arrays = {
+            "key": np.array(self._get_cache_key()),
+            "time_offsets": np.array([ trace.time_offset for trace in self.traces ],
+                                     dtype="<u8"),
+            "full_timeline": self.full_timeline.data.data,
+            "timeline": self.timeline.data.data,
+            "missed_receives": np.array(self.missed_receives),
+        }
+        if self.export_data:
+            arrays["data"] = self.data.data.data
+            arrays["data_mask"] = np.ma.getmaskarray(self.data.data)
+        try:
+            # Write into a temporary file first, so a reader
+            # never sees a partially written cache
+            with open(filename + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            os.rename(filename + ".tmp", filename)
+        except (IOError, OSError):
+            pass # The cache is only an optimization, e.g. the directory may be read-only
 
     def _preprocess(self):
         # Set time offsets
         starttime = min([ trace.get_init_time() for trace in self.traces ])
         for trace in self.traces:
             trace.time_offset = trace.get_init_time() - starttime
-        trace_times = [ trace.get_next_event_time() for trace in self.traces ]
-
-        if self.export_data:
-            place_counters = [place_counter_name(p)
-                              for p in self.project.nets[0].places()
-                              if p.trace_tokens]
-
-            ri = ExportRunInstance(
-                self,
-                [ t for t in self.project.nets[0].transitions() if t.trace_fire ],
-                [ (p, i) for p in self.project.nets[0].places()
-                         for i, tracing in enumerate(p.trace_tokens_functions)
-                         if tracing.return_numpy_type != 'O' ],
-                ExportRunInstance.basic_header + place_counters)
-        else:
-            ri = RunInstance(
-                self.project, self.process_count)
-
-        index = 0
-        timeline = Table([("process", "<i4"), ("pointer", "<i4")], 100)
-        full_timeline = Table([("process", "<i4"), ("pointer", "<i4")], 100)
-        while True:
-
-            # Searching for trace with minimal event time
-            minimal_time_index = utils.index_of_minimal_value(trace_times)
-            if minimal_time_index is None:
-                break
-
-            trace = self.traces[minimal_time_index]
 
-            full_timeline.add_row((minimal_time_index, trace.pointer))
+        events = self._decode_traces()
+        processes, indexes = self._merge_timelines(events)
 
-            # Timeline update
-            if trace.is_next_event_visible():
-                timeline.add_row(full_timeline[index])
+        pointers = np.zeros(len(processes), dtype="<i8")
+        visible = np.zeros(len(processes), dtype=bool)
+        for process_id, trace_events in enumerate(events):
+            selected = processes == process_id
+            pointers[selected] = trace_events.pointers[indexes[selected]]
+            visible[selected] = trace_events.get_visible_mask()[indexes[selected]]
 
-            trace.process_event(ri)
-            trace_times[minimal_time_index] = trace.get_next_event_time()
+        self.full_timeline = create_timeline(processes, pointers)
+        self.timeline = create_timeline(processes[visible], pointers[visible])
 
-            index += 1
+        self.missed_receives, receives_on_debt = self._check_receives(
+            events, processes, indexes)
 
         self.data = Table([], 0)
         if self.export_data:
+            ri = self.create_export_runinstance()
+
+            # The export goes through all events, so checkpoints for seeking
+            # in the replay are taken on the way. A receive without a sent
+            # packet does not set the last event instance, so invisible events
+            # can change the replay in such case and checkpoints are not taken.
+            visible_count = 0
+            for i in xrange(len(processes)):
+                self.execute_all_events(ri, i, i + 1)
+                if visible[i] and receives_on_debt == 0:
+                    visible_count += 1
+                    self.checkpoints.add(visible_count, ri)
             self.data = ri.get_table()
 
-        timeline.trim()
-        full_timeline.trim()
-        self.timeline, self.full_timeline = timeline, full_timeline
+    def _decode_traces(self):
+        """ Decodes all traces; traces are independent,
+            so large traces are decoded in parallel """
+        processes = self.decode_processes
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        processes = min(processes, self.process_count)
+        size = sum(len(trace.data) for trace in self.traces)
+        if processes > 1 and size >= self.parallel_decode_size:
+            # Workers write decoded arrays into files that are mapped here,
+            # so arrays are not pickled and sent through pipes
+            directory = tempfile.mkdtemp(prefix="kaira-tracelog-")
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(decode_trace,
+                                   [ (self._get_trace_filename(trace.process_id),
+                                      trace.process_id,
+                                      self.pointer_size,
+                                      directory)
+                                     for trace in self.traces ])
+                for trace, (filename, layouts) in zip(self.traces, results):
+                    trace.events = load_trace_events(filename, layouts)
+            finally:
+                pool.close()
+                pool.join()
+                # Mapped files stay readable after they are removed
+                shutil.rmtree(directory, ignore_errors=True)
+        return [ trace.decode_events() for trace in self.traces ]
+
+    def _merge_timelines(self, events):
+        """ Returns the global order of events as two arrays: process ids and
+            indexes of events in the process' trace. Events with the same time
+            are ordered by process ids. """
+        trace_times = [ trace_events.times + np.uint64(trace.time_offset)
+                        for trace, trace_events in zip(self.traces, events) ]
+        sizes = [ len(times) for times in trace_times ]
+        processes = np.repeat(np.arange(self.process_count, dtype="<i4"), sizes)
+        indexes = np.concatenate([ np.arange(size, dtype="<i8")
+                                   for size in sizes ])
+
+        if all(np.all(times[1:] >= times[:-1]) for times in trace_times):
+            # When each trace is ordered by time, sorting all events
+            # by (time, process, index) is the same as merging traces
+            order = np.lexsort((indexes, processes, np.concatenate(trace_times)))
+            return processes[order], indexes[order]
+
+        # Some time goes backward in a trace, so events have to be
+        # really merged in the order given by traces
+        trace_times = [ times.tolist() for times in trace_times ]
+        heap = [ (times[0], process_id)
+                 for process_id, times in enumerate(trace_times) if times ]
+        heapq.heapify(heap)
+        positions = [ 0 ] * self.process_count
+        index = 0
+        while heap:
+            process_id = heap[0][1]
+            position = positions[process_id]
+            processes[index] = process_id
+            indexes[index] = position
+            index += 1
+
+            position += 1
+            positions[process_id] = position
+            times = trace_times[process_id]
+            if position < len(times):
+                heapq.heapreplace(heap, (times[position], process_id))
+            else:
+                heapq.heappop(heap)
+        return processes, indexes
+
+    def _check_receives(self, events, processes, indexes):
+        """ Returns the number of sends that were matched with a receive that
+            occurred sooner in the timeline (the same what RunInstance counts)
+            and the number of receives that occurred before their sends. """
+        count = self.process_count
+        channels, positions, orders, changes = [], [], [], []
+        for process_id, trace_events in enumerate(events):
+            selected = np.nonzero(processes == process_id)[0]
+            ranks = np.zeros(len(trace_events.types), dtype="<i8")
+            ranks[indexes[selected]] = selected
+
+            receives = np.nonzero(trace_events.types == "R")[0]
+            channels.append(process_id * count +
+                            trace_events.ids[receives].astype("<i8"))
+            positions.append(ranks[receives])
+            orders.append(np.zeros(len(receives), dtype="<i8") - 1)
+            changes.append(np.zeros(len(receives), dtype="<i8") - 1)
+
+            sends = trace_events.sends
+            channels.append(sends["target"].astype("<i8") * count + process_id)
+            positions.append(ranks[sends["event"]])
+            orders.append(np.arange(len(sends), dtype="<i8"))
+            changes.append(np.ones(len(sends), dtype="<i8"))
+
+        channels = np.concatenate(channels)
+        if len(channels) == 0:
+            return 0, 0
+        changes = np.concatenate(changes)
+        order = np.lexsort((np.concatenate(orders),
+                            np.concatenate(positions),
+                            channels))
+        channels, changes = channels[order], changes[order]
+
+        # Number of waiting packets (negative for waiting receives)
+        # before each operation, computed separately for each channel
+        balance = np.cumsum(changes) - changes
+        starts = np.ones(len(channels), dtype=bool)
+        starts[1:] = channels[1:] != channels[:-1]
+        balance -= balance[starts][np.cumsum(starts) - 1]
+        return (int(np.sum((changes > 0) & (balance < 0))),
+                int(np.sum((changes < 0) & (balance <= 0))))
+
+
+def decode_trace((filename, process_id, pointer_size, directory)):
+    """ Decodes the trace file in a worker process of TraceLog; arrays are
+        written into a file in the directory and only their layouts
+        (name, dtype, shape, offset) are returned """
+    events = Trace(map_file(filename), process_id, pointer_size).decode_events()
+    output = os.path.join(directory, "{0}.events".format(process_id))
+    layouts = []
+    with open(output, "wb") as f:
+        for name in TraceEvents.arrays:
+            array = getattr(events, name)
+            offset = (f.tell() + 15) // 16 * 16 # Arrays are aligned
+            f.seek(offset)
+            array.tofile(f)
+            layouts.append((name, array.dtype, array.shape, offset))
+    return output, layouts
+
+def load_trace_events(filename, layouts):
+    """ Maps arrays written by decode_trace """
+    arrays = {}
+    for name, dtype, shape, offset in layouts:
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype) # Empty arrays cannot be mapped
+        else:
+            arrays[name] = np.asarray(np.memmap(
+                filename, dtype=dtype, mode="r", offset=offset, shape=shape))
+    return TraceEvents(arrays)
+
+
+class Replay:
+    """ Follows a position in the tracelog. Short steps forward are applied
+        in place and steps backward are undone, other moves start from
+        the nearest stored state. """
+
+    def __init__(self, tracelog, undo_limit=1000):
+        self.tracelog = tracelog
+        self.undo_limit = undo_limit
+        self.index = 0
+        self.runinstance = tracelog.first_runinstance.copy()
+        self.runinstance.enable_undo(undo_limit)
+
+    def set_index(self, index):
+        runinstance = self.runinstance
+        diff = index - self.index
+        if 0 <= diff <= self.tracelog.checkpoints.interval:
+            for i in xrange(self.index, index):
+                runinstance.begin_step()
+                self.tracelog.execute_visible_events(runinstance, i, i + 1)
+                self.tracelog.checkpoints.add(i + 1, runinstance)
+        elif diff < 0 and -diff <= len(runinstance.journal):
+            for i in xrange(-diff):
+                runinstance.undo_step()
+        else:
+            self.runinstance = self.tracelog.get_event_runinstance(index).copy()
+            self.runinstance.enable_undo(self.undo_limit)
+        self.index = index
+        return self.runinstance
+
+
+class Checkpoints:
+    """ Copies of run instances after every 'interval' visible events.
+
+        When the stored instances exceed the budget (the number of tokens
+        and packets), the interval is doubled and every other checkpoint
+        is dropped.
+    """
+
+    def __init__(self, first_runinstance, interval, budget):
+        self.interval = interval
+        self.budget = budget
+        self.indexes = [ 0 ]
+        self.runinstances = [ first_runinstance ]
+        self.sizes = [ 0 ]
+
+    def find(self, index):
+        """ Returns (index, runinstance) of the nearest checkpoint before
+            the given index """
+        i = bisect.bisect_right(self.indexes, index) - 1
+        return self.indexes[i], self.runinstances[i]
+
+    def add(self, index, runinstance):
+        if index % self.interval != 0 or index <= self.indexes[-1]:
+            return
+        runinstance = runinstance.copy()
+        self.indexes.append(index)
+        self.runinstances.append(runinstance)
+        self.sizes.append(runinstance.get_size())
 
-        self.missed_receives = ri.missed_receives
+        while sum(self.sizes) > self.budget and len(self.indexes) > 1:
+            self.interval *= 2
+            keep = [ i for i, index in enumerate(self.indexes)
+                     if index % self.interval == 0 ]
+            self.indexes = [ self.indexes[i] for i in keep ]
+            self.runinstances = [ self.runinstances[i] for i in keep ]
+            self.sizes = [ self.sizes[i] for i in keep ]
 
 
 class Trace:
@@ -207,6 +567,12 @@ class Trace:
     struct_int = struct.Struct("<i")
     struct_double = struct.Struct("<d")
 
+    # Sizes of items with a fixed size for both sizes of token structs
+    item_sizes = dict((token_size, { "T": 13, "F": 9, "R": 13, "S": 13,
+                                     "I": 9, "Q": 9, "X": 9, "i": 5, "d": 9,
+                                     "t": token_size + 1, "r": token_size + 1 })
+                      for token_size in (struct_token_4.size, struct_token_8.size))
+
     def __init__(self, data, process_id, pointer_size):
         self.data = data
         self.pointer = 0
@@ -219,6 +585,8 @@ class Trace:
         else:
             Exception("Invalid pointer size")
         self.info = self._read_header()
+        self.data_start = self.pointer
+        self.events = None
 
     def get_init_time(self):
         s = self.info.get("inittime")
@@ -251,6 +619,106 @@ class Trace:
         elif t == "H" or t == "Q": # "H" for backward compatability
             return "Quit "
 
+    def decode_events(self):
+        """ Decodes all events of the trace into columnar arrays (TraceEvents).
+
+            The trace is split into items (headers of events, tokens, values,
+            sends, ...); all items except strings and sends have a fixed size
+            given by their type. Boundaries of events are then found among
+            the items by NumPy and their fields are extracted by NumPy too.
+        """
+        if self.events is not None:
+            return self.events
+
+        data = self.data
+        size = len(data)
+        find = data.find
+        send_size = self.struct_send.size + 1
+        count_offset = send_size - self.struct_int.size
+        unpack_int = self.struct_int.unpack_from
+        item_sizes = self.item_sizes[self.struct_token.size]
+
+        items = [] # positions of items
+        append = items.append
+        pointer = self.data_start
+        while pointer < size:
+            t = data[pointer]
+            append(pointer)
+            item_size = item_sizes.get(t)
+            if item_size is not None:
+                pointer += item_size
+            elif t == "s":
+                pointer = find(zero_char, pointer + 1) + 1 or size
+            elif t == "M":
+                pointer += send_size + 4 * unpack_int(data, pointer + count_offset)[0]
+            else:
+                raise Exception("Invalid event type '{0}/{1}' (pointer={2}, process={3})"
+                                    .format(t, ord(t), hex(pointer), self.process_id))
+
+        self.events = self._decode_items(np.array(items, dtype="<i8"))
+        return self.events
+
+    def _decode_items(self, items):
+        """ Returns TraceEvents of the trace split into items """
+        buffer = np.frombuffer(self.data, dtype=np.uint8)
+        item_types = buffer[items].view("|S1")
+        item_indexes = np.arange(len(items))
+
+        # 'Q' is a part of the preceding 'T' or 'F' when there are
+        # only traced values and removed tokens between them
+        headers = np.in1d(item_types, list("TFRSI"))
+        last_headers = np.maximum.accumulate(np.where(headers, item_indexes, -1))
+        breaks = np.in1d(item_types, list("tMXQ"))
+        last_breaks = np.maximum.accumulate(np.where(breaks, item_indexes, -1))
+        last_breaks = np.concatenate(([ -1 ], last_breaks))[:-1]
+        header_types = item_types[np.maximum(last_headers, 0)]
+        inner_quits = (item_types == "Q") & (last_headers > last_breaks) & \
+                      ((header_types == "T") | (header_types == "F"))
+        starts = headers | ((item_types == "Q") & ~inner_quits)
+        if len(items) and not starts[0]:
+            raise Exception("Invalid event type '{0}' (pointer={1}, process={2})"
+                                .format(item_types[0], hex(items[0]), self.process_id))
+        item_events = np.cumsum(starts) - 1
+
+        pointers = items[starts]
+        types = item_types[starts]
+        ids = np.zeros(len(pointers), dtype="<i4") - 1
+        with_id = (types == "T") | (types == "R") | (types == "S")
+        ids[with_id] = gather(buffer, pointers[with_id] + 9, "<i4")
+        quits = np.zeros(len(pointers), dtype=bool)
+        quits[item_events[inner_quits]] = True
+
+        # The replay processes sends right after removed tokens of 'T' twice
+        # (with removed and with added tokens), so they are repeated here too
+        others = ~np.in1d(item_types, list("rM"))
+        last_others = np.maximum.accumulate(np.where(others, item_indexes, -1))
+        send_items = np.nonzero(item_types == "M")[0]
+        repeated = send_items[(last_others[send_items] == last_headers[send_items]) &
+                              (header_types[send_items] == "T")]
+        send_items = np.concatenate((repeated, send_items))
+        send_items = send_items[np.lexsort((send_items,
+                                            np.arange(len(send_items)) >= len(repeated),
+                                            item_events[send_items]))]
+        counts = gather(buffer, items[send_items] + 21, "<i4").astype("<i8")
+        sends = np.zeros(counts.sum(), dtype=TraceEvents.send_columns)
+        if len(sends):
+            positions = np.repeat(items[send_items], counts)
+            target_indexes = np.arange(len(sends)) - \
+                             np.repeat(np.cumsum(counts) - counts, counts)
+            sends["event"] = np.repeat(item_events[send_items], counts)
+            sends["time"] = gather(buffer, positions + 1, "<u8")
+            sends["size"] = gather(buffer, positions + 9, "<u8")
+            sends["edge"] = gather(buffer, positions + 17, "<i4")
+            sends["target"] = gather(
+                buffer, positions + 25 + target_indexes * 4, "<i4")
+
+        return TraceEvents({ "pointers": pointers,
+                             "types": types,
+                             "times": gather(buffer, pointers + 1, "<u8"),
+                             "ids": ids,
+                             "quits": quits,
+                             "sends": sends })
+
     def process_event(self, runinstance):
         t = self.data[self.pointer]
         self.pointer += 1
@@ -494,3 +962,40 @@ class Trace:
             else:
                 break
         return values
+
+
+class TraceEvents:
+    """ Columnar representation of events of one thread trace.
+
+    types -- characters of events ('T', 'F', 'R', 'S', 'I', 'Q')
+    times -- times of events (without the time offset of the trace)
+    ids -- transition id ('T'), net id ('S'), origin id ('R'), otherwise -1
+    quits -- True for events 'T' and 'F' that contain quit of the process
+    pointers -- positions of events in the trace data
+    sends -- send records (one per target); fields: event, time, size,
+             edge, target
+    """
+
+    send_columns = [("event", "<i8"), ("time", "<u8"), ("size", "<u8"),
+                    ("edge", "<i4"), ("target", "<i4")]
+
+    arrays = ("pointers", "types", "times", "ids", "quits", "sends")
+
+    def __init__(self, arrays):
+        for name in self.arrays:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.types)
+
+    def get_visible_mask(self):
+        return (self.types != "I") & (self.types != "M") & (self.types != "N")
+
+
+def gather(buffer, positions, dtype):
+    """ Reads values of the given type stored at positions in the buffer """
+    dtype = np.dtype(dtype)
+    if len(positions) == 0:
+        return np.zeros(0, dtype=dtype)
+    indexes = positions[:, np.newaxis] + np.arange(dtype.itemsize)
+    return buffer[indexes].view(dtype).reshape(len(positions))
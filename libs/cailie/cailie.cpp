@@ -363,7 +363,7 @@ Process * ca::get_first_process()
 	#endif
 }
 
-void ca::write_header(FILE *out, int process_count)
+void ca::write_header(FILE *out, int process_count, bool framing)
 {
 	int lines = 1;
 	for (const char *c = project_description_string; (*c) != 0; c++) {
@@ -377,6 +377,9 @@ void ca::write_header(FILE *out, int process_count)
 	output.set("pointer-size", (int) sizeof(void*));
 	output.set("process-count", process_count);
 	output.set("description-lines", lines);
+	if (framing) {
+		output.set("framing", "binary");
+	}
 	output.back();
 	fputs("\n", out);
 	fputs(project_description_string, out);
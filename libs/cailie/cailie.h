@@ -48,7 +48,7 @@ Net *get_main_net();
 /* This method is used by module to send tokens to another process. n be called after spawn_toplevel_net*/
 Process * get_first_process();
 
-void write_header(FILE *out, int process_count);
+void write_header(FILE *out, int process_count, bool framing = false);
 
 extern int process_count;
 extern int threads_count;
@@ -5,6 +5,8 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <stdint.h>
+#include <sstream>
 
 #include <sys/socket.h>
 #include <netdb.h>
@@ -42,15 +44,6 @@ static int init_listen_socket(int port)
 	return sock;
 }
 
-void write_status(FILE *out, bool status)
-{
-	if (status) {
-		fprintf(out, "Ok\n");
-	} else {
-		fprintf(out, "No\n");
-	}
-}
-
 int Listener::get_port()
 {
 	// If -s was "auto" then print port number at stdout
@@ -131,8 +124,9 @@ void Listener::main()
 
 		/* Wait for all process */
 		pthread_barrier_wait(&barrier1);
-		write_header(comm_out, process_count);
+		write_header(comm_out, process_count, true);
 
+		framed = false;
 		prepare_state();
 		process_commands(comm_in, comm_out);
 		cleanup_state();
@@ -160,19 +154,28 @@ static bool check_prefix(const char *s, const char *prefix)
 }
 
 #define LINE_LENGTH_LIMIT 4096
+static bool read_line(FILE *comm_in, char *line)
+{
+	char *s = fgets(line, LINE_LENGTH_LIMIT, comm_in);
+	if (s == NULL) {
+		return false;
+	}
+
+	// remove \r and \n from the end
+	size_t t = strlen(s) - 1;
+	while(t > 0 && (s[t] == '\n' || s[t] == '\r')) { s[t] = 0; t--; }
+	return true;
+}
+
 void Listener::process_commands(FILE *comm_in, FILE *comm_out)
 {
 	char line[LINE_LENGTH_LIMIT];
 	for(;;) {
 		fflush(comm_out);
-		char *s = fgets(line, LINE_LENGTH_LIMIT, comm_in);
-		if (s == NULL) {
+		if (!read_line(comm_in, line)) {
 			return;
 		}
 
-		// remove \r and \n from the end
-		size_t t = strlen(s) - 1;
-		while(t > 0 && (s[t] == '\n' || s[t] == '\r')) { s[t] = 0; t--; }
 		if (!strcmp(line, "QUIT")) {
 			exit(0);
 			return;
@@ -182,93 +185,231 @@ void Listener::process_commands(FILE *comm_in, FILE *comm_out)
 			return;
 		}
 
-		if (!strcmp(line, "REPORTS")) {
-			state->write_reports(comm_out);
-			fprintf(comm_out, "\n");
+		if (check_prefix(line, "REPORTS")) {
+			// "REPORTS <id>" where <id> is the id of the last report
+			// that the client has; only changed processes are sent then
+			int last_id = -1;
+			sscanf(line, "REPORTS %i", &last_id);
+			if (framed) {
+				char *buffer;
+				size_t size;
+				FILE *f = open_memstream(&buffer, &size);
+				if (f == NULL) {
+					perror("open_memstream");
+					exit(-1);
+				}
+				write_reports(f, last_id);
+				fclose(f);
+				write_reply(comm_out, std::string(buffer, size));
+				free(buffer);
+			} else {
+				write_reports(comm_out, last_id);
+				fprintf(comm_out, "\n");
+			}
 			fflush(stdout);
 			continue;
 		}
 
-		if (check_prefix(line, "FIRE")) {
-			if (processes[0]->quit_flag) {
-				fprintf(comm_out, "Process is terminated\n");
-				continue;
-			}
-			int transition_id;
-			int process_id;
-			int phases;
-			if (3 != sscanf(line, "FIRE %i %i %i", &transition_id, &process_id, &phases)) {
-				fprintf(comm_out, "Invalid parameters\n");
+		if (!strcmp(line, "FRAMING binary")) {
+			// The reply is still a line, all next replies are framed
+			write_reply(comm_out, "Ok");
+			framed = true;
+			// Cached reports are in the other encoding
+			process_reports.clear();
+			continue;
+		}
+
+		if (check_prefix(line, "BATCH")) {
+			// "BATCH <n>" is followed by <n> commands; commands after
+			// the first failed command are read but not executed
+			int count;
+			if (1 != sscanf(line, "BATCH %i", &count)) {
+				write_reply(comm_out, "Invalid parameters");
 				continue;
 			}
-			if (process_id < 0 || process_id >= process_count) {
-				fprintf(comm_out, "There is no such process\n");
-				continue;
+			int failed = -1;
+			std::string result;
+			for (int i = 0; i < count; i++) {
+				if (!read_line(comm_in, line)) {
+					return;
+				}
+				if (failed == -1) {
+					result = execute_command(line);
+					if (result != "Ok") {
+						failed = i;
+					}
+				}
 			}
-			TransitionDef *transition_def = state->get_net_def()->get_transition_def(transition_id);
-			if (transition_def == NULL) {
-				fprintf(comm_out, "Invalid transition\n");
-				continue;
-			}
-
-			bool result;
-			if (phases == 1) {
-				result = state->fire_transition_phase1(process_id, transition_def);
+			if (failed == -1) {
+				write_reply(comm_out, "Ok");
 			} else {
-				result = state->fire_transition_full(process_id, transition_def);
+				std::stringstream s;
+				s << "Failed " << failed << " " << result;
+				write_reply(comm_out, s.str());
 			}
-			write_status(comm_out, result);
 			continue;
 		}
 
-		if (check_prefix(line, "FINISH")) {
-			if (processes[0]->quit_flag) {
-				fprintf(comm_out, "Process is terminated\n");
-				continue;
-			}
-			int process_id;
-			if (1 != sscanf(line, "FINISH %i", &process_id)) {
-				fprintf(comm_out, "Invalid parameters\n");
-				continue;
-			}
-			if (process_id < 0 || process_id >= process_count) {
-				fprintf(comm_out, "There is no such process\n");
-				continue;
-			}
+		write_reply(comm_out, execute_command(line));
+	}
+}
 
-			if (!state->is_process_busy(process_id)) {
-				fprintf(comm_out, "There is no running transition on the given process\n");
-				continue;
-			}
+void Listener::write_reply(FILE *out, const std::string &reply)
+{
+	if (!framed) {
+		fprintf(out, "%s\n", reply.c_str());
+		return;
+	}
+	// Framed reply: 4 bytes of the length (big endian) and the data
+	uint32_t size = reply.size();
+	unsigned char header[4] = {
+		(unsigned char) (size >> 24), (unsigned char) (size >> 16),
+		(unsigned char) (size >> 8), (unsigned char) size };
+	fwrite(header, 1, 4, out);
+	fwrite(reply.c_str(), 1, reply.size(), out);
+}
 
-			Activation *a = state->get_activations()[process_id];
-			if (a->transition_def->is_blocked(a->binding)) {
-				fprintf(comm_out, "Transition waits for synchronization of collective transition\n");
-				continue;
-			}
-			state->finish_transition(process_id);
-			write_status(comm_out, true);
-			continue;
+std::string Listener::execute_command(const char *line)
+{
+	if (check_prefix(line, "FIRE")) {
+		if (processes[0]->quit_flag) {
+			return "Process is terminated";
+		}
+		int transition_id;
+		int process_id;
+		int phases;
+		if (3 != sscanf(line, "FIRE %i %i %i", &transition_id, &process_id, &phases)) {
+			return "Invalid parameters";
+		}
+		if (process_id < 0 || process_id >= process_count) {
+			return "There is no such process";
+		}
+		TransitionDef *transition_def = state->get_net_def()->get_transition_def(transition_id);
+		if (transition_def == NULL) {
+			return "Invalid transition";
 		}
 
-		if (check_prefix(line, "RECEIVE") > 0) {
-			int process_id;
-			int origin_id;
-			if (2 != sscanf(line, "RECEIVE %i %i", &process_id, &origin_id)) {
-				fprintf(comm_out, "Invalid parameters\n");
-				continue;
+		bool result;
+		if (phases == 1) {
+			result = state->fire_transition_phase1(process_id, transition_def);
+		} else {
+			result = state->fire_transition_full(process_id, transition_def);
+		}
+		return result ? "Ok" : "No";
+	}
+
+	if (check_prefix(line, "FINISH")) {
+		if (processes[0]->quit_flag) {
+			return "Process is terminated";
+		}
+		int process_id;
+		if (1 != sscanf(line, "FINISH %i", &process_id)) {
+			return "Invalid parameters";
+		}
+		if (process_id < 0 || process_id >= process_count) {
+			return "There is no such process";
+		}
+
+		if (!state->is_process_busy(process_id)) {
+			return "There is no running transition on the given process";
+		}
+
+		Activation *a = state->get_activations()[process_id];
+		if (a->transition_def->is_blocked(a->binding)) {
+			return "Transition waits for synchronization of collective transition";
+		}
+		state->finish_transition(process_id);
+		return "Ok";
+	}
+
+	if (check_prefix(line, "RECEIVE")) {
+		int process_id;
+		int origin_id;
+		if (2 != sscanf(line, "RECEIVE %i %i", &process_id, &origin_id)) {
+			return "Invalid parameters";
+		}
+		bool result = state->receive(process_id, origin_id);
+		return result ? "Ok" : "No";
+	}
+
+	return "Unknown command";
+}
+
+void Listener::write_reports(FILE *out, int last_id)
+{
+	bool delta = last_id == reports_id &&
+		static_cast<int>(process_reports.size()) == process_count;
+	reports_id++;
+	process_reports.resize(process_count);
+
+	if (framed) {
+		CompactOutput output(out);
+		output.begin_object();
+		output.key("id");
+		output.value(reports_id);
+		output.key("delta");
+		output.value(delta);
+		state->write_compact_report_attributes(output);
+		output.key("process-reports");
+		output.begin_list();
+		for (int i = 0; i < process_count; i++) {
+			bool changed = update_process_report(i);
+			if (!delta || changed) {
+				output.raw(process_reports[i]);
 			}
-			bool result = state->receive(process_id, origin_id);
-			write_status(comm_out, result);
-			continue;
 		}
+		output.end_list();
+		state->write_compact_activations_and_packets(output);
+		output.end_object();
+		return;
+	}
+
+	Output output(out);
+	output.child("report");
+	state->write_report_attributes(output);
+	output.set("id", reports_id);
+	output.set("delta", delta);
+	for (int i = 0; i < process_count; i++) {
+		bool changed = update_process_report(i);
+		if (!delta || changed) {
+			output.raw(process_reports[i]);
+		}
+	}
+	state->write_activations_and_packets(output);
+	output.back();
+}
 
-		fprintf(comm_out, "Unknown command\n");
+bool Listener::update_process_report(int i)
+{
+	char *buffer;
+	size_t size;
+	FILE *f = open_memstream(&buffer, &size);
+	if (f == NULL) {
+		perror("open_memstream");
+		exit(-1);
 	}
+	if (framed) {
+		CompactOutput output(f);
+		state->write_compact_process_report(output, i);
+	} else {
+		Output output(f);
+		state->write_process_report(output, i);
+	}
+	fclose(f);
+	std::string report(buffer, size);
+	free(buffer);
+	if (report == process_reports[i]) {
+		return false;
+	}
+	process_reports[i].swap(report);
+	return true;
 }
 
 void Listener::prepare_state()
 {
+	reports_id = 0;
+	process_reports.clear();
+
 	// Process all pending messages
 	bool again;
 	do {
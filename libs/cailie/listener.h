@@ -14,7 +14,8 @@ class Process;
 class Listener {
 	public:
 		Listener() : process_count(0), processes(NULL), listen_socket(0),
-			thread(0), start_barrier(NULL), state(NULL){}
+			thread(0), start_barrier(NULL), state(NULL), reports_id(0),
+			framed(false) {}
 		~Listener() {
 			cleanup_state();
 		}
@@ -25,6 +26,9 @@ class Listener {
 		void start();
 		void main();
 		void process_commands(FILE *comm_in, FILE *comm_out);
+		void write_reports(FILE *out, int last_id);
+		std::string execute_command(const char *line);
+		void write_reply(FILE *out, const std::string &reply);
 
 		void set_processes(int process_count, Process **processes) {
 			this->process_count = process_count;
@@ -47,6 +51,16 @@ class Listener {
 		pthread_barrier_t *start_barrier;
 		State *state;
 		std::vector<std::string> sequence;
+
+		/* Reports of processes sent in the last report (reports_id);
+		   they are used to send only changed processes */
+		int reports_id;
+		std::vector<std::string> process_reports;
+		bool update_process_report(int i);
+
+		/* Replies are sent as frames (length and data) instead of lines
+		   and reports in the compact encoding ("FRAMING binary") */
+		bool framed;
 };
 
 }
@@ -50,6 +50,11 @@ void NetBase::write_reports(ThreadBase *thread, Output &output)
 	write_reports_content(thread, output);
 }
 
+void NetBase::write_compact_reports(ThreadBase *thread, CompactOutput &output)
+{
+	write_compact_reports_content(thread, output);
+}
+
 Net::Net(NetDef *def, Thread *thread) :
 	def(def),
 	running_transitions(0),
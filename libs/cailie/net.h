@@ -165,10 +165,13 @@ class NetBase {
 			virtual void receive(ThreadBase *thread, int process, int place, Unpacker &unpacker) = 0;
 			virtual NetBase *copy() = 0;
 			void write_reports(ThreadBase *thread, Output &output);
+			void write_compact_reports(ThreadBase *thread, CompactOutput &output);
 
 			virtual ~NetBase() { };
 		protected:
 			virtual void write_reports_content(ThreadBase *thread, Output &output) = 0;
+			virtual void write_compact_reports_content(ThreadBase *thread,
+			                                           CompactOutput &output) = 0;
 };
 
 class Net : public NetBase {
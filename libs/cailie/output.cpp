@@ -69,6 +69,15 @@ void Output::text(const std::string &text)
 	fputs(v.c_str(), file);
 }
 
+void Output::raw(const std::string &data)
+{
+	if (open_tag) {
+		fprintf(file, ">");
+		open_tag = false;
+	}
+	fputs(data.c_str(), file);
+}
+
 void Output::_set(const std::string & name, const std::string & value)
 {
 	fprintf(file, " %s='%s'", name.c_str(), value.c_str());
@@ -97,3 +106,84 @@ void Output::set(const std::string & name, const size_t value)
 {
 	fprintf(file, " %s='%llu'", name.c_str(), (unsigned long long) value);
 }
+
+CompactOutput::CompactOutput(FILE *file) : file(file), first(true)
+{
+}
+
+void CompactOutput::separate()
+{
+	if (!first) {
+		fputc(',', file);
+	}
+	first = false;
+}
+
+void CompactOutput::begin_list()
+{
+	separate();
+	fputc('[', file);
+	first = true;
+}
+
+void CompactOutput::end_list()
+{
+	fputc(']', file);
+	first = false;
+}
+
+void CompactOutput::begin_object()
+{
+	separate();
+	fputc('{', file);
+	first = true;
+}
+
+void CompactOutput::end_object()
+{
+	fputc('}', file);
+	first = false;
+}
+
+void CompactOutput::key(const std::string &name)
+{
+	value(name);
+	fputc(':', file);
+	first = true;
+}
+
+void CompactOutput::value(const int i)
+{
+	separate();
+	fprintf(file, "%i", i);
+}
+
+void CompactOutput::value(const bool value)
+{
+	separate();
+	fputs(value ? "true" : "false", file);
+}
+
+void CompactOutput::value(const std::string &s)
+{
+	separate();
+	fputc('"', file);
+	for (size_t i = 0; i < s.size(); i++) {
+		unsigned char c = s[i];
+		if (c == '"' || c == '\\') {
+			fputc('\\', file);
+			fputc(c, file);
+		} else if (c < 0x20) {
+			fprintf(file, "\\u%04x", c);
+		} else {
+			fputc(c, file);
+		}
+	}
+	fputc('"', file);
+}
+
+void CompactOutput::raw(const std::string &data)
+{
+	separate();
+	fwrite(data.c_str(), 1, data.size(), file);
+}
@@ -26,6 +26,8 @@ class Output {
 		void set(const std::string &name, const bool value);
 
 		void text(const std::string &text);
+		/* Writes already formatted XML */
+		void raw(const std::string &data);
 
 	protected:
 		void _set(const std::string &name, const std::string &s);
@@ -34,6 +36,32 @@ class Output {
 		bool open_tag;
 };
 
+/* Writes lists, objects and values in JSON; it is used for the compact
+   encoding of reports on framed connections of the listener */
+class CompactOutput {
+	public:
+		CompactOutput(FILE *file);
+
+		void begin_list();
+		void end_list();
+		void begin_object();
+		void end_object();
+		void key(const std::string &name);
+		void value(const int i);
+		void value(const bool value);
+		void value(const std::string &s);
+		void value(const char *s) {
+			value(std::string(s));
+		}
+		/* Writes an already encoded value */
+		void raw(const std::string &data);
+
+	protected:
+		void separate();
+		FILE *file;
+		bool first;
+};
+
 #define CA_TOKEN_NAME(TYPE, VALUE) \
 	template<> inline std::string token_name<TYPE > (const TYPE &VALUE)
 
@@ -260,35 +260,120 @@ namespace ca {
 			void write_reports(FILE *out) {
 				Output output(out);
 				output.child("report");
+				write_report_attributes(output);
+				for (int i = 0; i < process_count; i++) {
+					write_process_report(output, i);
+				}
+				write_activations_and_packets(output);
+				output.back();
+			}
+
+			void write_report_attributes(Output &output) {
 				output.set("net-id", net_def->get_id());
 				output.set("processes", ca::process_count);
 				output.set("quit", quit);
+			}
+
+			void write_process_report(Output &output, int i) {
+				output.child("process");
+				output.set("id", i);
+				StateThread thread(this, i);
+				nets[i]->write_reports(&thread, output);
+
+				std::vector<int> enabled = get_enabled_transition_ids(i);
+				for (size_t t = 0; t < enabled.size(); t++) {
+					output.child("enabled");
+					output.set("id", enabled[t]);
+					output.back();
+				}
+				output.back();
+			}
 
+			std::vector<int> get_enabled_transition_ids(int i) {
+				std::vector<int> result;
+				if (is_process_busy(i)) {
+					return result;
+				}
+				StateThread thread(this, i);
+				const std::vector<TransitionDef*>& transitions = \
+					net_def->get_transition_defs();
+				for (size_t t = 0; t < transitions.size(); t++) {
+					if (!result.empty() && transitions[t - 1]->get_priority() !=
+							transitions[t]->get_priority()) {
+						break;
+					}
+					if (transitions[t]->is_enable(&thread, nets[i])) {
+						result.push_back(transitions[t]->get_id());
+					}
+				}
+				return result;
+			}
+
+			/* Compact encoding of reports (see CompactOutput) */
+
+			void write_compact_report_attributes(CompactOutput &output) {
+				output.key("net-id");
+				output.value(net_def->get_id());
+				output.key("processes");
+				output.value(ca::process_count);
+				output.key("quit");
+				output.value(quit);
+			}
+
+			/* [id, places, enabled transitions] */
+			void write_compact_process_report(CompactOutput &output, int i) {
+				output.begin_list();
+				output.value(i);
+				StateThread thread(this, i);
+				nets[i]->write_compact_reports(&thread, output);
+				std::vector<int> enabled = get_enabled_transition_ids(i);
+				output.begin_list();
+				for (size_t t = 0; t < enabled.size(); t++) {
+					output.value(enabled[t]);
+				}
+				output.end_list();
+				output.end_list();
+			}
+
+			/* Activations as [process, transition, blocked] and packets
+			   as [origin, target, size, edge] */
+			void write_compact_activations_and_packets(CompactOutput &output) {
+				output.key("activations");
+				output.begin_list();
 				for (int i = 0; i < process_count; i++) {
-					output.child("process");
-					StateThread thread(this, i);
-					nets[i]->write_reports(&thread, output);
-
-					if (!is_process_busy(i)) {
-						const std::vector<TransitionDef*>& transitions = \
-							net_def->get_transition_defs();
-						bool enabled = false;
-						for (size_t t = 0; t < transitions.size(); t++) {
-							if (enabled && transitions[t - 1]->get_priority() !=
-									transitions[t]->get_priority()) {
-								break;
-							}
-							if (transitions[t]->is_enable(&thread, nets[i])) {
-								enabled = true;
-								output.child("enabled");
-								output.set("id", transitions[t]->get_id());
-								output.back();
-							}
+					if (activations[i] == NULL) {
+						continue;
+					}
+					output.begin_list();
+					output.value(i);
+					output.value(activations[i]->transition_def->get_id());
+					Binding *binding = activations[i]->binding;
+					output.value(activations[i]->transition_def->is_blocked(binding));
+					output.end_list();
+				}
+				output.end_list();
+
+				output.key("packets");
+				output.begin_list();
+				for (int i = 0; i < ca::process_count; i++) {
+					for (int j = 0; j < ca::process_count; j++) {
+						PacketQueue& pq = packets[i * ca::process_count + j];
+						typename PacketQueue::iterator it;
+						for (it = pq.begin(); it != pq.end(); it++) {
+							output.begin_list();
+							output.value(j);
+							output.value(i);
+							output.value(static_cast<int>(it->size));
+							Tokens *tokens = (Tokens*) it->data;
+							output.value(tokens->edge_id);
+							output.end_list();
 						}
 					}
-					output.back();
 				}
+				output.end_list();
+			}
 
+			void write_activations_and_packets(Output &output) {
 				for (int i = 0; i < process_count; i++) {
 					if (activations[i] == NULL) {
 						continue;
@@ -317,8 +402,6 @@ namespace ca {
 						}
 					}
 				}
-				output.back();
-
 			}
 
 			bool fire_transition_phase1(int process_id, TransitionDef *transition_def)
@@ -487,10 +487,12 @@ class Place(utils.EqByIdMixin):
         return sum((edge.inscriptions for edge in self.get_edges_in()), [])
 
     def get_transitions_out(self):
-        return list(set([ edge.transition for edge in self.get_edges_out() ]))
+        return sorted(set(edge.transition for edge in self.get_edges_out()),
+                      key=lambda tr: tr.id)
 
     def get_transitions_in(self):
-        return list(set([ edge.transition for edge in self.get_edges_in() ]))
+        return sorted(set(edge.transition for edge in self.get_edges_in()),
+                      key=lambda tr: tr.id)
 
     def get_areas(self):
         return self.net.get_areas_with_place(self)
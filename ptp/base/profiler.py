@@ -0,0 +1,76 @@
+#
+#    Copyright (C) 2014 Stanislav Bohm
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import time
+import contextlib
+
+# Profiler of the running ptp, None when ptp is not profiled
+current = None
+
+def add(name, value):
+    """ Adds the value to the counter of the current profiler (if any) """
+    if current is not None:
+        current.add(name, value)
+
+
+class Profiler:
+    """ Measures wall and CPU time of phases of ptp and collects counters
+        (e.g. the time spent in the compiler) """
+
+    def __init__(self):
+        self.phases = []
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall = time.time()
+        times = os.times()
+        try:
+            yield
+        finally:
+            end = os.times()
+            self.phases.append({
+                "name" : name,
+                "wall" : time.time() - wall,
+                "cpu" : round(end[0] + end[1] - times[0] - times[1], 6),
+                # Time of finished child processes (the compiler)
+                "children_cpu" : round(end[2] + end[3] - times[2] - times[3], 6),
+            })
+
+    def add(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_record(self):
+        return { "phases" : self.phases,
+                 "counters" : self.counters,
+                 "wall" : sum(phase["wall"] for phase in self.phases) }
+
+    def write_summary(self, out):
+        out.write("{0:<12} {1:>10} {2:>10} {3:>14}\n".format(
+            "Phase", "Wall [s]", "CPU [s]", "Children [s]"))
+        for phase in self.phases:
+            out.write("{0[name]:<12} {0[wall]:>10.3f} {0[cpu]:>10.3f} {0[children_cpu]:>14.3f}\n"
+                        .format(phase))
+        out.write("{0:<12} {1:>10.3f}\n".format("Total", self.get_record()["wall"]))
+        for name in sorted(self.counters):
+            value = self.counters[name]
+            if isinstance(value, float):
+                value = "{0:.3f}".format(value)
+            out.write("{0}: {1}\n".format(name, value))
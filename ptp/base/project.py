@@ -109,7 +109,9 @@ class Project(object):
     def get_head_code(self):
         return self.head_code
 
-    def check(self):
+    def check(self, output_directory=None):
+        """ Checks the project; results of passed checks are cached
+            in the output directory when it is given """
         if self.library_octave:
             import ptp # Import here to avoid cyclyc import
             if ptp.get_config("Main", "OCTAVE") != "True":
@@ -127,7 +129,7 @@ class Project(object):
         checker = self.target_env.get_checker(self)
         for net in self.nets:
             net.check(checker)
-        checker.run()
+        checker.run(output_directory)
 
     def analyze(self):
         for net in self.nets:
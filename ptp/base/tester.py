@@ -18,7 +18,12 @@
 #
 
 import subprocess
+import multiprocessing
+import tempfile
+import time
+import os
 import re
+import profiler
 
 
 check_id_counter = 30000
@@ -28,6 +33,10 @@ def new_id():
     check_id_counter += 1
     return "____cpptest____{0}".format(check_id_counter)
 
+def reset_id():
+    global check_id_counter
+    check_id_counter = 30000
+
 
 class Check:
 
@@ -69,7 +78,7 @@ class Tester:
 
     def __init__(self):
         self.compiler = "gcc"
-        self.filename = "/tmp/kaira.cpp"
+        self.directory = None # None = the system directory for temporary files
         self.args = ()
         self.message_parser = re.compile(
             "(?P<filename>[^:]*):(?P<line>\d+):(?P<message>.*)")
@@ -77,37 +86,86 @@ class Tester:
         self.prepare_writer = None
         self.stdout = None
         self.stderr = None
+        self.returncode = None
 
     def add(self, check):
         self.checks.append(check)
 
-    def process_message(self, line):
+    def process_message(self, line, filename, checks):
         match = self.message_parser.match(line)
         if match is None:
             return
-        if match.group("filename") != self.filename:
+        if match.group("filename") != filename:
             return
         line_no = int(match.group("line"))
         message = match.group("message")
-        for check in self.checks:
+        for check in checks:
             if check.process_match(line_no, message):
                 return check
 
     def run(self):
-        assert self.prepare_writer is not None
-        writer = self.prepare_writer(self.filename)
+        """ Returns the first failing check or None """
+        failed = self.run_all(1)
+        if failed:
+            return failed[0]
+        return None
 
-        for check in self.checks:
+    def run_all(self, shards=None, jobs=None):
+        """ Splits checks into shards that are compiled by at most 'jobs'
+            concurrent compilers (None = the number of CPUs),
+            returns all failing checks """
+        assert self.prepare_writer is not None
+        if jobs is None:
+            jobs = multiprocessing.cpu_count()
+        if shards is None:
+            shards = jobs
+        shards = max(1, min(shards, len(self.checks)))
+
+        size = (len(self.checks) + shards - 1) // shards
+        pending = [ self.checks[i * size:(i + 1) * size] for i in xrange(shards) ]
+        running = []
+        failed = []
+        stdout, stderr = [], []
+        self.returncode = 0
+        start = time.time()
+        while pending or running:
+            while pending and len(running) < jobs:
+                running.append(self._start_shard(pending.pop(0)))
+            p, filename, objfile, checks = running.pop(0)
+            out, err = p.communicate()
+            stdout.append(out)
+            stderr.append(err)
+            if p.returncode != 0:
+                self.returncode = p.returncode
+            checks = list(checks)
+            for line in err.split("\n"):
+                check = self.process_message(line, filename, checks)
+                if check is not None:
+                    # Only the first message of each check is used
+                    failed.append(check)
+                    checks.remove(check)
+            for f in (filename, objfile):
+                if os.path.exists(f):
+                    os.remove(f)
+        profiler.add("compiler time", time.time() - start)
+        indexes = dict((check, i) for i, check in enumerate(self.checks))
+        failed.sort(key=indexes.get)
+        self.stdout = "".join(stdout)
+        self.stderr = "".join(stderr)
+        return failed
+
+    def _start_shard(self, checks):
+        # Each run has its own files, so more testers can run at once
+        fd, filename = tempfile.mkstemp(
+            prefix="kaira-", suffix=".cpp", dir=self.directory)
+        os.close(fd)
+        writer = self.prepare_writer(filename)
+        for check in checks:
             check.write(writer)
-
-        writer.write_to_file(self.filename)
+        writer.write_to_file(filename)
+        objfile = filename[:-4] + ".o"
         p = subprocess.Popen(("g++",) + tuple(self.args) +
-                             ("-O0", "-c", "-o", "/tmp/kaira.o", self.filename),
+                             ("-O0", "-c", "-o", objfile, filename),
                              stderr=subprocess.PIPE,
                              stdout=subprocess.PIPE)
-        self.stdout, self.stderr = p.communicate()
-        for line in self.stderr.split("\n"):
-            check = self.process_message(line)
-            if check is not None:
-                return check
-        return None
+        return p, filename, objfile, checks
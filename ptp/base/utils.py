@@ -18,6 +18,10 @@
 #
 
 import re
+import os
+import filecmp
+import collections
+import StringIO
 
 class PtpException(Exception):
 
@@ -125,12 +129,56 @@ def key_not_in_list(dictionary, lst):
         if key not in lst:
             return key
 
+def memoize(size, copy_result=None):
+    """ Decorator that keeps results of the function for the last 'size'
+        different arguments. Cached results are shared, so mutable results
+        should be copied by 'copy_result' before they are returned. """
+    def decorator(fn):
+        cache = collections.OrderedDict()
+        def wrapper(*args):
+            result = cache.pop(args, cache)
+            if result is cache: # cache is used as a marker of missing value
+                result = fn(*args)
+                if len(cache) >= size:
+                    cache.popitem(last=False)
+            cache[args] = result
+            if copy_result is not None:
+                return copy_result(result)
+            return result
+        wrapper.cache = cache
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+def write_file_if_changed(filename, content):
+    """ Writes the content into the file only when the file has a different
+        content, so make does not rebuild anything from unchanged files """
+    if os.path.isfile(filename) and os.path.getsize(filename) == len(content):
+        with open(filename, "r") as f:
+            if f.read() == content:
+                return
+    with open(filename, "w") as f:
+        f.write(content)
+
+def replace_file_if_changed(new_filename, filename):
+    """ Renames the new file to filename when the content differs,
+        otherwise the new file is removed """
+    if os.path.isfile(filename) and filecmp.cmp(new_filename, filename, shallow=False):
+        os.remove(new_filename)
+    else:
+        os.rename(new_filename, filename)
+
 id_counter = 1000
 def get_unique_id():
     global id_counter
     id_counter += 1
     return id_counter
 
+def reset_unique_id():
+    global id_counter
+    id_counter = 1000
+
 class Makefile:
     """ Simple class for emitting makefile """
 
@@ -172,8 +220,9 @@ class Makefile:
                 out.write("\n")
 
     def write_to_file(self, filename):
-        with open(filename,"w") as f:
-            self.write(f)
+        out = StringIO.StringIO()
+        self.write(out)
+        write_file_if_changed(filename, out.getvalue())
 
 def find_first(lst, fn):
     for i in lst:
@@ -17,6 +17,18 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
+import utils
+
+indents = [ "" ]
+
+def get_indent(level):
+    """ Returns the indentation string of the level,
+        strings are shared by all writers """
+    while len(indents) <= level:
+        indents.append(indents[-1] + "\t")
+    return indents[level]
+
 class Writer(object):
 
     filename = None
@@ -24,21 +36,46 @@ class Writer(object):
     def __init__(self):
         self.lines = []
         self.indent = ""
+        self.indent_level = 0
+        self.stream = None
+        self.line_count = 0
+
+    def open_stream(self, filename=None):
+        """ Switches the writer to the streaming mode. Lines are written
+            into a file instead of being kept in memory; write_to_file
+            finishes the file. """
+        assert not self.lines
+        if filename is not None:
+            self.filename = filename
+        assert self.filename is not None
+        self.stream = open(self.filename + ".tmp", "w", 1 << 16)
 
     def raw_line(self, string):
-        self.lines.append(self.indent + string)
+        if self.stream is not None:
+            self.stream.write(self.indent)
+            self.stream.write(string)
+            self.stream.write("\n")
+            self.line_count += 1
+        else:
+            self.lines.append(self.indent + string)
 
     def emptyline(self):
-        self.lines.append("")
+        if self.stream is not None:
+            self.stream.write("\n")
+            self.line_count += 1
+        else:
+            self.lines.append("")
 
     def line(self, string, *args, **kw):
         self.raw_line(string.format(*args, **kw))
 
     def indent_push(self):
-        self.indent += "\t"
+        self.indent_level += 1
+        self.indent = get_indent(self.indent_level)
 
     def indent_pop(self):
-        self.indent = self.indent[:-1]
+        self.indent_level = max(0, self.indent_level - 1)
+        self.indent = get_indent(self.indent_level)
 
     def add_writer(self, writer):
         writer.write_to_writer(self)
@@ -53,23 +90,49 @@ class Writer(object):
             self.raw_line(line)
 
     def get_string(self):
+        assert self.stream is None, "Streamed writer has no content in memory"
         return "\n".join(self.lines) + "\n"
 
+    def close_stream(self):
+        """ Stops the streaming mode and removes the unfinished file,
+            it is used when the generation fails """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            if os.path.exists(self.filename + ".tmp"):
+                os.remove(self.filename + ".tmp")
+
     def write_to_file(self, filename=None):
+        if self.stream is not None:
+            assert filename is None or filename == self.filename
+            try:
+                self.stream.close()
+                utils.replace_file_if_changed(self.filename + ".tmp", self.filename)
+            finally:
+                self.stream = None
+                if os.path.exists(self.filename + ".tmp"):
+                    os.remove(self.filename + ".tmp")
+            return
+
         if filename is None:
             assert self.filename is not None
             filename = self.filename
 
-        with open(filename, "w") as f:
-            for line in self.lines:
-                f.write(line + "\n")
+        utils.write_file_if_changed(
+            filename, "".join(line + "\n" for line in self.lines))
 
     def write_to_writer(self, writer):
+        assert self.stream is None, "Streamed writer cannot be copied"
+        if writer.stream is None and not writer.indent:
+            writer.lines.extend(self.lines)
+            return
         for line in self.lines:
             writer.raw_line(line)
 
     def get_next_line_number(self):
-        return len(self.lines) + 1
+        return self.get_current_line_number() + 1
 
     def get_current_line_number(self):
+        if self.stream is not None:
+            return self.line_count
         return len(self.lines)
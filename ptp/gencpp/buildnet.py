@@ -963,6 +963,39 @@ def write_reports_method(builder, net):
         builder.line('output.back();')
     builder.write_method_end()
 
+def write_compact_reports_method(builder, net):
+    # Places are written as [id, [token, ...]], where token is its name
+    # or [name, source] when the source is remembered
+    builder.write_method_start("void write_compact_reports_content"
+                                   "(ca::ThreadBase *thread, ca::CompactOutput &output)")
+    builder.line("output.begin_list();")
+    for place in net.places:
+        builder.line("output.begin_list();")
+        builder.line("output.value({0.id});", place)
+        builder.line("output.begin_list();")
+        builder.block_begin()
+
+        builder.line('ca::Token<{1} > *t = place_{0.id}.begin();',
+                     place, place.type)
+        builder.if_begin("t")
+
+        builder.do_begin()
+        if place.need_remember_source():
+            builder.line("output.begin_list();")
+            builder.line("output.value(ca::token_name(t->value));")
+            builder.line("output.value(place_{0.id}.get_source(t));", place)
+            builder.line("output.end_list();")
+        else:
+            builder.line("output.value(ca::token_name(t->value));")
+        builder.line("t = t->next;")
+        builder.do_end("t != place_{0.id}.begin()".format(place))
+        builder.block_end()
+        builder.block_end()
+        builder.line("output.end_list();")
+        builder.line("output.end_list();")
+    builder.line("output.end_list();")
+    builder.write_method_end()
+
 def write_receive_method(builder, net):
     builder.write_method_start(
         "void receive(ca::ThreadBase *$thread, int from_process, "
@@ -1032,6 +1065,7 @@ def write_net_class(builder,
                                "{0}<{1} >".format(cls, place.type))
 
     write_reports_method(builder, net)
+    write_compact_reports_method(builder, net)
     write_receive_method(builder, net)
 
     if write_class_end:
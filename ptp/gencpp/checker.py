@@ -19,13 +19,24 @@
 
 
 import base.tester
+import base.profiler
 import base.utils as utils
 import base.paths as paths
 from base.net import Declarations
 import os.path
 import build
+import hashlib
+import re
+import tempfile
+import shutil
 from copy import copy
 
+# Identifiers generated by base.tester.new_id; they are not a part of keys
+# of cached checks, because they depend on the order of creating checks
+generated_id_pattern = re.compile("____cpptest____\d+")
+
+header_extensions = (".h", ".hh", ".hpp", ".hxx")
+
 class CheckStatement(base.tester.Check):
 
     def __init__(self, expression, decls=None, return_type="void", source=None):
@@ -125,6 +136,51 @@ class TypeChecker:
             tester.add(check)
 
 
+class CheckCache:
+    """ Keys of checks that passed in the last run of the checker;
+        nothing is cached when the filename is None """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.keys = set()
+        if filename is None:
+            return
+        try:
+            with open(filename, "r") as f:
+                self.keys = set(f.read().split())
+        except IOError:
+            pass
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def save(self, keys):
+        """ Writes the cache into a new file that replaces the old one,
+            so readers never see a partially written cache """
+        self.keys = set(keys)
+        if self.filename is None:
+            return
+        try:
+            fd, filename = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.filename)),
+                prefix=os.path.basename(self.filename) + ".")
+        except OSError:
+            return # The cache is only an optimization
+        try:
+            with os.fdopen(fd, "w") as f:
+                for key in self.keys:
+                    f.write(key + "\n")
+            os.rename(filename, self.filename)
+        except (IOError, OSError):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+def get_cache_filename(project, output_directory):
+    """ The cache is stored in the output directory next to generated
+        files, so the directory of the project stays untouched """
+    return os.path.join(output_directory, project.get_name() + ".checks")
+
+
 class Checker:
 
     def __init__(self, project):
@@ -178,14 +234,24 @@ class Checker:
 
         return builder
 
-    def run(self):
+    def run(self, output_directory=None):
+        # Files of checks are written into a private directory,
+        # so more instances of ptp can run at once
+        directory = tempfile.mkdtemp(prefix="kaira-")
+        try:
+            self._run(directory, output_directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _run(self, directory, output_directory):
         builder = build.Builder(self.project,
-            os.path.join("/tmp", self.project.get_name() + ".h"))
+            os.path.join(directory, self.project.get_name() + ".h"))
 
         build.write_header_file(builder)
         builder.write_to_file()
 
         tester = base.tester.Tester()
+        tester.directory = directory
         tester.prepare_writer = self.prepare_writer
         tester.args = [ "-I", os.path.join(paths.KAIRA_ROOT, paths.CAILIE_INCLUDE_DIR),
                         "-I", self.project.root_directory ]
@@ -199,10 +265,17 @@ class Checker:
             tester.args += [ "-I", os.path.join(paths.KAIRA_ROOT, paths.CASIMRUN_INCLUDE_DIR) ]
 
         tester.args += self.project.get_build_option("CFLAGS").split()
-        tester.run()
 
-        if tester.stderr:
-            raise utils.PtpException(tester.stderr)
+        if output_directory is None:
+            cache = CheckCache(None)
+        else:
+            cache = CheckCache(get_cache_filename(self.project, output_directory))
+        context = self.get_context_key(builder, tester)
+        if context not in cache:
+            tester.run()
+
+            if tester.stderr:
+                raise utils.PtpException(tester.stderr)
 
         for t in self.types.values():
             t.add_checks(tester)
@@ -210,6 +283,51 @@ class Checker:
         for check in self.checks:
             tester.add(check)
 
-        check = tester.run()
-        if check is not None:
-            check.throw_exception()
+        keys = [ self.get_check_key(context, check) for check in tester.checks ]
+        tester.checks = [ check for check, key in zip(tester.checks, keys)
+                          if key not in cache ]
+        base.profiler.add("checks", len(keys))
+        base.profiler.add("compiled checks", len(tester.checks))
+        if tester.checks:
+            failed = []
+            sources = set()
+            for check in tester.run_all():
+                # Report only the first error of each source
+                if check.source not in sources:
+                    sources.add(check.source)
+                    failed.append(check)
+            if len(failed) == 1:
+                failed[0].throw_exception()
+            if failed:
+                raise utils.PtpException("\n".join(
+                    str(utils.PtpException(check.message, check.source))
+                    for check in failed))
+            if tester.returncode != 0:
+                # Errors were not assigned to checks, so results are not cached
+                return
+        cache.save([ context ] + keys)
+
+    def get_context_key(self, header_builder, tester):
+        """ Returns a hash of everything that checks depend on
+            except for checks themselves """
+        h = hashlib.sha1()
+        h.update(header_builder.get_string())
+        h.update(self.prepare_writer(None).get_string())
+        h.update(repr(tester.args))
+        # Headers are compared by their contents; generated headers are
+        # rewritten by each build, but their contents usually stay the same
+        directory = self.project.root_directory
+        if directory and os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                if os.path.splitext(filename)[1] in header_extensions:
+                    with open(os.path.join(directory, filename), "rb") as f:
+                        h.update(repr((filename, hashlib.sha1(f.read()).hexdigest())))
+        return h.hexdigest()
+
+    def get_check_key(self, context, check):
+        writer = build.Builder(self.project)
+        check.write(writer)
+        h = hashlib.sha1(context)
+        h.update(generated_id_pattern.sub("@", writer.get_string()))
+        h.update(repr(check.own_message))
+        return h.hexdigest()
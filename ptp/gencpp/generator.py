@@ -62,6 +62,18 @@ class CppGenerator:
         w.line("void transition_fn({0})".format(", ".join(args)))
         return w.get_string()
 
+    def write_source_file(self, filename, write):
+        """ Streams the source written by the function into the file,
+            the unfinished file is removed when the function fails """
+        builder = build.Builder(self.project, filename)
+        builder.open_stream()
+        try:
+            write(builder)
+        except:
+            builder.close_stream()
+            raise
+        builder.write_to_file()
+
     def write_header_file(self, directory):
         builder = build.Builder(self.project, self.get_filename(directory, ".h"))
         build.write_header_file(builder)
@@ -69,16 +81,14 @@ class CppGenerator:
 
     def build(self, directory):
         self.write_header_file(directory)
-        builder = build.Builder(self.project, self.get_filename(directory, ".cpp"))
-        program.write_standalone_program(builder)
-        builder.write_to_file()
+        self.write_source_file(self.get_filename(directory, ".cpp"),
+                               program.write_standalone_program)
         makefiles.write_program_makefile(self.project, directory)
 
     def build_statespace(self, directory):
         self.write_header_file(directory)
-        builder = build.Builder(self.project, self.get_filename(directory, ".cpp"))
-        statespace.write_statespace_program(builder)
-        builder.write_to_file()
+        self.write_source_file(self.get_filename(directory, ".cpp"),
+                               statespace.write_statespace_program)
         makefiles.write_statespace_makefile(self.project, directory)
 
     def build_simrun(self, directory):
@@ -86,9 +96,8 @@ class CppGenerator:
             raise base.utils.PtpException("Communication model is not setted")
 
         self.write_header_file(directory)
-        builder = build.Builder(self.project, self.get_filename(directory, ".cpp"))
-        simrun.write_simrun_program(builder)
-        builder.write_to_file()
+        self.write_source_file(self.get_filename(directory, ".cpp"),
+                               simrun.write_simrun_program)
         makefiles.write_simrun_makefile(self.project, directory)
 
     def build_lib(self, directory):
@@ -143,9 +152,10 @@ class CppGenerator:
         header_filename = self.get_filename(directory, ".h")
 
         # Build .cpp
-        builder = build.Builder(self.project, source_filename)
-        library.write_library(builder, self.project.get_name() + ".h")
-        builder.write_to_file()
+        self.write_source_file(
+            source_filename,
+            lambda builder: library.write_library(builder,
+                                                  self.project.get_name() + ".h"))
 
         # Build .h
         builder = build.Builder(self.project, header_filename)
@@ -99,6 +99,7 @@ def prepare_program_makefile(project, config, directory, other_files=None):
 
     name = project.get_name()
     name_o = name + ".o"
+    name_h = name + ".h"
     name_cpp = name + ".cpp"
 
     deps = [ name_o ] + get_other_dependancies(project, directory)
@@ -111,7 +112,7 @@ def prepare_program_makefile(project, config, directory, other_files=None):
                   deps,
                   "$(CXX) " + " ".join(deps) + " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(LIBS) ")
     makefile.rule(name_o,
-                  [ name_cpp ],
+                  [ name_cpp, name_h ],
                   "$(CXX) $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_o))
     makefile.rule("clean",
                   [],
@@ -138,6 +139,7 @@ def write_simrun_makefile(project, directory):
 
 def write_program_makefile(project, directory):
     name = project.get_name()
+    name_h = name + ".h"
     name_cpp = name + ".cpp"
     name_mpi = name + "_mpi"
     name_mpi_o = name + "_mpi.o"
@@ -151,7 +153,7 @@ def write_program_makefile(project, directory):
 
     makefile.rule(name_mpi, deps_mpi, "$(MPICXX) -D CA_MPI " + " ".join(deps_mpi)
         + " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(MPILIBS)" )
-    makefile.rule(name_mpi_o, [ name_cpp ],
+    makefile.rule(name_mpi_o, [ name_cpp, name_h ],
         "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_mpi_o))
     makefile.write_to_file(os.path.join(directory, "makefile"))
 
@@ -165,6 +167,7 @@ def write_server_makefile(project, directory):
     makefile = prepare_makefile(project, config, directory)
 
     name = project.get_name() + "_server"
+    name_h = project.get_name() + ".h"
     name_cpp = name + ".cpp"
     name_o = name + ".o"
 
@@ -184,10 +187,10 @@ def write_server_makefile(project, directory):
     makefile.rule(name_mpi, deps_mpi, "$(MPICXX) " + " ".join(deps_mpi) +
         " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(MPILIBS)" )
 
-    makefile.rule(name_o, [ name_cpp ],
+    makefile.rule(name_o, [ name_cpp, name_h ],
         "$(CXX) $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_o))
 
-    makefile.rule(name_mpi_o, [ name_cpp ],
+    makefile.rule(name_mpi_o, [ name_cpp, name_h ],
         "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_mpi_o))
 
     makefile.rule("clean", [], "rm -f {0} {0}_mpi {0}_mpi.o {1}".format(name," ".join(deps)))
@@ -208,6 +211,7 @@ def write_library_makefile(project, directory, rpc=False):
 
     name = project.get_name()
     name_o = name + ".o"
+    name_h = name + ".h"
     name_cpp = name + ".cpp"
     name_mpi_o = name + "_mpi.o"
     libname_a = "lib{0}.a".format(name)
@@ -249,8 +253,10 @@ def write_library_makefile(project, directory, rpc=False):
     makefile.rule(libname_a, deps, "ar -cr lib{0}.a ".format(name) + " ".join(deps))
 
     makefile.rule(libname_mpi_a, deps_mpi, "ar -cr lib{0}_mpi.a ".format(name) + " ".join(deps_mpi))
+    # name_o is built by the implicit rule, only the header is added
+    makefile.rule(name_o, [ name_cpp, name_h ])
     makefile.rule(name_mpi_o,
-                  [ name_cpp ],
+                  [ name_cpp, name_h ],
                   "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0} -o {1}"
                     .format(name_cpp, name_mpi_o))
 
@@ -20,6 +20,12 @@
 import pyparsing as pp
 import base.utils as utils
 
+# Expressions are parsed many times during checking and analysis of a project;
+# packrat parsing caches results of subexpressions inside one parse and
+# utils.memoize caches results of whole parses
+pp.ParserElement.enablePackrat()
+cache_size = 10000
+
 # Reserved words of C++ (including C++11)
 reserved_words = set([
     "alignas", "alignof", "and", "and_eq", "asm", "auto",
@@ -96,6 +102,7 @@ init_by_vector = pp.ParseElementEnhance(full_expression).setParseAction(
     lambda t: ("vector", t[0]))
 init_expression = init_by_expressions | init_by_vector
 
+@utils.memoize(cache_size)
 def parse_expression(expr, source, allow_empty):
     if len(expr.strip()) == 0:
         if allow_empty:
@@ -107,6 +114,7 @@ def parse_expression(expr, source, allow_empty):
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
+@utils.memoize(cache_size, set)
 def get_expr_variables(expr):
     if not expr:
         return set()
@@ -114,6 +122,7 @@ def get_expr_variables(expr):
     s.difference_update(reserved_words)
     return s
 
+@utils.memoize(cache_size, lambda result: result.copy())
 def parse_typename(tname, source):
     if len(tname) == 0:
         raise utils.PtpException("Missing type", source)
@@ -122,6 +131,7 @@ def parse_typename(tname, source):
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
+@utils.memoize(cache_size)
 def is_variable(expr):
     if expr is None or expr.strip() in reserved_words:
         return False
@@ -134,6 +144,7 @@ def is_variable(expr):
 def take_substrings(string, pairs):
     return [ string[start:end] for start, end in pairs ]
 
+@utils.memoize(cache_size, list)
 def split_expressions(string, source):
     if string.strip() == "":
         return []
@@ -142,6 +153,7 @@ def split_expressions(string, source):
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
+@utils.memoize(cache_size)
 def parse_init_expression(string, source):
     if string.strip() == "":
         return (None, None)
@@ -150,6 +162,9 @@ def parse_init_expression(string, source):
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
+@utils.memoize(cache_size,
+               lambda results: [ (dict(config), expr, target)
+                                 for config, expr, target in results ])
 def parse_edge_expression(string, source):
     if len(string.strip()) == 0:
         raise utils.PtpException("Missing expression", source)
@@ -1,10 +1,24 @@
 #!/usr/bin/env python
 import sys
+import os
+
+if __name__ == "__main__" and os.environ.get("KAIRA_PTP_SERVER"):
+    # Let a running ptp server do the work; heavy imports are skipped
+    import server
+    code = server.forward(os.environ["KAIRA_PTP_SERVER"], sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+
 import traceback
 import argparse
+import json
 import ConfigParser
+import xml.etree.ElementTree as xml
 
 import base.paths
+import base.profiler
+import base.utils
+import base.tester
 
 config = ConfigParser.RawConfigParser()
 if not config.read(base.paths.KAIRA_CONFIG_INI):
@@ -34,7 +48,22 @@ def get_config(section, name):
 def get_generator_from_xml(element):
     return project.load_project(element, target_envs).get_generator()
 
-def main():
+# Parsed project files; it is used when ptp runs as a server
+xml_cache = {}
+xml_cache_size = 16
+
+def load_project_from_file(filename, build_target):
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    root = xml_cache.get(key)
+    if root is None:
+        root = xml.parse(filename).getroot()
+        if len(xml_cache) >= xml_cache_size:
+            xml_cache.clear()
+        xml_cache[key] = root
+    return project.load_project(root, target_envs, build_target)
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="PTP - ProjectToProgram compiler")
     parser.add_argument("operation",
                         metavar="OPERATION",
@@ -52,32 +81,79 @@ def main():
                         metavar="DIRECTORY",
                         type=str,
                         help="Directory where output files are generated")
-    args = parser.parse_args()
+    parser.add_argument("--profile",
+                        action='store_true',
+                        help="Print time spent in phases of PTP")
+    parser.add_argument("--profile-record",
+                        metavar="FILENAME",
+                        type=str,
+                        help="Write times of phases as JSON ('-' for stdout)")
+    parser.add_argument("--profile-stats",
+                        metavar="FILENAME",
+                        type=str,
+                        help="Write statistics of cProfile")
+    args = parser.parse_args(argv)
 
-    if args.debug:
-        global debug_mode
-        debug_mode = True
+    global debug_mode
+    debug_mode = args.debug
 
     if args.output is None:
         output_directory = "."
     else:
         output_directory = args.output
 
-    p = project.load_project_from_file(args.project, target_envs, args.operation)
-    p.check()
-    p.analyze()
-    generator = p.get_generator()
-
-    if args.operation == "build":
-        generator.build(output_directory)
-    elif args.operation == "statespace":
-        generator.build_statespace(output_directory)
-    elif args.operation == "simrun":
-        generator.build_simrun(output_directory)
-    elif args.operation == "lib":
-        generator.build_lib(output_directory)
-    else:
-        raise PtpException("Unknown operation")
+    profiler = base.profiler.Profiler()
+    if args.profile or args.profile_record:
+        base.profiler.current = profiler
+    if args.profile_stats:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        build(args.project, args.operation, output_directory, profiler)
+    finally:
+        base.profiler.current = None
+        if args.profile_stats:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_stats)
+
+    if args.profile:
+        profiler.write_summary(sys.stdout)
+    if args.profile_record:
+        record = profiler.get_record()
+        record["operation"] = args.operation
+        record["project"] = args.project
+        if args.profile_record == "-":
+            print json.dumps(record)
+        else:
+            with open(args.profile_record, "w") as f:
+                json.dump(record, f, indent=4)
+
+def build(filename, operation, output_directory, profiler):
+    # Generated names do not depend on previous builds in the same process
+    # (a ptp server), so unchanged projects produce the same files
+    base.utils.reset_unique_id()
+    base.tester.reset_id()
+
+    with profiler.phase("load"):
+        p = load_project_from_file(filename, operation)
+    with profiler.phase("check"):
+        p.check(output_directory)
+    with profiler.phase("analyze"):
+        p.analyze()
+
+    with profiler.phase("generate"):
+        generator = p.get_generator()
+        if operation == "build":
+            generator.build(output_directory)
+        elif operation == "statespace":
+            generator.build_statespace(output_directory)
+        elif operation == "simrun":
+            generator.build_simrun(output_directory)
+        elif operation == "lib":
+            generator.build_lib(output_directory)
+        else:
+            raise PtpException("Unknown operation")
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2014 Stanislav Bohm
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Resident ptp. The server keeps ptp modules (the grammar of expressions,
+# config.ini, parsed project files) loaded between builds.
+#
+# Start:  server.py SOCKET
+# Use:    KAIRA_PTP_SERVER=SOCKET ptp.py ...
+#
+# When KAIRA_PTP_SERVER is set, ptp.py sends its arguments to the server
+# and prints the result; it works alone when the server is not running.
+#
+# Protocol: one JSON line with a request {"args": [...], "cwd": ...}
+# and one JSON line with a response {"code": ..., "stdout": ..., "stderr": ...}
+
+import sys
+import os
+import socket
+import json
+import traceback
+import StringIO
+
+def forward(socket_path, args):
+    """ Sends ptp arguments to the server, prints the output and returns
+        the exit code; returns None when the server is not running """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+    except socket.error:
+        s.close()
+        return None
+    try:
+        f = s.makefile("rw")
+        f.write(json.dumps({ "args" : args, "cwd" : os.getcwd() }) + "\n")
+        f.flush()
+        response = json.loads(f.readline())
+    finally:
+        s.close()
+    sys.stdout.write(response["stdout"].encode("utf-8"))
+    sys.stderr.write(response["stderr"].encode("utf-8"))
+    return response["code"]
+
+def run(ptp, args, cwd):
+    """ Runs ptp in this process, returns (exit code, stdout, stderr) """
+    stdout, stderr = sys.stdout, sys.stderr
+    directory = os.getcwd()
+    sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+    try:
+        os.chdir(cwd)
+        ptp.main(args)
+        code = 0
+    except ptp.PtpException, e:
+        print e
+        if ptp.debug_mode:
+            traceback.print_exc(file=sys.stdout)
+        code = 1
+    except SystemExit, e: # Invalid arguments
+        code = e.code
+    except Exception:
+        traceback.print_exc(file=sys.stdout)
+        code = 1
+    finally:
+        out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(directory)
+    return code, out, err
+
+def serve(socket_path):
+    import ptp # Loaded once for all requests
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(socket_path)
+    s.listen(5)
+    try:
+        while True:
+            connection = s.accept()[0]
+            try:
+                f = connection.makefile("rw")
+                request = json.loads(f.readline())
+                code, out, err = run(ptp,
+                                     [ arg.encode("utf-8") for arg in request["args"] ],
+                                     request["cwd"].encode("utf-8"))
+                f.write(json.dumps({ "code" : code,
+                                     "stdout" : out.decode("utf-8", "replace"),
+                                     "stderr" : err.decode("utf-8", "replace") }) + "\n")
+                f.flush()
+            except (socket.error, ValueError):
+                pass # Broken client
+            finally:
+                connection.close()
+    finally:
+        s.close()
+        os.remove(socket_path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print "Usage: server.py SOCKET"
+        sys.exit(1)
+    try:
+        serve(sys.argv[1])
+    except KeyboardInterrupt:
+        pass
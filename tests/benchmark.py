@@ -0,0 +1,202 @@
+
+# Benchmark of ptp phases (load, check, analyze, generate) on synthetic
+# projects.
+#
+# python benchmark.py --places 2000 --transitions 2000 --output result.json
+# python benchmark.py --compare result.json
+#
+# Each repetition is a separate "ptp.py build" of the same project, so all
+# repetitions do the same work (no caches are kept between them, except for
+# checks with --cached-checks) and their minimum and median are reported.
+# Results are stored as JSON, so runs from different commits can be compared.
+
+import sys
+import os
+import time
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import xml.etree.ElementTree as xml
+
+from testutils import KAIRA_ROOT, PTP_BIN
+
+phases = [ "load", "check", "analyze", "generate" ]
+
+
+class ProjectGenerator:
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.id_counter = 100
+
+    def new_id(self):
+        self.id_counter += 1
+        return str(self.id_counter)
+
+    def make_project(self, name, root_directory, nets, places, transitions,
+                     edges, inscriptions):
+        element = xml.Element("project")
+        element.set("name", name)
+        element.set("root-directory", root_directory)
+        element.set("target_env", "C++")
+        configuration = xml.SubElement(element, "configuration")
+        xml.SubElement(configuration, "build-option", name="LIBS")
+        e = xml.SubElement(configuration, "build-option", name="CFLAGS")
+        e.text = "-O0"
+        xml.SubElement(element, "description").text = "<project />"
+        for i in xrange(nets):
+            self.make_net(element, "Net{0}".format(i), places, transitions,
+                          edges, inscriptions)
+        return element
+
+    def make_net(self, parent, name, places, transitions, edges, inscriptions):
+        net = xml.SubElement(parent, "net", id=self.new_id(), name=name)
+        place_ids = []
+        for i in xrange(places):
+            id = self.new_id()
+            xml.SubElement(net, "place", { "id" : id,
+                                           "name" : "",
+                                           "type" : "int",
+                                           "init-expr" : "[0]" if i % 10 == 0 else "" })
+            place_ids.append(id)
+        for i in xrange(transitions):
+            self.make_transition(net, i, place_ids, edges, inscriptions)
+
+    def make_transition(self, net, index, place_ids, edges, inscriptions):
+        tr = xml.SubElement(net, "transition", { "id" : self.new_id(),
+                                                 "name" : "t{0}".format(index),
+                                                 "guard" : "x0_0 >= 0",
+                                                 "priority" : "",
+                                                 "clock" : "False",
+                                                 "collective" : "False" })
+        if index % 4 == 0:
+            xml.SubElement(tr, "code").text = "\tvar.x0_0 += 1;\n"
+
+        count = min(edges, len(place_ids))
+        for j, place_id in enumerate(self.random.sample(place_ids, count)):
+            expr = "; ".join("x{0}_{1}".format(j, k) for k in xrange(inscriptions))
+            xml.SubElement(tr, "edge-in", { "id" : self.new_id(),
+                                            "place-id" : place_id,
+                                            "expr" : expr })
+
+        for j, place_id in enumerate(self.random.sample(place_ids, count)):
+            items = [ "x{0}_{1} + x0_0".format(j, k) for k in xrange(inscriptions) ]
+            items[-1] += "@(ctx.process_id() + 1) % ctx.process_count()"
+            xml.SubElement(tr, "edge-out", { "id" : self.new_id(),
+                                             "place-id" : place_id,
+                                             "expr" : "; ".join(items) })
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(("git", "rev-parse", "HEAD"),
+                                       cwd=KAIRA_ROOT,
+                                       stderr=subprocess.PIPE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_phases(filename, directory, cached_checks):
+    """ Builds the project by ptp in a new process, returns wall times
+        of phases; generated sources are streamed into files
+        (CppGenerator.write_source_file) within the phase "generate" """
+    checks_filename = os.path.join(directory, "benchmark.checks")
+    if not cached_checks and os.path.isfile(checks_filename):
+        os.remove(checks_filename)
+    record_filename = os.path.join(directory, "record.json")
+    subprocess.check_call((sys.executable, PTP_BIN, "build", filename,
+                           "--output", directory,
+                           "--profile-record", record_filename))
+    with open(record_filename) as f:
+        record = json.load(f)
+    return dict((phase["name"], phase["wall"]) for phase in record["phases"])
+
+def count_lines(directory):
+    lines = 0
+    for suffix in (".h", ".cpp"):
+        with open(os.path.join(directory, "benchmark" + suffix)) as f:
+            lines += sum(1 for line in f)
+    return lines
+
+def print_results(results, compare=None):
+    print "{0:<10} {1:>10} {2:>10} {3:>10}".format(
+        "phase", "min [s]", "median [s]", "change")
+    for phase in phases:
+        times = sorted(results["times"][phase])
+        value = times[0]
+        if compare and compare["times"].get(phase):
+            old = min(compare["times"][phase])
+            change = "{0:+.1f}%".format((value - old) / old * 100) if old else "-"
+        else:
+            change = ""
+        print "{0:<10} {1:>10.4f} {2:>10.4f} {3:>10}".format(
+            phase, value, times[len(times) // 2], change)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of ptp phases")
+    parser.add_argument("--nets", type=int, default=1)
+    parser.add_argument("--places", type=int, default=1000,
+                        help="Places in each net")
+    parser.add_argument("--transitions", type=int, default=1000,
+                        help="Transitions in each net")
+    parser.add_argument("--edges", type=int, default=2,
+                        help="Input and output edges of each transition")
+    parser.add_argument("--inscriptions", type=int, default=3,
+                        help="Inscriptions on each edge")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of builds of the project")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cached-checks", action="store_true",
+                        help="Keep results of checks between runs")
+    parser.add_argument("--output", metavar="FILENAME",
+                        help="Store results into JSON file")
+    parser.add_argument("--compare", metavar="FILENAME",
+                        help="Compare with results stored by --output")
+    args = parser.parse_args()
+
+    parameters = dict((name, getattr(args, name))
+                      for name in ("nets", "places", "transitions", "edges",
+                                   "inscriptions", "seed", "cached_checks"))
+
+    compare = None
+    if args.compare:
+        with open(args.compare) as f:
+            compare = json.load(f)
+        if compare["parameters"] != parameters:
+            print "Warning: Parameters differ from the compared results"
+
+    directory = tempfile.mkdtemp(prefix="kaira-benchmark-")
+    try:
+        generator = ProjectGenerator(args.seed)
+        filename = os.path.join(directory, "benchmark.xml")
+        with open(filename, "w") as f:
+            f.write(xml.tostring(generator.make_project(
+                "benchmark", directory, args.nets, args.places, args.transitions,
+                args.edges, args.inscriptions)))
+        times = dict((phase, []) for phase in phases)
+        for i in xrange(args.repeat):
+            result = run_phases(filename, directory, args.cached_checks)
+            for phase in phases:
+                times[phase].append(result[phase])
+        lines = count_lines(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = {
+        "commit" : get_commit(),
+        "date" : time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python" : sys.version.split()[0],
+        "parameters" : parameters,
+        "generated_lines" : lines,
+        "times" : times,
+    }
+
+    print_results(results, compare)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
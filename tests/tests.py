@@ -1,7 +1,178 @@
 # -*- coding: utf-8 -*-
 
-from testutils import Project
+from testutils import Project, RunProgram, KAIRA_GUI, PTP_BIN, PTP_SERVER, CMDUTILS, \
+                      BENCHMARK, TRACELOG_BENCHMARK
 import unittest
+import random
+import sys
+import os
+import time
+import shutil
+import tempfile
+import csv
+import subprocess
+import json
+import socket
+import struct
+import xml.etree.ElementTree as xml
+import StringIO
+import numpy as np
+
+def runinstance_state(runinstance):
+    """ Returns the state of the run instance as comparable values """
+    def items(d):
+        return sorted((key, value) for key, value in d.items() if value)
+    return ([ (process_id,
+               items(net_instance.tokens),
+               items(net_instance.new_tokens),
+               items(net_instance.removed_tokens),
+               net_instance.enabled_transitions)
+              for process_id, net_instance
+              in sorted(runinstance.net_instances.items()) ],
+            [ (activity.__class__, items(vars(activity))) if activity else None
+              for activity in runinstance.activites ],
+            [ [ (packet.time, packet.size, packet.edge_id) for packet in packets ]
+              for packets in runinstance.packets ],
+            runinstance.last_event,
+            runinstance.last_event_process,
+            runinstance.last_event_time)
+
+def import_tracelog():
+    # Gui modules import ptp in the same way as cmdutils
+    sys.path.insert(0, KAIRA_GUI)
+    sys.path.append(os.path.dirname(PTP_BIN))
+
+def build_traced_workers():
+    p = Project("workers", trace=True)
+    p.build()
+    p.run(processes=3, params={ "LIMIT" : "1000", "SIZE" : "20" },
+          extra_args=["-T1M"])
+    return p
+
+class SimulationConnection:
+    """ Connection to a program started in the simulation mode """
+
+    def __init__(self, project, processes=3, read_header=True):
+        self.process = subprocess.Popen(
+            [ project.get_executable(), "-s", "auto", "-b", "-r", str(processes),
+              "-pLIMIT=100", "-pSIZE=20" ],
+            stdout=subprocess.PIPE, cwd=project.get_directory())
+        port = int(self.process.stdout.readline())
+        self.sock = socket.create_connection(("localhost", port))
+        self.stream = self.sock.makefile("r")
+        if read_header:
+            self.header = xml.fromstring(self.stream.readline())
+            for i in xrange(int(self.header.get("description-lines"))):
+                self.stream.readline()
+
+    def command(self, command):
+        self.sock.sendall(command + "\n")
+        return self.stream.readline()
+
+    def command_framed(self, command):
+        self.sock.sendall(command + "\n")
+        size = struct.unpack(">I", self.stream.read(4))[0]
+        return self.stream.read(size)
+
+    def run_command(self, command, callback):
+        # The interface of process.CommandWrapper used by Simulation
+        line = self.command(command)
+        if callback:
+            callback(line)
+
+    def quit(self):
+        self.sock.sendall("QUIT\n")
+        self.process.wait()
+
+def get_report_commands(report):
+    """ Returns commands that can be executed in the state of the report """
+    busy = set(e.get("process-id") for e in report.findall("activation"))
+    commands = [ "FIRE {0} {1} 1".format(t.get("id"), e.get("id"))
+                 for e in report.findall("process") if e.get("id") not in busy
+                 for t in e.findall("enabled") ]
+    commands += [ "FINISH {0}".format(e.get("process-id"))
+                  for e in report.findall("activation") if e.get("blocked") != "true" ]
+    commands += [ "RECEIVE {0} {1}".format(e.get("target-id"), e.get("origin-id"))
+                  for e in report.findall("packet") ]
+    return commands
+
+def get_runinstance_commands(runinstance):
+    """ Returns commands that can be executed in the state of the instance """
+    commands = []
+    for process_id, net_instance in sorted(runinstance.net_instances.items()):
+        activity = runinstance.activites[process_id]
+        if activity is None and net_instance.enabled_transitions:
+            commands += [ "FIRE {0} {1} 1".format(transition_id, process_id)
+                          for transition_id in net_instance.enabled_transitions ]
+        elif activity is not None and not activity.blocked:
+            commands.append("FINISH {0}".format(process_id))
+    # Packets for the process i from the process j are at i * count + j
+    count = runinstance.process_count
+    commands += [ "RECEIVE {0} {1}".format(i // count, i % count)
+                  for i, packets in enumerate(runinstance.packets) if packets ]
+    return commands
+
+def get_process_reports(report):
+    return dict((e.get("id"), xml.tostring(e)) for e in report.findall("process"))
+
+def walk_simulation(simulation, seed):
+    """ Executes random commands until the program ends. Returns executed
+        commands and full reports before each command and at the end. """
+    rnd = random.Random(seed)
+    commands = []
+    reports = []
+    while True:
+        report = xml.fromstring(simulation.command("REPORTS"))
+        reports.append(report)
+        if report.get("quit") == "true":
+            return commands, reports
+        command = rnd.choice(get_report_commands(report))
+        assert simulation.command(command) == "Ok\n"
+        commands.append(command)
+
+def get_report_content(report):
+    # Reports of the same state differ in ids and addresses of bindings
+    report.attrib.pop("id")
+    for e in report.findall("activation"):
+        e.attrib.pop("binding")
+    return xml.tostring(report)
+
+def build_simclient_workers():
+    sys.path.insert(0, KAIRA_GUI)
+    p = Project("workers")
+    p.build()
+    return p
+
+def start_simclient(project, framing, batch_size=1):
+    import simclient
+    client = simclient.SimulationClient()
+    client.use_framing = framing
+    client.batch_size = batch_size
+    client.start(project.get_executable(), 3, { "LIMIT" : "100", "SIZE" : "20" },
+                 cwd=project.get_directory())
+    return client
+
+def report_state(runinstance):
+    # Reports do not contain the last event
+    return runinstance_state(runinstance)[:3]
+
+def walk_simclient(reference, clients, seed):
+    """ Executes the same random commands by all clients until the program
+        ends. Returns states of the reference from full reports, states of
+        other clients after each step and executed commands. """
+    rnd = random.Random(seed)
+    states = []
+    client_states = [ [] for client in clients ]
+    while True:
+        reference.reports_id = None
+        states.append(report_state(reference.query_reports()))
+        for client, s in zip(clients, client_states):
+            s.append(report_state(client.get_runinstance()))
+        if reference.quit_flag:
+            return states, client_states, reference.sequence.commands
+        command = rnd.choice(reference.get_enabled_commands())
+        for client in [ reference ] + clients:
+            assert client.execute(command)
 
 class BuildTest(unittest.TestCase):
 
@@ -40,6 +211,305 @@ class BuildTest(unittest.TestCase):
     def test_broken_edges(self):
         Project("broken_edges", "broken").fail_ptp("*102", prefix=True)
 
+    def test_simclient(self):
+        sys.path.insert(0, KAIRA_GUI)
+        import simclient
+
+        def tokens(runinstance):
+            return [ sorted((place_id, sorted(tokens)) for place_id, tokens
+                            in net_instance.tokens.items())
+                     for net_instance in runinstance.net_instances.values() ]
+
+        params = { "LIMIT" : "100", "SIZE" : "20" }
+        p = Project("workers")
+        p.build()
+        client = simclient.SimulationClient()
+        client.start(p.get_executable(), 3, params, cwd=p.get_directory())
+        rnd = random.Random(0)
+        while not client.is_finished():
+            self.assertTrue(client.execute(rnd.choice(client.get_enabled_commands())))
+        state = tokens(client.get_runinstance())
+        client.quit()
+
+        client2 = simclient.SimulationClient()
+        client2.start(p.get_executable(), 3, params, cwd=p.get_directory())
+        self.assertEquals(None, client2.run_sequence(client.sequence))
+        self.assertEquals(state, tokens(client2.get_runinstance()))
+        self.assertRaises(simclient.SimulationException,
+                          lambda: client2.run_sequence([ "0 T nonexisting" ]))
+        client2.quit()
+
+    def test_simclient_reports(self):
+        p = build_simclient_workers()
+        reference, client = start_simclient(p, False), start_simclient(p, False)
+        states, client_states, commands = walk_simclient(reference, [ client ], 1)
+        self.assertFalse(client.framed)
+        self.assertEquals(states, client_states[0])
+        reference.quit()
+        client.quit()
+
+    def test_simclient_batch(self):
+        p = build_simclient_workers()
+        reference = start_simclient(p, False)
+        states, client_states, commands = walk_simclient(reference, [], 2)
+        reference.quit()
+
+        client = start_simclient(p, True, 7)
+        self.assertEquals(None, client.run_sequence(commands))
+        self.assertEquals(states[-1], report_state(client.get_runinstance()))
+        client.quit()
+
+        # The batch stops at the first failed command
+        # Packets for the process i from the process j are at i * 3 + j
+        packets = states[10][2]
+        failed = [ "{0} R {1}".format(i, j) for i in xrange(3) for j in xrange(3)
+                   if i != j and not packets[i * 3 + j] ][0]
+        client = start_simclient(p, False, 4)
+        self.assertEquals(10, client.run_sequence(commands[:10] + [ failed ]))
+        self.assertEquals(states[10], report_state(client.get_runinstance()))
+        self.assertEquals(commands[:10], client.sequence.commands)
+        client.quit()
+
+    def test_simclient_history(self):
+        p = build_simclient_workers()
+        reference, client = start_simclient(p, False), start_simclient(p, True)
+        client.keep_history = True
+        states, client_states, commands = walk_simclient(reference, [ client ], 3)
+        # Run instances share unchanged parts and they are never modified
+        self.assertEquals(states, [ report_state(runinstance)
+                                    for runinstance in client.history ])
+        self.assertTrue(any(a.net_instances[i] is b.net_instances[i]
+                            for a, b in zip(client.history, client.history[1:])
+                            for i in xrange(3)))
+        reference.quit()
+        client.quit()
+
+    def test_simclient_framing(self):
+        p = build_simclient_workers()
+        reference, client = start_simclient(p, False), start_simclient(p, True)
+        states, client_states, commands = walk_simclient(reference, [ client ], 4)
+        self.assertTrue(client.framed)
+        self.assertEquals(states, client_states[0])
+        reference.quit()
+        client.quit()
+
+    def test_ptp_server(self):
+        p = Project("workers")
+        p.export()
+        directory = tempfile.mkdtemp(prefix="kaira-test-")
+        socket_path = os.path.join(directory, "server")
+        server = subprocess.Popen(["python", PTP_SERVER, socket_path])
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.05)
+            # The second build through the server starts with the same state
+            env = dict(os.environ, KAIRA_PTP_SERVER=socket_path)
+            sources = []
+            for env in (None, env, env):
+                RunProgram(PTP_BIN, [ "build", p.get_xml_filename(),
+                                      "--output", directory ], env=env).run("")
+                with open(os.path.join(directory, "workers.cpp")) as f:
+                    sources.append(f.read())
+            self.assertEquals([ sources[0] ] * 3, sources)
+        finally:
+            server.kill()
+            server.wait()
+            shutil.rmtree(directory)
+
+    def test_ptp_profile(self):
+        p = Project("workers")
+        p.export()
+        args = [ "build", p.get_xml_filename(), "--output", p.get_directory() ]
+        output = RunProgram(PTP_BIN, args + [ "--profile" ]).run()
+        self.assertEquals([ "Phase", "load", "check", "analyze", "generate", "Total" ],
+                          [ line.split()[0] for line in output.splitlines()[:6] ])
+        record = json.loads(RunProgram(PTP_BIN, args + [ "--profile-record", "-" ]).run())
+        self.assertEquals([ "load", "check", "analyze", "generate" ],
+                          [ phase["name"] for phase in record["phases"] ])
+        counters = record["counters"]
+        self.assertTrue(0 <= counters["compiled checks"] <= counters["checks"])
+
+    def test_simulation_reports(self):
+        p = Project("workers")
+        p.build()
+        simulation = SimulationConnection(p)
+        try:
+            rnd = random.Random(0)
+            report = xml.fromstring(simulation.command("REPORTS"))
+            self.assertEquals("false", report.get("delta"))
+            partial = 0
+            while report.get("quit") != "true":
+                command = rnd.choice(get_report_commands(report))
+                self.assertEquals("Ok\n", simulation.command(command))
+                processes = get_process_reports(report)
+                delta = xml.fromstring(
+                    simulation.command("REPORTS " + report.get("id")))
+                report = xml.fromstring(simulation.command("REPORTS"))
+                self.assertEquals(("true", "false"),
+                                  (delta.get("delta"), report.get("delta")))
+
+                # The delta applied to the previous report gives the full report
+                changed = get_process_reports(delta)
+                processes.update(changed)
+                self.assertEquals(get_process_reports(report), processes)
+                self.assertEquals(
+                    [ xml.tostring(e) for e in delta if e.tag != "process" ],
+                    [ xml.tostring(e) for e in report if e.tag != "process" ])
+                if len(changed) < 3:
+                    partial += 1
+            self.assertTrue(partial > 0)
+
+            # An unknown id gives the full report
+            report = xml.fromstring(simulation.command("REPORTS 1"))
+            self.assertEquals("false", report.get("delta"))
+            self.assertEquals(3, len(report.findall("process")))
+        finally:
+            simulation.quit()
+
+    def test_simulation_batch(self):
+        p = Project("workers")
+        p.build()
+        simulation = SimulationConnection(p)
+        try:
+            commands, reports = walk_simulation(simulation, 1)
+        finally:
+            simulation.quit()
+        self.assertTrue(len(commands) > 20)
+
+        def run_batch(commands):
+            simulation = SimulationConnection(p)
+            try:
+                result = simulation.command(
+                    "\n".join([ "BATCH {0}".format(len(commands)) ] + commands))
+                report = xml.fromstring(simulation.command("REPORTS"))
+                return result, get_report_content(report)
+            finally:
+                simulation.quit()
+
+        self.assertEquals(("Ok\n", get_report_content(reports[-1])),
+                          run_batch(commands))
+        # Commands after the first failed command are not executed
+        self.assertEquals(("Failed 10 Invalid transition\n",
+                           get_report_content(reports[10])),
+                          run_batch(commands[:10] + [ "FIRE 1 0 1" ] + commands[10:]))
+
+    def test_simulation_history(self):
+        import_tracelog() # simulation needs the same modules as tracelog
+        import simulation
+
+        p = Project("workers")
+        p.build()
+        connection = SimulationConnection(p, read_header=False)
+        try:
+            s = simulation.Simulation()
+            s.controller = connection
+            s.read_header(connection.stream)
+            rnd = random.Random(2)
+            states = []
+            while True:
+                s.query_reports()
+                states.append(runinstance_state(s.runinstance))
+                if s.state == "finished":
+                    break
+                command = rnd.choice(get_runinstance_commands(s.runinstance))
+                self.assertEquals("Ok\n", connection.command(command))
+        finally:
+            connection.quit()
+
+        # Instances in the history share unchanged parts and they are never
+        # modified
+        history = s.history_instances
+        self.assertEquals(states, [ runinstance_state(runinstance)
+                                    for runinstance in history ])
+        pairs = zip(history, history[1:])
+        self.assertTrue(any(a.net_instances[i] is b.net_instances[i]
+                            for a, b in pairs for i in xrange(3)))
+        self.assertTrue(any(a.net_instances[i] is not b.net_instances[i] and
+                            a.net_instances[i].tokens[place_id] is
+                            b.net_instances[i].tokens.get(place_id)
+                            for a, b in pairs for i in xrange(3)
+                            for place_id in a.net_instances[i].tokens))
+        self.assertTrue(any(a.packets is b.packets for a, b in pairs))
+
+    def test_simulation_framing(self):
+        import_tracelog()
+        import simclient
+
+        def normalize(report):
+            # Ids of reports differ, tuples are lists in JSON
+            report = json.loads(json.dumps(report))
+            del report["id"]
+            return report
+
+        def get_framed_report(keys):
+            # Compact reports contain also attributes not used by parse_xml_report
+            report = json.loads(simulation_framed.command_framed("REPORTS"))
+            return dict((key, report[key]) for key in keys)
+
+        p = Project("workers")
+        p.build()
+        simulation_xml = SimulationConnection(p)
+        simulation_framed = SimulationConnection(p)
+        try:
+            self.assertEquals("binary", simulation_framed.header.get("framing"))
+            self.assertEquals("Ok\n", simulation_framed.command("FRAMING binary"))
+            rnd = random.Random(3)
+            while True:
+                data = simulation_xml.command("REPORTS")
+                xml_report = simclient.parse_xml_report(data)
+                self.assertEquals(normalize(xml_report),
+                                  normalize(get_framed_report(xml_report)))
+                if xml_report["quit"]:
+                    break
+                command = rnd.choice(get_report_commands(xml.fromstring(data)))
+                self.assertEquals("Ok\n", simulation_xml.command(command))
+                self.assertEquals("Ok", simulation_framed.command_framed(command))
+        finally:
+            simulation_xml.quit()
+            simulation_framed.quit()
+
+    def test_check_cache(self):
+        p = Project("workers")
+        p.export()
+        directory = tempfile.mkdtemp(prefix="kaira-test-")
+        try:
+            cache = os.path.join(directory, "workers.checks")
+            args = [ "build", p.get_xml_filename(), "--output", directory, "--profile" ]
+            output = RunProgram(PTP_BIN, args).run()
+            self.assertTrue(os.path.isfile(cache))
+            self.assertFalse(os.path.exists(os.path.join(p.get_directory(), "workers.checks")))
+            self.assertNotIn("compiled checks: 0\n", output)
+            # Headers are compared by contents, not by times
+            for filename in os.listdir(p.get_directory()):
+                if filename.endswith(".h"):
+                    os.utime(os.path.join(p.get_directory(), filename), (0, 0))
+            output = RunProgram(PTP_BIN, args).run()
+            self.assertIn("compiled checks: 0\n", output)
+        finally:
+            shutil.rmtree(directory)
+
+        # Failed checks are not cached
+        p = Project("broken_tracefn", "broken", trace=True)
+        for i in xrange(2):
+            p.fail_ptp("*102/type: Invalid trace function 'int_as_string'\n")
+
+    def test_broken_inscriptions(self):
+        Project("broken_inscriptions", "broken").fail_ptp(
+            "*104/inscription: Invalid type of expression\n"
+            "*106/inscription: Invalid type of expression\n")
+
+    def test_unchanged_sources(self):
+        p = Project("workers")
+        p.build()
+        filenames = [ os.path.join(p.get_directory(), name)
+                      for name in ("workers.cpp", "workers.h", "makefile") ]
+        for filename in filenames:
+            os.utime(filename, (0, 0))
+        p.run_ptp()
+        # Unchanged files are not rewritten, so make has nothing to rebuild
+        self.assertEquals([ 0 ] * len(filenames),
+                          [ os.path.getmtime(filename) for filename in filenames ])
+
     def test_parameters(self):
         Project("parameters").quick_test("7 10 123\n",
                                          processes=10,
@@ -138,6 +608,220 @@ class BuildTest(unittest.TestCase):
         p.quick_test(processes=2, extra_args=["-T100K"])
         p.check_tracelog("14\n")
 
+    def test_tracelog_decode(self):
+        import_tracelog()
+        import tracelog
+
+        p = build_traced_workers()
+        t = tracelog.TraceLog(os.path.join(p.get_directory(), "trace.kth"))
+        events = [ trace.decode_events() for trace in t.traces ]
+        for trace in t.traces:
+            trace.pointer = trace.data_start
+
+        # Decoded events are at the positions where events are processed
+        # one by one
+        runinstance = t.first_runinstance.copy()
+        sends = [ 0 ] * t.process_count
+        event_send = runinstance.event_send
+        def count_send(process_id, *args):
+            sends[process_id] += 1
+            event_send(process_id, *args)
+        runinstance.event_send = count_send
+        positions = [ 0 ] * t.process_count
+        for i in xrange(len(t.full_timeline)):
+            process_id = t.full_timeline[i]["process"]
+            trace = t.traces[process_id]
+            position = positions[process_id]
+            self.assertEquals(trace.pointer, t.full_timeline[i]["pointer"])
+            self.assertEquals(trace.pointer, events[process_id].pointers[position])
+            self.assertEquals(trace.get_next_event_time(),
+                              events[process_id].times[position] + trace.time_offset)
+            trace.process_event(runinstance)
+            positions[process_id] += 1
+        self.assertEquals([ len(e.pointers) for e in events ], positions)
+        self.assertEquals([ len(e.sends) for e in events ], sends)
+        self.assertEquals([ len(trace.data) for trace in t.traces ],
+                          [ trace.pointer for trace in t.traces ])
+        self.assertEquals(runinstance.missed_receives, t.missed_receives)
+
+    def test_tracelog_replay(self):
+        import_tracelog()
+        import tracelog
+
+        p = build_traced_workers()
+        filename = os.path.join(p.get_directory(), "trace.kth")
+        t = tracelog.TraceLog(filename, use_cache=False, checkpoint_interval=7)
+        count = t.get_runinstances_count()
+        self.assertTrue(count > 50)
+        times = [ t.get_event_time(i) for i in xrange(count) ]
+        self.assertEquals(sorted(times), times)
+
+        # States of a plain replay of all events one by one
+        runinstance = t.first_runinstance.copy()
+        states = [ runinstance_state(runinstance) ]
+        for i in xrange(count - 1):
+            t.execute_visible_events(runinstance, i, i + 1)
+            states.append(runinstance_state(runinstance))
+
+        rnd = random.Random(0)
+        indexes = [ rnd.randrange(count) for i in xrange(100) ]
+        for index in indexes + indexes[:10]:
+            self.assertEquals(states[index],
+                              runinstance_state(t.get_event_runinstance(index)))
+
+        # Short steps forward and backward and long jumps
+        replay = tracelog.Replay(t, undo_limit=10)
+        index = 0
+        for i in xrange(300):
+            index = min(count - 1, max(0, index + rnd.choice([ -20, -3, -1, 1, 2, 15 ])))
+            if i % 50 == 0:
+                index = rnd.randrange(count)
+            self.assertEquals(states[index], runinstance_state(replay.set_index(index)))
+
+    def test_tracelog_cache(self):
+        import_tracelog()
+        import tracelog
+
+        p = build_traced_workers()
+        filename = os.path.join(p.get_directory(), "trace.kth")
+        cache = os.path.join(p.get_directory(), "trace-cache.npz")
+        if os.path.exists(cache):
+            os.remove(cache)
+        t = tracelog.TraceLog(filename, use_cache=False, decode_processes=1)
+        # The traces are small, the pool is forced to be used
+        parallel_decode_size = tracelog.TraceLog.parallel_decode_size
+        tracelog.TraceLog.parallel_decode_size = 0
+        try:
+            t2 = tracelog.TraceLog(filename, use_cache=True, decode_processes=2)
+        finally:
+            tracelog.TraceLog.parallel_decode_size = parallel_decode_size
+        self.assertTrue(os.path.isfile(cache))
+        t3 = tracelog.TraceLog(filename, use_cache=True)
+        # The cache is loaded without decoding of traces
+        self.assertEquals([ None ] * t3.process_count,
+                          [ trace.events for trace in t3.traces ])
+
+        for other in (t2, t3):
+            self.assertEquals(t.full_timeline.data.tolist(),
+                              other.full_timeline.data.tolist())
+            self.assertEquals(t.timeline.data.tolist(), other.timeline.data.tolist())
+            self.assertEquals(t.missed_receives, other.missed_receives)
+            index = t.get_runinstances_count() - 1
+            self.assertEquals(runinstance_state(t.get_event_runinstance(index)),
+                              runinstance_state(other.get_event_runinstance(index)))
+
+    def test_tracelog_benchmark(self):
+        p = build_traced_workers()
+        output = RunProgram("python", [ TRACELOG_BENCHMARK,
+                                        os.path.join(p.get_directory(), "trace.kth"),
+                                        "--processes", "2",
+                                        "--repeat", "1" ]).run()
+        self.assertIn("traces: 3 ", output)
+        self.assertIn("speedup: ", output)
+
+    def test_tracelog_export(self):
+        sys.path.insert(0, KAIRA_GUI)
+        import tablewriter
+
+        p = build_traced_workers()
+        filename = os.path.join(p.get_directory(), "trace.kth")
+        outputs = {}
+        for format in ("csv", "binary"):
+            outputs[format] = os.path.join(p.get_directory(), "trace." + format)
+            RunProgram("python", [ CMDUTILS, "--export-tracelog", filename,
+                                   "--tracelog-output", outputs[format],
+                                   "--format", format ]).run("")
+        with open(outputs["binary"], "rb") as f:
+            chunks = list(tablewriter.read_binary(f))
+        self.assertTrue(sum(len(chunk) for chunk in chunks) > 0)
+
+        # The binary table written as CSV has to be the same as the CSV export
+        output = StringIO.StringIO()
+        writer = tablewriter.CsvWriter(output)
+        writer.start(chunks[0].dtype.descr)
+        for chunk in chunks:
+            writer.write_chunk(chunk)
+        with open(outputs["csv"], "rb") as f:
+            self.assertEquals(f.read(), output.getvalue())
+
+    def test_simrun_campaign(self):
+        p = Project("simcampaign", simrun=True)
+        p.build("simrun")
+
+        # The wrapper leaves a truncated trace for TRUNCATE=1,
+        # the run fails but the campaign goes on
+        wrapper = os.path.join(p.get_directory(), "wrapper.sh")
+        with open(wrapper, "w") as f:
+            f.write("#!/bin/sh\n"
+                    "for a; do shift; case \"$a\" in -pTRUNCATE=1) t=1;; "
+                    "-pTRUNCATE=*) ;; *) set -- \"$@\" \"$a\";; esac; done\n"
+                    "{0} \"$@\" || exit 1\n"
+                    "[ -z \"$t\" ] || : > trace-0-0.ktt\n".format(p.get_executable()))
+        os.chmod(wrapper, 0755)
+
+        output = RunProgram("python", [ CMDUTILS, "--simrun-campaign", wrapper,
+                                        "--processes", "2,3",
+                                        "--param", "LIMIT=100",
+                                        "--param", "SIZE=10,20",
+                                        "--param", "TRUNCATE=0,1" ]).run()
+        rows = list(csv.DictReader(output.splitlines()))
+        self.assertEquals([ (r["Processes"], r["SIZE"], r["TRUNCATE"]) for r in rows ],
+                          [ (processes, size, truncate)
+                            for processes in ("2", "3")
+                            for size in ("10", "20")
+                            for truncate in ("0", "1") ])
+        for row in rows:
+            if row["TRUNCATE"] == "1":
+                self.assertEquals("", row["Makespan"])
+            else:
+                self.assertTrue(int(row["Makespan"]) > 0)
+                self.assertTrue(0 < float(row["Utilization"]) <= 1)
+                self.assertTrue(int(row["Messages"]) > 0)
+                self.assertTrue(int(row["Message volume"]) > 0)
+
+    def test_tracelog_merge(self):
+        import_tracelog()
+        import tracelog
+
+        class Events:
+            def __init__(self, times):
+                self.times = times
+
+        p = build_traced_workers()
+        t = tracelog.TraceLog(os.path.join(p.get_directory(), "trace.kth"))
+        times = [ trace.decode_events().times for trace in t.traces ]
+        # The second variant has traces where time goes backward
+        for events in ([ Events(x) for x in times ],
+                       [ Events(x[::-1].copy()) for x in times ]):
+            positions = [ 0 ] * t.process_count
+            expected = []
+            while True:
+                heads = [ (e.times[i] + trace.time_offset, process_id)
+                          for process_id, (e, i, trace)
+                          in enumerate(zip(events, positions, t.traces))
+                          if i < len(e.times) ]
+                if not heads:
+                    break
+                process_id = min(heads)[1]
+                expected.append((process_id, positions[process_id]))
+                positions[process_id] += 1
+            processes, indexes = t._merge_timelines(events)
+            self.assertEquals(expected, zip(processes.tolist(), indexes.tolist()))
+
+    def test_tracelog_map_file(self):
+        import_tracelog()
+        import tracelog
+
+        directory = tempfile.mkdtemp(prefix="kaira-test-")
+        try:
+            filename = os.path.join(directory, "trace-0-0.ktt")
+            for data in ("", "T\x00\x01" * 5000):
+                with open(filename, "wb") as f:
+                    f.write(data)
+                self.assertEquals(data, tracelog.map_file(filename)[:])
+        finally:
+            shutil.rmtree(directory)
+
     def test_scatter1(self):
         Project("scatter1").quick_test("1941\n", processes=5)
 
@@ -177,5 +861,242 @@ class LibTest(unittest.TestCase):
         finally:
             p.stop_server()
 
+class PtpTest(unittest.TestCase):
+
+    def setUp(self):
+        sys.path.insert(0, os.path.dirname(PTP_BIN))
+
+    def test_memoize(self):
+        import base.utils as utils
+        import gencpp.parser as parser
+
+        calls = []
+        @utils.memoize(2, list)
+        def f(x):
+            calls.append(x)
+            return [ x ]
+        for x in (1, 2, 1, 3, 2, 1):
+            self.assertEquals([ x ], f(x))
+        self.assertEquals([ 1, 2, 3, 2, 1 ], calls)
+        f(1).append(10) # results are copied
+        self.assertEquals([ 1 ], f(1))
+
+        variables = parser.get_expr_variables("x + y * f(z)")
+        variables.add("w")
+        self.assertEquals(set([ "x", "y", "z" ]),
+                          parser.get_expr_variables("x + y * f(z)"))
+        self.assertRaises(utils.PtpException,
+                          lambda: parser.parse_expression("x +", "*1", False))
+        self.assertNotIn(("x +", "*1", False), parser.parse_expression.cache)
+
+    def test_tester_shards(self):
+        from base.tester import Tester, Check
+        from base.writer import Writer
+
+        class ExpressionCheck(Check):
+            def __init__(self, expression):
+                self.expression = expression
+            def write_content(self, writer):
+                writer.line("int {0}() {{ return {1}; }}",
+                            self.new_id(), self.expression)
+
+        tester = Tester()
+        tester.prepare_writer = lambda filename: Writer()
+        for expression in ("1", "x", "2", "3", "y + 1", "4", "5"):
+            tester.add(ExpressionCheck(expression))
+        for shards, jobs in ((1, None), (2, None), (4, 1), (4, 2)):
+            self.assertEquals([ "x", "y + 1" ],
+                              [ check.expression
+                                for check in tester.run_all(shards, jobs) ])
+
+    def test_stream_writer(self):
+        from base.writer import Writer
+
+        def write(writer):
+            writer.line("int main() {{ // {0}", writer.get_next_line_number())
+            writer.indent_push()
+            part = Writer()
+            part.line("return {0};", 0)
+            writer.add_writer(part)
+            writer.indent_pop()
+            writer.raw_text("}\n\n")
+            writer.emptyline()
+
+        directory = tempfile.mkdtemp(prefix="kaira-test-")
+        try:
+            filename = os.path.join(directory, "main.cpp")
+            writer = Writer()
+            write(writer)
+            content = writer.get_string()
+
+            writer = Writer()
+            writer.open_stream(filename)
+            write(writer)
+            writer.write_to_file()
+            with open(filename) as f:
+                self.assertEquals(content, f.read())
+
+            # Unfinished files are removed, unchanged files are kept
+            os.utime(filename, (0, 0))
+            writer = Writer()
+            writer.open_stream(filename)
+            writer.line("broken")
+            writer.close_stream()
+            writer = Writer()
+            writer.open_stream(filename)
+            write(writer)
+            writer.write_to_file()
+            self.assertEquals([ "main.cpp" ], os.listdir(directory))
+            self.assertEquals(0, os.path.getmtime(filename))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_benchmark(self):
+        directory = tempfile.mkdtemp(prefix="kaira-test-")
+        try:
+            filename = os.path.join(directory, "results.json")
+            args = [ BENCHMARK, "--places", "20", "--transitions", "20",
+                     "--repeat", "2" ]
+            RunProgram("python", args + [ "--output", filename ]).run()
+            with open(filename) as f:
+                times = json.load(f)["times"]
+            self.assertEquals([ "analyze", "check", "generate", "load" ],
+                              sorted(times))
+            self.assertEquals([ 2 ] * 4, [ len(t) for t in times.values() ])
+            output = RunProgram("python", args + [ "--compare", filename ]).run()
+            self.assertIn("%\n", output)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TableTest(unittest.TestCase):
+
+    columns = [ ("Event", "|S1"), ("Process", "<i4"), ("Time", "<u8") ]
+
+    def create_table(self, rows):
+        sys.path.insert(0, KAIRA_GUI)
+        from table import Table
+        t = Table(self.columns, 2)
+        t.max_chunk_size = 8
+        for i, row in enumerate(rows):
+            t.add_row(row)
+            if i % 13 == 0:
+                self.assertEquals(i + 1, len(t.data)) # concatenates chunks
+        return t
+
+    def test_chunks(self):
+        rnd = random.Random(0)
+        rows = [ [ rnd.choice("TRS"), rnd.choice([ 0, 1, None ]), i ]
+                 for i in xrange(100) ]
+        t = self.create_table(rows[:50])
+        t.add_rows(rows[50:60])
+        t.add_row(rows[60])
+        t.extend({ "Event" : [ row[0] for row in rows[61:] ],
+                   "Process" : np.ma.masked_equal([ -1 if row[1] is None else row[1]
+                                                    for row in rows[61:] ], -1),
+                   "Time" : [ row[2] for row in rows[61:] ] })
+        self.assertEquals(100, len(t))
+        self.assertEquals(rows, list(t))
+        self.assertTrue(t.data is t.data) # created once
+        self.assertEquals(rows, [ [ None if masked else value
+                                    for value, masked in zip(*row) ]
+                                  for row in zip(t.data.data.tolist(),
+                                                 np.ma.getmaskarray(t.data).tolist()) ])
+        t.trim()
+        self.assertEquals(1, len(t.chunks))
+        self.assertEquals(rows, list(t))
+
+    def test_group_by(self):
+        rnd = random.Random(1)
+        rows = [ [ rnd.choice("TR"), rnd.choice([ 0, 1, 2, None ]), i ]
+                 for i in xrange(200) ]
+        t = self.create_table(rows)
+        f_eq = lambda x, y: x == y
+        filters = [ ("Event", f_eq, "T") ]
+
+        t.add_row(rows[0])
+        rows.append(rows[0])
+        # Groups are read from columns
+        groups = t.group_by("Process", "Time", filters)
+        self.assertTrue(t._data is None)
+        self.assertEquals([ 0, 1, 2 ], sorted(groups))
+        for process_id in xrange(4):
+            self.assertEquals(
+                t.select("Time", filters + [ ("Process", f_eq, process_id) ]).tolist(),
+                groups[process_id].tolist())
+
+        groups = t.group_by([ "Event", "Process" ])
+        self.assertEquals(sum(len(group) for group in groups.values()),
+                          len([ row for row in rows if row[1] is not None ]))
+        for (event, process_id), group in groups.items():
+            self.assertEquals([ row for row in rows
+                                if row[0] == event and row[1] == process_id ],
+                              [ list(row) for row in group.tolist() ])
+
+class LineReaderTest(unittest.TestCase):
+
+    def create_reader(self):
+        sys.path.insert(0, KAIRA_GUI)
+        import process
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        lines = []
+        reader = process.LineReader(read_fd)
+        # Each dispatch is stored as one list
+        reader.on_lines = lambda batch, stream: lines.append(list(batch)) or True
+        reader.on_exit = lambda: lines.append(None)
+        return reader, write_fd, lines
+
+    def test_lines(self):
+        reader, fd, lines = self.create_reader()
+        os.write(fd, "first\nsec")
+        self.assertEquals("first\n", reader.readline())
+        # All complete lines of a read chunk are dispatched at once,
+        # the rest waits for the end of the line
+        os.write(fd, "ond\nthird\nfou")
+        self.assertTrue(reader._on_ready(reader.fd, None))
+        self.assertEquals([ [ "second\n", "third\n" ] ], lines)
+        os.write(fd, "rth")
+        self.assertTrue(reader._on_ready(reader.fd, None))
+        self.assertEquals([ [ "second\n", "third\n" ] ], lines)
+        os.close(fd)
+        self.assertFalse(reader._on_ready(reader.fd, None))
+        self.assertEquals([ [ "second\n", "third\n" ], [ "fourth" ], None ], lines)
+
+    def test_readline_in_dispatch(self):
+        reader, fd, lines = self.create_reader()
+        def on_lines(batch, stream):
+            lines.append(batch.popleft())
+            lines.append(stream.readline())
+            return True
+        reader.on_lines = on_lines
+        os.write(fd, "a\nb\nc")
+        self.assertTrue(reader._on_ready(reader.fd, None))
+        self.assertEquals([ "a\n", "b\n" ], lines)
+        # A line that is not read yet is read from the pipe
+        os.write(fd, "\nd\ne")
+        self.assertTrue(reader._on_ready(reader.fd, None))
+        self.assertEquals([ "a\n", "b\n", "c\n", "d\n" ], lines)
+
+    def test_frames(self):
+        def frame(data):
+            return struct.pack(">I", len(data)) + data
+
+        reader, fd, lines = self.create_reader()
+        data = frame("abc") + frame("de\nf") + frame("")
+        os.write(fd, "Ok\n" + data[:2])
+        self.assertEquals("Ok\n", reader.readline())
+        reader.read_frames()
+        # Frames split between reads are dispatched when they are complete
+        for part in (data[2:9], data[9:10], data[10:]):
+            os.write(fd, part)
+            self.assertTrue(reader._on_ready(reader.fd, None))
+        self.assertEquals([ [ "abc\n" ], [ "de\nf\n", "\n" ] ], lines)
+        os.write(fd, frame("g")[:3])
+        os.close(fd)
+        reader._on_ready(reader.fd, None)
+        self.assertFalse(reader._on_ready(reader.fd, None))
+        self.assertEquals(None, lines[-1])
+
 if __name__ == '__main__':
     unittest.main()
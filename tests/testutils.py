@@ -9,8 +9,11 @@ KAIRA_GUI = os.path.join(KAIRA_ROOT,"gui")
 KAIRA_TOOLS = os.path.join(KAIRA_ROOT,"tools")
 
 PTP_BIN = os.path.join(KAIRA_ROOT, "ptp", "ptp.py")
+PTP_SERVER = os.path.join(KAIRA_ROOT, "ptp", "server.py")
 CAILIE_DIR = os.path.join(KAIRA_ROOT, "lib")
 CMDUTILS = os.path.join(KAIRA_GUI, "cmdutils.py")
+BENCHMARK = os.path.join(KAIRA_TESTS, "benchmark.py")
+TRACELOG_BENCHMARK = os.path.join(KAIRA_TESTS, "tracelog_benchmark.py")
 
 TEST_PROJECTS = os.path.join(KAIRA_TESTS, "projects")
 
@@ -68,7 +71,8 @@ class Project:
 
     server = None
 
-    def __init__(self, name, directory_name=None, mpi=False, rpc=False, trace=False, lib=False):
+    def __init__(self, name, directory_name=None, mpi=False, rpc=False, trace=False, lib=False,
+                 simrun=False):
         self.name = name
         if directory_name is None:
             self.directory_name = name
@@ -79,6 +83,7 @@ class Project:
         self.rpc = rpc
         self.trace = trace
         self.lib = lib
+        self.simrun = simrun
 
         self.clean()
 
@@ -114,6 +119,8 @@ class Project:
             args.append("--trace")
         if self.lib:
             args.append("--lib")
+        if self.simrun:
+            args.append("--simrun")
         RunProgram("python", args).run()
 
     def run_ptp(self, operation=None):
@@ -0,0 +1,60 @@
+
+# Benchmark of decoding of traces in one process and in a pool of processes.
+#
+# python tracelog_benchmark.py trace.kth --processes 4 --repeat 5
+#
+# Each configuration decodes all traces of the tracelog 'repeat' times,
+# the minimal time is reported. The pool is used regardless of
+# the size of traces (TraceLog.parallel_decode_size is ignored).
+
+import sys
+import os
+import time
+import argparse
+import multiprocessing
+
+from testutils import KAIRA_GUI, PTP_BIN
+
+sys.path.insert(0, KAIRA_GUI)
+sys.path.append(os.path.dirname(PTP_BIN))
+
+import tracelog
+
+
+def measure(log, processes, repeat):
+    times = []
+    log.decode_processes = processes
+    for i in xrange(repeat):
+        for trace in log.traces:
+            trace.events = None
+        start = time.time()
+        log._decode_traces()
+        times.append(time.time() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of decoding of traces")
+    parser.add_argument("filename", metavar="FILENAME", help="Tracelog (.kth)")
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="Processes of the pool (default: the number of CPUs)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    log = tracelog.TraceLog(args.filename, use_cache=False, decode_processes=1)
+    log.parallel_decode_size = 0
+    size = sum(len(trace.data) for trace in log.traces)
+    events = sum(len(trace.events) for trace in log.traces)
+
+    sequential = measure(log, 1, args.repeat)
+    parallel = measure(log, args.processes, args.repeat)
+
+    print "traces: {0} ({1} bytes, {2} events), CPUs: {3}".format(
+        len(log.traces), size, events, multiprocessing.cpu_count())
+    print "{0:<12} {1:>10}".format("processes", "min [s]")
+    print "{0:<12} {1:>10.4f}".format(1, sequential)
+    print "{0:<12} {1:>10.4f}".format(args.processes, parallel)
+    print "speedup: {0:.2f}x".format(sequential / parallel)
+
+if __name__ == "__main__":
+    main()